@@ -0,0 +1,64 @@
+import atexit
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List
+
+# The datasets and configuration of the benchmark live in a throwaway home, never in the user's one
+os.environ["HOME"] = os.environ["USERPROFILE"] = tempfile.mkdtemp(prefix="dot-handler-bench-home-")
+atexit.register(shutil.rmtree, os.environ["HOME"], ignore_errors=True)
+
+from typer import Argument
+from typer import BadParameter
+from typer import Option
+from typer import Typer
+from typer import echo
+
+from benchmarks import runner
+
+app = Typer(add_help_option=True)
+
+
+@app.command()
+def run(scales: List[str] = Option(["small", "medium"], "-s", "--scale",
+                                   help=f"Corpus scales to run: {', '.join(runner.SCALES)}", show_default=True),
+        repeat: int = Option(3, "-r", "--repeat", min=1, help="Runs of every phase", show_default=True),
+        jobs: int = Option(1, "-j", "--jobs", min=0, help="Number of processes scanning files", show_default=True),
+        output_path: Path = Option(None, "-o", "--output", help="JSON file to save the results")):
+    for scale in scales:
+        if scale not in runner.SCALES:
+            raise BadParameter(f"Unknown scale '{scale}', use one of: {', '.join(runner.SCALES)}")
+
+    results = runner.run(scales, repeat, jobs)
+    for result in results["results"]:
+        echo(f"🗝️ {result['scale']}: {result['corpus']['files']} files, {result['corpus']['bytes']} bytes, "
+             f"{result['corpus']['definitions']} definitions, {result['corpus']['usages']} usages")
+        for phase, timing in result["phases"].items():
+            echo(f"    📄 {phase:<18} {timing['min'] * 1000:10.1f} ms (median {timing['median'] * 1000:.1f} ms)")
+
+    if output_path is not None:
+        runner.save(results, output_path)
+        echo(f"[INFO] 💾 Results saved to {output_path}")
+
+
+@app.command()
+def compare(baseline_path: Path = Argument(..., exists=True, readable=True, help="Results of the reference run"),
+            current_path: Path = Argument(..., exists=True, readable=True, help="Results of the run to check"),
+            threshold: float = Option(0.1, "-t", "--threshold", min=0.0,
+                                      help="Slowdown ratio flagged as a regression", show_default=True)):
+    rows = runner.compare(runner.load(baseline_path), runner.load(current_path), threshold)
+    for row in rows:
+        flag = "❌" if row["regression"] else "✅"
+        echo(f"{flag} {row['scale']:<8} {row['phase']:<18} {row['baseline'] * 1000:10.1f} ms -> "
+             f"{row['current'] * 1000:10.1f} ms ({row['ratio']:.2f}x)")
+
+    if any(row["regression"] for row in rows):
+        echo(f"[ERROR] ❌ {sum(row['regression'] for row in rows)} phases regressed more than {threshold:.0%}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    # python -m benchmarks run -s small -s medium -o results.json
+    # python -m benchmarks compare baseline.json results.json
+    app()
@@ -0,0 +1,73 @@
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    """
+    Shape of a synthetic SQL tree: every file defines `views_per_file` views, and every view references
+    `refs_per_view` views defined anywhere in the tree.
+    """
+    files: int = 100
+    views_per_file: int = 5
+    refs_per_view: int = 5
+    file_size: int = 0  # Minimum size of every file in bytes, reached with filler statements
+    qualified_ratio: float = 0.5  # Ratio of schema-qualified names, in definitions and references
+    comment_ratio: float = 0.2  # Ratio of references written in a comment
+    schemas: int = 4
+    seed: int = 42
+
+
+def view_name(schema: int, file: int, view: int) -> tuple[str, str]:
+    return f"sch_{schema}", f"v_{file}_{view}"
+
+
+def generate_corpus(root: Path, spec: CorpusSpec) -> dict:
+    """
+    Writes the SQL files of the given spec under `root`, the same spec always generates the same tree.
+
+    :return: a summary of the corpus: files, bytes, views and references
+    """
+    rng = random.Random(spec.seed)
+    root.mkdir(parents=True, exist_ok=True)
+
+    # Every view of the tree, so references can point to any of them
+    views = [(rng.randrange(spec.schemas), file, view)
+             for file in range(spec.files) for view in range(spec.views_per_file)]
+
+    total_bytes = 0
+    references = 0
+    for file in range(spec.files):
+        lines = [f"-- Synthetic migration script {file}"]
+        for schema, _, view in views[file * spec.views_per_file:(file + 1) * spec.views_per_file]:
+            schema_name, name = view_name(schema, file, view)
+            definition = f"{schema_name}.{name}" if rng.random() < spec.qualified_ratio else name
+            lines.append(f"CREATE OR REPLACE VIEW {definition} AS")
+            lines.append("  SELECT t.id, t.value")
+            lines.append("    FROM base_table t")
+
+            for _ in range(spec.refs_per_view):
+                ref_schema, ref_file, ref_view = rng.choice(views)
+                ref_schema_name, ref_name = view_name(ref_schema, ref_file, ref_view)
+                reference = f"{ref_schema_name}.{ref_name}" if rng.random() < spec.qualified_ratio else ref_name
+                if rng.random() < spec.comment_ratio:
+                    lines.append(f"    -- JOIN {reference} r ON r.id = t.id")
+                else:
+                    lines.append(f"    JOIN {reference} r{references} ON r{references}.id = t.id")
+                references += 1
+            lines.append("   WHERE t.value IS NOT NULL;")
+            lines.append("")
+
+        data = "\n".join(lines) + "\n"
+        filler = 0
+        while len(data) < spec.file_size:
+            data += f"INSERT INTO audit_log (id, message) VALUES ({filler}, 'filler statement {filler}');\n"
+            filler += 1
+
+        src_file = root / f"d{file % 10}" / f"script_{file}.sql"
+        src_file.parent.mkdir(parents=True, exist_ok=True)
+        src_file.write_text(data)
+        total_bytes += len(data)
+
+    return {"files": spec.files, "bytes": total_bytes, "views": len(views), "references": references}
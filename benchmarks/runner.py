@@ -0,0 +1,151 @@
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator
+
+from benchmarks.corpus import CorpusSpec, generate_corpus
+from engine import configuration
+from engine import output
+from engine import storage
+from engine.finder import find_dot_definition_from_file, store_dot_definitions
+from engine.lookup import lookup_dot_usages_from_files, store_dot_usages
+from engine.utils import DDLObjectTypeSupported
+
+SCALES = {
+    "small": CorpusSpec(files=50, views_per_file=5, refs_per_view=5),
+    "medium": CorpusSpec(files=500, views_per_file=5, refs_per_view=10, file_size=8 << 10),
+    "large": CorpusSpec(files=2000, views_per_file=10, refs_per_view=10, file_size=32 << 10),
+}
+
+DATASET = "benchmark"
+
+
+@contextmanager
+def isolated_storage(folder: Path) -> Iterator[Path]:
+    # The datasets and the configuration of the benchmark live in `folder`, never in the user's ones, whoever runs it
+    saved = configuration.STORAGE_MAIN_DIR, storage.STORAGE_MAIN_DIR, configuration._settings
+    configuration.STORAGE_MAIN_DIR = storage.STORAGE_MAIN_DIR = folder
+    configuration._settings = None
+    try:
+        yield folder
+    finally:
+        configuration.STORAGE_MAIN_DIR, storage.STORAGE_MAIN_DIR, configuration._settings = saved
+
+
+def _timed(func: Callable, repeat: int) -> tuple[dict, object]:
+    # Keeps the result of the last run, every run does the same work
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return {"min": min(timings), "median": statistics.median(timings), "runs": timings}, result
+
+
+def run_scale(name: str, spec: CorpusSpec, work_dir: Path, repeat: int = 3, jobs: int = 1) -> dict:
+    dots = DDLObjectTypeSupported.views
+    src_input_path = work_dir / name
+    corpus = generate_corpus(src_input_path, spec)
+    src_filepaths = sorted(src_input_path.rglob("*.sql"))
+    with isolated_storage(work_dir / f"{name}.storage"):
+        phases, table, usages = _run_phases(dots, src_filepaths, repeat, jobs)
+
+    # Rates are taken from the best run, the least disturbed one
+    for phase in ("find", "lookup"):
+        best = phases[phase]["min"]
+        phases[phase]["files_per_s"] = corpus["files"] / best if best > 0 else 0.0
+        phases[phase]["bytes_per_s"] = corpus["bytes"] / best if best > 0 else 0.0
+
+    return {"scale": name, "spec": spec.__dict__, "corpus": {**corpus, "definitions": len(table), "usages": usages},
+            "phases": phases}
+
+
+def _run_phases(dots: DDLObjectTypeSupported, src_filepaths: list[Path], repeat: int,
+                jobs: int) -> tuple[dict, list[str], int]:
+    storage.rm(DATASET)
+    phases = {}
+    phases["find"], dot_table = _timed(lambda: find_dot_definition_from_file(dots, src_filepaths, jobs), repeat)
+
+    def save_definitions():
+        with storage.DatasetSession(DATASET) as session:
+            store_dot_definitions(session, dots, dot_table)
+    phases["store_definitions"], _ = _timed(save_definitions, repeat)
+
+    def load_definitions():
+        with storage.DatasetSession(DATASET) as session:
+            return session.definition_keys(dots)
+    phases["load_definitions"], table = _timed(load_definitions, repeat)
+
+    phases["lookup"], records = _timed(lambda: lookup_dot_usages_from_files(dots, table, src_filepaths, jobs), repeat)
+
+    def save_usages():
+        with storage.DatasetSession(DATASET) as session:
+            store_dot_usages(session, dots, records)
+    phases["store_usages"], _ = _timed(save_usages, repeat)
+
+    def load_usages():
+        with storage.dataset(DATASET) as conn:
+            return sum(1 for _ in storage.query_usages(conn, dots))
+    phases["load_usages"], usages = _timed(load_usages, repeat)
+
+    storage.rm(DATASET)
+    return phases, table, usages
+
+
+def _revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales: list[str], repeat: int = 3, jobs: int = 1) -> dict:
+    # Only the timings are interesting, the app messages are dropped
+    output.setup(output.Verbosity.QUIET)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="dot-handler-bench-") as work_dir:
+        for name in scales:
+            results.append(run_scale(name, SCALES[name], Path(work_dir), repeat, jobs))
+
+    return {"meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "revision": _revision(),
+                     "python": sys.version.split()[0], "platform": platform.platform(), "repeat": repeat,
+                     "jobs": jobs},
+            "results": results}
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list[dict]:
+    """
+    Compares the best timing of every phase of two runs.
+
+    :return: every phase found in both runs, flagged as a regression when it's slower than `threshold` (a ratio)
+    """
+    baseline_phases = {result["scale"]: result["phases"] for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        for phase, timing in result["phases"].items():
+            before = baseline_phases.get(result["scale"], {}).get(phase)
+            if before is None:
+                continue
+            ratio = timing["min"] / before["min"] if before["min"] > 0 else 1.0
+            rows.append({"scale": result["scale"], "phase": phase, "baseline": before["min"], "current": timing["min"],
+                         "ratio": ratio, "regression": ratio > 1 + threshold})
+    return rows
+
+
+def save(results: dict, output_path: Path):
+    with open(output_path, "w", encoding="utf-8") as fp:
+        json.dump(results, fp, indent=2)
+
+
+def load(input_path: Path) -> dict:
+    with open(input_path, "r", encoding="utf-8") as fp:
+        return json.load(fp)
@@ -0,0 +1,34 @@
+"""
+Finds the definitions of DDL objects in SQL files and looks up their usages, see `DotHandler`.
+
+Nothing is imported (nor created on disk) until it's used, so `import engine` stays cheap for the CLI and for embedders.
+"""
+from importlib import import_module
+
+# Public name -> module defining it
+_LAZY = {
+    "DotHandler": "engine.api",
+    "DotHandlerError": "engine.errors",
+    "InvalidNameError": "engine.errors",
+    "CollisionError": "engine.errors",
+    "DatasetNotFoundError": "engine.errors",
+    "EmptyDefinitionTableError": "engine.errors",
+    "UnknownCollectionError": "engine.errors",
+    "ConfigurationError": "engine.errors",
+    "DDLObjectTypeSupported": "engine.utils",
+    "Verbosity": "engine.output",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name: str):
+    if name not in _LAZY:
+        raise AttributeError(f"module 'engine' has no attribute '{name}'")
+    value = getattr(import_module(_LAZY[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *__all__})
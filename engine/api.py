@@ -0,0 +1,223 @@
+from itertools import chain
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+from uuid import uuid4
+
+from engine import archive
+from engine import output
+from engine import profiling
+from engine import storage
+from engine.errors import DatasetNotFoundError
+from engine.errors import UnknownCollectionError
+from engine.export import DEFINITION_FIELDS
+from engine.export import USAGE_FIELDS
+from engine.finder import find_dot_definition_from_file
+from engine.finder import find_fingerprint
+from engine.finder import store_dot_definitions
+from engine.graph import store_dependencies
+from engine.lookup import UsageWriter
+from engine.lookup import lookup_fingerprint
+from engine.lookup import lookup_table
+from engine.lookup import run_fingerprint
+from engine.lookup import scan_dot_usages_from_files
+from engine.lookup import store_dot_usages
+from engine.lookup import stream_dot_usages
+from engine.manifest import FileManifest
+from engine.scanner import scan_dot_definitions_and_usages
+from engine.utils import DDLDefinitionRecord, DDLObjectTypeSupported, UsageTable
+
+
+class DotHandler(object):
+    """
+    Embeddable entry point: `find`, `lookup`, `scan`, `query` and `stats` of a dataset like the CLI does, from the same
+    interpreter.
+
+    Results are returned as iterators of records and errors are raised as `DotHandlerError`s. Only the errors are
+    printed, unless another `verbosity` is given (`None` keeps the current output setup, e.g. the one of the CLI).
+
+        handler = DotHandler("purchases", jobs=0)
+        views = list(handler.find("views", "/app/db"))
+        for usage in handler.lookup("views", "/app/db", incremental=True):
+            ...
+    """
+
+    def __init__(self, dataset: str = "main", jobs: int = 1, journal: bool = False,
+                 verbosity: output.Verbosity | None = output.Verbosity.QUIET):
+        self.dataset = dataset
+        self.jobs = jobs
+        self.journal = journal
+        if verbosity is not None:
+            output.setup(verbosity)
+
+    def find(self, dots: DDLObjectTypeSupported | str, path: Path | str, patterns: Iterable[str] = ("*.sql",),
+             excludes: Iterable[str] = (), use_ignore_files: bool = True, incremental: bool = False
+             ) -> Iterator[DDLDefinitionRecord]:
+        """
+        Finds the definitions of `dots` in the files under `path`, a folder or an archive, and stores them in the
+        dataset.
+
+        :return: the definitions found, once they are stored
+        """
+        dots, path, patterns = DDLObjectTypeSupported(dots), Path(path), list(patterns)
+        discovery = archive.discovery(path, patterns, excludes, use_ignore_files)
+
+        # The dataset is opened once and written in a single flush at the end
+        with storage.DatasetSession(self.dataset, self.journal) as session:
+            manifest = None
+            if incremental:
+                manifest = FileManifest.load(session.conn, 'definitions', dots, find_fingerprint())
+
+            dot_table = find_dot_definition_from_file(dots, profiling.timed(discovery, "discovery"), self.jobs,
+                                                      manifest)
+            if manifest is not None:
+                manifest.prune(path, patterns, discovery.found)
+                store_dot_definitions(session, dots, dot_table, manifest)
+            elif len(dot_table) > 0:
+                store_dot_definitions(session, dots, dot_table)
+            store_dependencies(session, dots)
+
+        return iter(dot_table.values())
+
+    def lookup(self, dots: DDLObjectTypeSupported | str, path: Path | str, patterns: Iterable[str] = ("*.sql",),
+               name: str = "*", excludes: Iterable[str] = (), use_ignore_files: bool = True,
+               incremental: bool = False, resume: bool = False) -> Iterator[dict[str, Any]]:
+        """
+        Looks up the usages of `name` (`*`: every definition of `dots` in the dataset) in the files under `path`, a
+        folder, an archive or a single file, and stores them in the dataset.
+
+        Runs while it's iterated, like `lookup_batches`: only the usages of the current batch are kept in memory, and
+        everything is stored once the iteration ends.
+
+        :param resume: skips the files already stored by the last interrupted run of the same lookup
+        :return: the usages found, as soon as their batch is stored, with the fields of `USAGE_FIELDS`
+        """
+        return chain.from_iterable(self.lookup_batches(dots, path, patterns, name, excludes, use_ignore_files,
+                                                       incremental, resume))
+
+    def lookup_batches(self, dots: DDLObjectTypeSupported | str, path: Path | str,
+                       patterns: Iterable[str] = ("*.sql",), name: str = "*", excludes: Iterable[str] = (),
+                       use_ignore_files: bool = True, incremental: bool = False,
+                       resume: bool = False) -> Iterator[Iterator[dict[str, Any]]]:
+        """
+        Same as `lookup`, run while it's iterated: the usages of every batch are yielded once the batch is stored, and
+        nothing is kept from a batch to the next. If the iteration stops, the run can be resumed.
+
+        :return: the usages of every batch
+        """
+        dots, path, patterns, excludes = DDLObjectTypeSupported(dots), Path(path), list(patterns), list(excludes)
+        if path.is_file() and not archive.is_archive(path):
+            output.info(f"[INFO] ⚠️ A file was given as src_path: {path.absolute()}")
+            path, patterns = path.parent, [path.name]
+        discovery = archive.discovery(path, patterns, excludes, use_ignore_files)
+        self._check_dataset()
+
+        with storage.DatasetSession(self.dataset, self.journal) as session:
+            table = lookup_table(session, dots, name)
+            fingerprint = run_fingerprint(table, path, patterns, excludes, use_ignore_files)
+
+            run_id, done = uuid4().hex, set()
+            if resume:
+                run = storage.load_run(session.conn, dots, fingerprint)
+                if run is None:
+                    output.info("[INFO] ⚠️ No interrupted lookup to resume, every file is looked up")
+                else:
+                    run_id, generation, done = run
+                    output.info(f"[INFO] ⏩ Resuming the lookup of generation {generation}, {len(done)} files "
+                                f"already stored are skipped")
+
+            manifest = None
+            if incremental:
+                manifest = FileManifest.load(session.conn, 'usages', dots, lookup_fingerprint(table))
+
+            # Discovery, scan and storage run as a pipeline, file by file
+            src_filepaths = (src_file for src_file in profiling.timed(discovery, "discovery")
+                             if str(src_file.absolute()) not in done)
+            writer = UsageWriter(session, dots, run_id, fingerprint, manifest, None if name == "*" else table)
+            for src_file, usage_records in stream_dot_usages(
+                    dots, table, scan_dot_usages_from_files(dots, table, src_filepaths, self.jobs, manifest)):
+                batch = writer.add(src_file, usage_records)
+                if batch is not None:
+                    yield self._usages(batch, writer.generation)
+
+            if manifest is not None:
+                manifest.prune(path, patterns, discovery.found)
+            batch = writer.close()
+            store_dependencies(session, dots)
+
+            session.flush()
+            yield self._usages(batch, writer.generation)
+
+    def scan(self, dots: DDLObjectTypeSupported | str, path: Path | str, patterns: Iterable[str] = ("*.sql",),
+             excludes: Iterable[str] = (), use_ignore_files: bool = True
+             ) -> tuple[Iterator[DDLDefinitionRecord], Iterator[dict[str, Any]]]:
+        """
+        Same as `find` followed by `lookup` of every name, but every file under `path` is read once and the dataset is
+        written once.
+
+        :return: the definitions and the usages found, once they are stored
+        """
+        dots, path, patterns = DDLObjectTypeSupported(dots), Path(path), list(patterns)
+        discovery = archive.discovery(path, patterns, excludes, use_ignore_files)
+
+        with storage.DatasetSession(self.dataset, self.journal) as session:
+            dot_table, records = scan_dot_definitions_and_usages(session, dots, profiling.timed(discovery, "discovery"),
+                                                                 self.jobs)
+            if len(dot_table) > 0:
+                store_dot_definitions(session, dots, dot_table)
+            store_dot_usages(session, dots, records)
+            store_dependencies(session, dots)
+
+            session.flush()
+            generation = None if self.journal else storage.get_meta(session.conn, 'usages.generation')
+
+        return iter(dot_table.values()), self._usages(records, generation)
+
+    def query(self, collection: str, dots: DDLObjectTypeSupported | str, name: str | None = None,
+              schema: str | None = None, filepath: str | None = None, limit: int | None = None,
+              offset: int = 0) -> Iterator[dict[str, Any]]:
+        """
+        Reads the `definitions`, `usages` or `dependencies` of `dots` stored in the dataset, from a single snapshot.
+
+        :param filepath: glob pattern of the files, e.g. '/app/db/v2/*'
+        """
+        dots = DDLObjectTypeSupported(dots)
+        if collection not in ("definitions", "usages", "dependencies"):
+            raise UnknownCollectionError(f"No collection found by name: {collection}")
+        self._check_dataset()
+        return self._query(collection, dots, name, schema, filepath, limit, offset)
+
+    def stats(self, dots: DDLObjectTypeSupported | str, top: int = 10) -> dict[str, Any]:
+        """
+        Reads the aggregates of the usages of `dots` kept by the dataset, like `ds stats`: totals, usages by
+        generation, the `top` most used objects and files, and the unused definitions.
+        """
+        dots = DDLObjectTypeSupported(dots)
+        self._check_dataset()
+        with storage.snapshot(self.dataset) as conn:
+            return storage.load_stats(conn, dots, top)
+
+    def _query(self, collection: str, dots: DDLObjectTypeSupported, name: str | None, schema: str | None,
+               filepath: str | None, limit: int | None, offset: int) -> Iterator[dict[str, Any]]:
+        # The snapshot is kept until the iterator is exhausted or closed
+        with storage.snapshot(self.dataset) as conn:
+            match collection:
+                case 'definitions':
+                    for row in storage.query_definitions(conn, dots, name, schema, filepath, limit, offset):
+                        yield {field: row[field] for field in DEFINITION_FIELDS}
+                case 'usages':
+                    for row in storage.query_usages(conn, dots, name, schema, filepath, limit, offset):
+                        yield {field: row[field] for field in USAGE_FIELDS}
+                case 'dependencies':
+                    for key, depends_on in storage.load_dependencies(conn, dots).items():
+                        if name is None or key == name or key.endswith(f".{name}"):
+                            yield {"key": key, "depends_on": depends_on}
+
+    @staticmethod
+    def _usages(records: dict[Path, UsageTable], generation: int | None) -> Iterator[dict[str, Any]]:
+        return ({"key": key, "name": key.split(".", 1)[-1], "schema": key.split(".", 1)[0] if "." in key else None,
+                 **entry, "generation": generation}
+                for usages in records.values() for key, entries in usages.items() for entry in entries)
+
+    def _check_dataset(self):
+        if not storage.exists(self.dataset):
+            raise DatasetNotFoundError(f"Dataset {self.dataset} does not exist!")
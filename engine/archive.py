@@ -0,0 +1,167 @@
+import io
+import os
+import tarfile
+import zipfile
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import Any, BinaryIO, Iterable, Iterator, List, NamedTuple
+
+from engine.discovery import FileDiscovery
+from engine.discovery import is_ignored
+
+# `archive!member`, the path of a file of an archive
+SEPARATOR = "!"
+ZIP_SUFFIXES = (".zip", ".jar")
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+def is_archive(path: Path | str) -> bool:
+    return str(path).lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+
+def split_member(filepath: str) -> tuple[str, str] | None:
+    # The first `!` following an archive name, a `!` can also be part of a folder or a file name
+    start = 0
+    while (index := filepath.find(SEPARATOR, start)) != -1:
+        if is_archive(filepath[:index]):
+            return filepath[:index], filepath[index + 1:]
+        start = index + 1
+    return None
+
+
+def exists(filepath: str) -> bool:
+    # A member is only known to be missing once its archive is
+    parts = split_member(filepath)
+    return Path(parts[0] if parts is not None else filepath).exists()
+
+
+class MemberStat(NamedTuple):
+    st_size: int
+    st_mtime_ns: int
+
+
+@lru_cache(maxsize=8)
+def _open_zip(archive: str, size: int, mtime_ns: int) -> zipfile.ZipFile:
+    # The central directory is read once per process (and per version of the archive), not once per member
+    return zipfile.ZipFile(archive)
+
+
+class ArchiveMember(object):
+    """
+    A file of an archive, read by the scanners like a `Path` (`absolute`, `stat`, `open`), and named `archive!member`.
+
+    The members of a tar are read in the walk of the archive, as it can only be read in sequence, so their `data` is
+    sent along with them until they are scanned (see `release`). The members of a zip are read (and decompressed) by the
+    process which scans them.
+    """
+    __slots__ = ("archive", "member", "size", "mtime_ns", "data")
+
+    def __init__(self, archive: Path, member: str, size: int, mtime_ns: int, data: bytes | None = None):
+        self.archive = archive
+        self.member = member
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.data = data
+
+    @property
+    def name(self) -> str:
+        return PurePosixPath(self.member).name
+
+    def absolute(self) -> 'ArchiveMember':
+        if self.archive.is_absolute():
+            return self
+        return ArchiveMember(self.archive.absolute(), self.member, self.size, self.mtime_ns, self.data)
+
+    def stat(self) -> MemberStat:
+        return MemberStat(self.size, self.mtime_ns)
+
+    def open(self, mode: str = "rb") -> BinaryIO:
+        if mode != "rb":
+            raise ValueError(f"Archive members can only be read: {self}")
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        stat = os.stat(self.archive)
+        return _open_zip(str(self.archive), stat.st_size, stat.st_mtime_ns).open(self.member)
+
+    def read_bytes(self) -> bytes:
+        with self.open() as fp:
+            return fp.read()
+
+    def __str__(self) -> str:
+        return f"{self.archive}{SEPARATOR}{self.member}"
+
+    def __repr__(self) -> str:
+        return f"ArchiveMember('{self}')"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ArchiveMember) and str(self) == str(other)
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+
+class ArchiveDiscovery(FileDiscovery):
+    """
+    Members of a zip or tar archive matching any of the given patterns, found in a single pass over the archive, in
+    the order they are stored: nothing is extracted to disk.
+
+    Patterns and excludes are matched against the member paths like `FileDiscovery` does against the relative paths,
+    the ignore files inside the archive are not read.
+    """
+
+    def __init__(self, archive: Path, patterns: List[str], excludes: Iterable[str] = ()):
+        super().__init__(archive, patterns, excludes, use_ignore_files=False)
+
+    def _included(self, member: str) -> bool:
+        parts = PurePosixPath(member).parts
+        if not parts or not self._matches(parts[-1], member):
+            return False
+        # An excluded folder excludes every member under it
+        return not any(is_ignored(self.excludes, "/".join(parts[:i]), i < len(parts))
+                       for i in range(1, len(parts) + 1))
+
+    def _members(self) -> Iterator[ArchiveMember]:
+        if str(self.root).lower().endswith(ZIP_SUFFIXES):
+            with zipfile.ZipFile(self.root) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and self._included(info.filename):
+                        mtime_ns = int(datetime(*info.date_time).timestamp() * 1e9)
+                        yield ArchiveMember(self.root, info.filename, info.file_size, mtime_ns)
+            return
+
+        # Stream mode: the (compressed) archive is read once, from the start to the end
+        with tarfile.open(self.root, "r|*") as tf:
+            for info in tf:
+                # `./folder/file.sql` when the archive was made from `.`
+                member = PurePosixPath(info.name).as_posix()
+                if info.isfile() and self._included(member):
+                    data = tf.extractfile(info).read()
+                    yield ArchiveMember(self.root, member, info.size, int(info.mtime * 1e9), data)
+
+    def __iter__(self) -> Iterator[ArchiveMember]:
+        self.folders.append(str(self.root))
+        seen = set()
+        for member in self._members():
+            # A member stored twice is only scanned once, like a file reachable through a link
+            if member.member in seen:
+                continue
+            seen.add(member.member)
+            self.found.append(str(member.absolute()))
+            yield member
+
+
+def release(scans: Iterable[tuple[Path, Any]]) -> Iterator[tuple[Path, Any]]:
+    # The data of a tar member is dropped once it's scanned, only its name is still used
+    for src_file, records in scans:
+        if isinstance(src_file, ArchiveMember):
+            src_file.data = None
+        yield src_file, records
+
+
+def discovery(src_input_path: Path, patterns: List[str], excludes: Iterable[str] = (),
+              use_ignore_files: bool = True) -> FileDiscovery:
+    # Archives are walked like folders
+    if src_input_path.is_file() and is_archive(src_input_path):
+        return ArchiveDiscovery(src_input_path, patterns, excludes)
+    return FileDiscovery(src_input_path, patterns, excludes, use_ignore_files)
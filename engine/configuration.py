@@ -1,13 +1,14 @@
 import json
 import os
+from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
 from typing import Any
-from typer import echo
 
-# Set up the main storage directory
+from engine import output
+
+# Main storage directory, only created by the first write
 STORAGE_MAIN_DIR = Path(os.path.expanduser("~")) / ".mdb_tools" / "dot-handler"
-STORAGE_MAIN_DIR.mkdir(parents=True, exist_ok=True)
 
 
 class ConfCommand(str, Enum):
@@ -22,36 +23,132 @@ class ConfPolicy:
         KEEP_ORIGINAL = "keep-original"
         FAILURE = "failure"
 
+    class Retention(str, Enum):
+        LATEST = "latest"  # Only the usages of the last lookup of every file
+        GENERATIONS = "generations"  # The usages of the last `policy.retention.generations` lookups
 
 
+DEFAULT_CONF = {"db.schema": "user", "policy.collision": ConfPolicy.Collision.FAILURE.value,
+                "policy.retention": ConfPolicy.Retention.LATEST.value, "policy.retention.generations": "3",
+                "source.encoding.fallback": "latin-1", "lookup.batch.usages": "50000", "lookup.batch.seconds": "30"}
 
-def load_conf() -> dict[str, Any]:
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Typed snapshot of the configuration, `conf` keeps every raw value and `mtime` the version of the `.conf` file.
+    """
+    conf: dict[str, Any]
+    mtime: int | None = None
+
+    @property
+    def db_schema(self) -> str:
+        return self.conf.get("db.schema", DEFAULT_CONF["db.schema"])
+
+    @property
+    def policy_collision(self) -> str:
+        return self.conf.get("policy.collision", DEFAULT_CONF["policy.collision"])
+
+    @property
+    def policy_retention(self) -> str:
+        return self.conf.get("policy.retention", DEFAULT_CONF["policy.retention"])
+
+    @property
+    def source_encoding_fallback(self) -> str:
+        # Encoding of the files which are not valid UTF-8 and have no BOM
+        return self.conf.get("source.encoding.fallback", DEFAULT_CONF["source.encoding.fallback"])
+
+    @property
+    def retention_generations(self) -> int:
+        try:
+            return max(1, int(self.conf.get("policy.retention.generations", DEFAULT_CONF["policy.retention.generations"])))
+        except ValueError:
+            return int(DEFAULT_CONF["policy.retention.generations"])
+
+    @property
+    def lookup_batch_usages(self) -> int:
+        # A lookup stores its usages every N usages found...
+        try:
+            return max(1, int(self.conf.get("lookup.batch.usages", DEFAULT_CONF["lookup.batch.usages"])))
+        except ValueError:
+            return int(DEFAULT_CONF["lookup.batch.usages"])
+
+    @property
+    def lookup_batch_seconds(self) -> float:
+        # ... or every N seconds
+        try:
+            return max(0.0, float(self.conf.get("lookup.batch.seconds", DEFAULT_CONF["lookup.batch.seconds"])))
+        except ValueError:
+            return float(DEFAULT_CONF["lookup.batch.seconds"])
+
+
+# Configuration of this process: loaded once, then only reloaded if the `.conf` file changed
+_settings: Settings | None = None
+_installed = False
+
+
+def _conf_mtime() -> int | None:
+    try:
+        return (STORAGE_MAIN_DIR / ".conf").stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _read_settings() -> Settings:
     conf_file = STORAGE_MAIN_DIR / ".conf"
-    if not conf_file.exists():
+    mtime = _conf_mtime()
+    if mtime is None:
         # Default configuration
-        conf = {"db.schema": "user", "policy.collision": ConfPolicy.Collision.FAILURE}
-    else:
-        with open(conf_file, "r") as fp:
-            conf = json.load(fp)
-    return conf
+        return Settings(dict(DEFAULT_CONF))
+
+    with open(conf_file, "r") as fp:
+        return Settings(json.load(fp), mtime)
+
+
+def settings(refresh: bool = False) -> Settings:
+    """
+    Configuration snapshot of the process, read from the `.conf` file only once.
+
+    :param refresh: reloads the snapshot if the `.conf` file changed since it was read
+    :return: the current settings
+    """
+    global _settings
+    if _settings is None or (refresh and not _installed and _settings.mtime != _conf_mtime()):
+        _settings = _read_settings()
+    return _settings
+
+
+def install_settings(snapshot: Settings):
+    # Used by worker processes to get the settings of the parent instead of reading the file
+    global _settings, _installed
+    _settings = snapshot
+    _installed = True
+
+
+def load_conf() -> dict[str, Any]:
+    return dict(settings(refresh=True).conf)
 
 
 def save_conf(conf: dict[str, Any]):
+    global _settings
     conf_file = STORAGE_MAIN_DIR / ".conf"
+    conf_file.parent.mkdir(parents=True, exist_ok=True)
     with open(conf_file, "w") as fp:
         json.dump(conf, fp)
 
+    # Write through: the snapshot is the saved configuration
+    _settings = Settings(dict(conf), _conf_mtime())
+
 
 def get_config(key: str, default: str | None = None) -> str | None:
-    conf = load_conf()
-    return conf.get(key, default)
+    return settings(refresh=True).conf.get(key, default)
 
 
 def set_config(key: str, value: Any | None):
     conf = load_conf()
     if value is None and key in conf:
         del conf[key]
-        echo(f"[INFO] 🗑️ {key} was deleted!")
+        output.info(f"[INFO] 🗑️ {key} was deleted!")
     elif value is not None:
         conf[key] = value
     else:
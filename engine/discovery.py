@@ -0,0 +1,189 @@
+import fnmatch
+import os
+import re
+from pathlib import Path, PurePosixPath
+from typing import Iterable, Iterator, List
+
+# Never visited, whatever the patterns or the ignore files say
+DEFAULT_EXCLUDES = (".git/", ".hg/", ".svn/")
+IGNORE_FILES = (".gitignore", ".dothandlerignore")
+
+
+def _glob_to_regex(glob: str) -> str:
+    # `**` matches any number of folders, `*` and `?` never match a `/`
+    regex, i = "", 0
+    while i < len(glob):
+        char = glob[i]
+        if glob.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if glob.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[":
+            end = glob.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                regex += "[" + glob[i + 1:end].replace("!", "^", 1) + "]"
+                i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex
+
+
+class IgnoreRule(object):
+    """
+    A `.gitignore`-style rule: `!` negates it, a trailing `/` only matches folders and a pattern with a `/` is anchored
+    to the folder of the ignore file (otherwise, it matches a name at any depth).
+    """
+
+    def __init__(self, pattern: str, base: str = ""):
+        self.negate = pattern.startswith("!")
+        pattern = pattern[1:] if self.negate else pattern
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+
+        anchored = "/" in pattern
+        regex = _glob_to_regex(pattern.lstrip("/"))
+        prefix = re.escape(base + "/") if base else ""
+        self.regex = re.compile(prefix + ("" if anchored else "(?:.*/)?") + regex + "$")
+
+    def match(self, relative: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        return self.regex.match(relative) is not None
+
+
+def read_ignore_file(filepath: str, base: str) -> list[IgnoreRule]:
+    rules = []
+    with open(filepath, "r", encoding="utf-8", errors="replace") as fp:
+        for line in fp:
+            line = line.rstrip("\n").rstrip()
+            if line and not line.startswith("#"):
+                rules.append(IgnoreRule(line, base))
+    return rules
+
+
+def is_ignored(rules: Iterable[IgnoreRule], relative: str, is_dir: bool) -> bool:
+    # The last matching rule wins
+    ignored = False
+    for rule in rules:
+        if rule.match(relative, is_dir):
+            ignored = not rule.negate
+    return ignored
+
+
+class FileDiscovery(object):
+    """
+    Files under a folder matching any of the given patterns, found in a single walk of the tree.
+
+    Patterns are matched like `Path.match` (a name pattern such as `*.sql` matches at any depth). Every file is
+    yielded once, even if it matches several patterns or is reachable through a symbolic link, and as soon as it's
+    found, so the scan can start before the walk is done. The absolute paths of the files yielded so far are kept in
+    `found`, and the folders walked in `folders`.
+    """
+
+    def __init__(self, src_input_path: Path, patterns: List[str], excludes: Iterable[str] = (),
+                 use_ignore_files: bool = True):
+        self.root = src_input_path
+        self.use_ignore_files = use_ignore_files
+        self.excludes = [IgnoreRule(exclude) for exclude in (*DEFAULT_EXCLUDES, *excludes)]
+        self.found: list[str] = []
+        self.folders: list[str] = []
+
+        # Name patterns are merged into a single regex, path patterns fall back to `Path.match`
+        names = [pattern for pattern in patterns if "/" not in pattern]
+        self.names = re.compile("|".join(fnmatch.translate(os.path.normcase(name)) for name in names)) \
+            if names else None
+        self.paths = [pattern for pattern in patterns if "/" in pattern]
+
+    def _matches(self, name: str, relative: str) -> bool:
+        if self.names is not None and self.names.match(os.path.normcase(name)):
+            return True
+        return any(PurePosixPath(relative).match(pattern) for pattern in self.paths)
+
+    def accepts(self, src_file: Path) -> bool:
+        """
+        Whether the walk would yield `src_file`, a file under the root, without walking the tree: only the ignore files
+        of its folder and of the folders above it are read.
+        """
+        relative = Path(os.path.relpath(src_file, self.root)).as_posix()
+        if relative == ".." or relative.startswith("../"):
+            return False
+
+        parts = relative.split("/")
+        folder, rules = str(self.root), []
+        for depth, name in enumerate(parts):
+            # Same order as the walk, which reads the entries of a folder by name
+            for ignore_file in sorted(IGNORE_FILES) if self.use_ignore_files else ():
+                ignore_path = os.path.join(folder, ignore_file)
+                if os.path.isfile(ignore_path):
+                    rules += read_ignore_file(ignore_path, "/".join(parts[:depth]))
+            entry_relative, is_dir = "/".join(parts[:depth + 1]), depth < len(parts) - 1
+            if is_ignored(self.excludes, entry_relative, is_dir) or is_ignored(rules, entry_relative, is_dir):
+                return False
+            folder = os.path.join(folder, name)
+        return self._matches(parts[-1], relative)
+
+    def __iter__(self) -> Iterator[Path]:
+        root = str(self.root)
+        real_root = os.path.realpath(root)
+        seen_files, seen_dirs = set(), {real_root}
+        # Folders to walk: path, path relative to the root, rules of the ignore files in effect and whether a link was
+        # followed
+        stack = [(root, "", [], False)]
+
+        while stack:
+            path, relative, rules, linked = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError:
+                continue
+            self.folders.append(path)
+
+            if self.use_ignore_files:
+                rules = rules + [rule for entry in entries if entry.name in IGNORE_FILES and entry.is_file()
+                                 for rule in read_ignore_file(entry.path, relative)]
+
+            folders = []
+            for entry in entries:
+                entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                # The excludes are checked on their own: a negation of an ignore file never brings an excluded
+                # entry back
+                if is_ignored(self.excludes, entry_relative, is_dir) or is_ignored(rules, entry_relative, is_dir):
+                    continue
+
+                entry_linked = linked or entry.is_symlink()
+                if is_dir:
+                    if entry_linked:
+                        # A linked folder is only walked once, which also breaks the loops
+                        real = os.path.realpath(entry.path)
+                        if real in seen_dirs:
+                            continue
+                        seen_dirs.add(real)
+                    folders.append((entry.path, entry_relative, rules, entry_linked))
+                elif self._matches(entry.name, entry_relative):
+                    real = os.path.realpath(entry.path) if entry_linked else os.path.join(real_root, entry_relative)
+                    if real in seen_files:
+                        continue
+                    seen_files.add(real)
+
+                    src_file = Path(entry.path)
+                    self.found.append(str(src_file.absolute()))
+                    yield src_file
+
+            # Depth first, in name order
+            stack.extend(reversed(folders))
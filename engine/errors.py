@@ -0,0 +1,32 @@
+class DotHandlerError(Exception):
+    """
+    Base of every error raised by the engine. The CLI prints its message and exits with status 1.
+    """
+
+
+class InvalidNameError(DotHandlerError, ValueError):
+    # A definition or a looked up name which is not `name` or `schema.name`
+    pass
+
+
+class CollisionError(DotHandlerError):
+    # The same object is defined twice and `policy.collision` is `failure`
+    pass
+
+
+class DatasetNotFoundError(DotHandlerError):
+    pass
+
+
+class EmptyDefinitionTableError(DotHandlerError):
+    # A lookup of every name, before any `find`
+    pass
+
+
+class UnknownCollectionError(DotHandlerError, ValueError):
+    pass
+
+
+class ConfigurationError(DotHandlerError, ValueError):
+    # A configuration value which can't be used
+    pass
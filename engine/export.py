@@ -0,0 +1,180 @@
+import csv
+import json
+import sqlite3
+from datetime import datetime
+from enum import Enum
+from typing import Iterable, TextIO
+
+
+class ExportFormat(str, Enum):
+    TEXT = "text"
+    JSONL = "jsonl"
+    CSV = "csv"
+
+
+DEFINITION_FIELDS = ["key", "name", "schema", "filepath", "line", "timestamp"]
+USAGE_FIELDS = ["key", "name", "schema", "filepath", "line", "column", "timestamp", "generation"]
+DEPENDENCY_FIELDS = ["key", "depends_on"]
+IMPACT_FIELDS = ["key", "direction", "node", "depth"]
+STATS_FIELDS = ["section", "name", "count"]
+
+
+def export_definitions(fp: TextIO, fmt: ExportFormat, rows: Iterable[sqlite3.Row]) -> int:
+    exported = 0
+    match fmt:
+        case ExportFormat.TEXT:
+            for definition in rows:
+                fp.write(f"🗝️ {definition['key']}\n"
+                         f"📄 Name:      {definition['name']}\n"
+                         f"📄 Schema:    {definition['schema']}\n"
+                         f"📄 Filepath:  {definition['filepath']}\n"
+                         f"📄 Line:      {definition['line']}\n"
+                         f"📄 Timestamp: {datetime.fromtimestamp(definition['timestamp'])}\n"
+                         f"{'-' * 80}\n")
+                exported += 1
+        case ExportFormat.JSONL:
+            for definition in rows:
+                fp.write(json.dumps({field: definition[field] for field in DEFINITION_FIELDS}) + "\n")
+                exported += 1
+        case ExportFormat.CSV:
+            writer = csv.writer(fp)
+            writer.writerow(DEFINITION_FIELDS)
+            for definition in rows:
+                writer.writerow([definition[field] for field in DEFINITION_FIELDS])
+                exported += 1
+    return exported
+
+
+def export_usages(fp: TextIO, fmt: ExportFormat, rows: Iterable[sqlite3.Row], counts: dict[str, int]) -> int:
+    """
+    Writes the usages, which must be sorted by key. `counts` holds the number of usages of every key, for the text
+    format headers.
+    """
+    exported = 0
+    match fmt:
+        case ExportFormat.TEXT:
+            key, i = None, 0
+            for usage in rows:
+                if usage['key'] != key:
+                    if key is not None:
+                        fp.write(f"{'-' * 80}\n")
+                    key, i = usage['key'], 0
+                    fp.write(f"🗝️ {key}: {counts.get(key, 0)}\n")
+                else:
+                    fp.write(f"{'.' * 80}\n")
+
+                i += 1
+                fp.write(f"✅ Usage {i}\n"
+                         f"    📄 Filepath:  {usage['filepath']}\n"
+                         f"    📄 Line:      {usage['line']}\n")
+                if usage['column'] is not None:
+                    fp.write(f"    📄 Column:    {usage['column']}\n")
+                fp.write(f"    📄 Timestamp: {datetime.fromtimestamp(usage['timestamp'])}\n")
+                exported += 1
+
+            if key is not None:
+                fp.write(f"{'-' * 80}\n")
+        case ExportFormat.JSONL:
+            for usage in rows:
+                fp.write(json.dumps({field: usage[field] for field in USAGE_FIELDS}) + "\n")
+                exported += 1
+        case ExportFormat.CSV:
+            writer = csv.writer(fp)
+            writer.writerow(USAGE_FIELDS)
+            for usage in rows:
+                writer.writerow([usage[field] for field in USAGE_FIELDS])
+                exported += 1
+    return exported
+
+
+def export_dependencies(fp: TextIO, fmt: ExportFormat, rows: Iterable[sqlite3.Row]) -> int:
+    exported = 0
+    match fmt:
+        case ExportFormat.TEXT:
+            for dependency in rows:
+                fp.write(f"🗝️ {dependency['key']}\n")
+                for node in json.loads(dependency['depends_on']):
+                    fp.write(f"    ➡️ {node}\n")
+                fp.write(f"{'-' * 80}\n")
+                exported += 1
+        case ExportFormat.JSONL:
+            for dependency in rows:
+                fp.write(json.dumps({"key": dependency['key'], "depends_on": json.loads(dependency['depends_on'])}) + "\n")
+                exported += 1
+        case ExportFormat.CSV:
+            writer = csv.writer(fp)
+            writer.writerow(DEPENDENCY_FIELDS)
+            for dependency in rows:
+                for node in json.loads(dependency['depends_on']):
+                    writer.writerow([dependency['key'], node])
+                exported += 1
+    return exported
+
+
+def export_impact(fp: TextIO, fmt: ExportFormat, closures: Iterable[tuple[str, str, dict[str, int]]]) -> int:
+    """
+    Writes the closures given as `(key, direction, {node: depth})`, the nearest nodes first.
+    """
+    exported = 0
+    writer = None
+    if fmt == ExportFormat.CSV:
+        writer = csv.writer(fp)
+        writer.writerow(IMPACT_FIELDS)
+
+    for key, direction, closure in closures:
+        nodes = sorted(closure.items(), key=lambda item: (item[1], item[0]))
+        match fmt:
+            case ExportFormat.TEXT:
+                arrow = "⬆️" if direction == "upstream" else "⬇️"
+                fp.write(f"🗝️ {key}: {len(nodes)} {direction}\n")
+                for node, depth in nodes:
+                    fp.write(f"    {arrow} {node} (depth {depth})\n")
+                fp.write(f"{'-' * 80}\n")
+            case ExportFormat.JSONL:
+                for node, depth in nodes:
+                    fp.write(json.dumps({"key": key, "direction": direction, "node": node, "depth": depth}) + "\n")
+            case ExportFormat.CSV:
+                for node, depth in nodes:
+                    writer.writerow([key, direction, node, depth])
+        exported += len(nodes)
+    return exported
+
+
+def export_stats(fp: TextIO, fmt: ExportFormat, stats: dict) -> int:
+    """
+    Writes the stats read by `storage.load_stats`. The JSONL and CSV rows are `(section, name, count)`, the sections
+    being `total`, `generation`, `hot`, `file` and `unused`.
+    """
+    rows = [("total", "definitions", stats['definitions']), ("total", "unused", stats['unused']),
+            ("total", "usages", stats['usages']), ("total", "files", stats['files']),
+            *(("generation", generation, usages) for generation, usages in stats['generations']),
+            *(("hot", key, usages) for key, usages in stats['hot']),
+            *(("file", filepath, usages) for filepath, usages in stats['hot_files']),
+            *(("unused", key, 0) for key in stats['unused_keys'])]
+    match fmt:
+        case ExportFormat.TEXT:
+            fp.write(f"📊 Definitions: {stats['definitions']} ({stats['unused']} unused)\n"
+                     f"📊 Usages:      {stats['usages']} in {stats['files']} files\n")
+            for generation, usages in stats['generations']:
+                fp.write(f"    📄 Generation {generation}: {usages}\n")
+            fp.write(f"{'-' * 80}\n")
+            fp.write("🔥 Most used:\n")
+            for key, usages in stats['hot']:
+                fp.write(f"    🗝️ {key}: {usages}\n")
+            fp.write(f"{'-' * 80}\n")
+            fp.write("📄 Files with the most usages:\n")
+            for filepath, usages in stats['hot_files']:
+                fp.write(f"    📄 {filepath}: {usages}\n")
+            fp.write(f"{'-' * 80}\n")
+            fp.write(f"💤 Unused: {stats['unused']}\n")
+            for key in stats['unused_keys']:
+                fp.write(f"    🗝️ {key}\n")
+            fp.write(f"{'-' * 80}\n")
+        case ExportFormat.JSONL:
+            for row in rows:
+                fp.write(json.dumps(dict(zip(STATS_FIELDS, row))) + "\n")
+        case ExportFormat.CSV:
+            writer = csv.writer(fp)
+            writer.writerow(STATS_FIELDS)
+            writer.writerows(rows)
+    return len(rows)
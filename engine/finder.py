@@ -1,96 +1,143 @@
-import re
 from datetime import datetime
+from itertools import tee
 from pathlib import Path
-from typing import List
-
-from typer import echo
+from typing import Iterable, Iterator
 
+from engine import output
+from engine import profiling
 from engine import storage
+from engine.archive import release
 from engine.configuration import ConfPolicy
-from engine.configuration import get_config
-from engine.utils import DDLDefinitionRecord, DDLObjectTypeSupported
-
-
-class DDLNameFinderRE:
-    VIEWS = re.compile(
-        r"CREATE(?:\s+OR\s+REPLACE)?(?:\s+(?:FORCE|NOFORCE))?\s+VIEW\s+(?P<name>(?:[a-zA-Z_][\w$#]*\.)?[a-zA-Z_][\w$#]*)",
-        re.IGNORECASE | re.VERBOSE)
-
-
-class DDLObjectTypeFinder:
-    @staticmethod
-    def views(filepath: str, data: str):
-        records = {}
-
-        for matching in DDLNameFinderRE.VIEWS.finditer(data):
-            record = DDLDefinitionRecord.from_definition(matching.group("name"), filepath,
-                                                         data.count('\n', 0, matching.start()) + 1)
-
-            if record.fullname in records:
-                echo(f"[WARNING] ⚠️ The view '{record.fullname}' declaration is duplicated at line {record.line}")
-            else:
-                echo(f"[INFO] ✅ A new view was found at line {record.line}: '{record.fullname}'")
-                records[record.fullname] = record
-
-        return records
-
-
-def find_dot_definition_from_file(dots: DDLObjectTypeSupported, src_filepaths: List[Path]):
-    find_object_func = getattr(DDLObjectTypeFinder, dots.value)
-    if not find_object_func:
-        raise ValueError(f"Unsupported DOTS for Finder: {dots.value}")
-
+from engine.configuration import settings
+from engine.errors import CollisionError
+from engine.errors import InvalidNameError
+from engine.lexer import VERSION as LEXER_VERSION
+from engine.lexer import Definition
+from engine.lexer import definitions
+from engine.manifest import FileManifest
+from engine.manifest import fingerprint
+from engine.manifest import map_files_incremental
+from engine.parallel import map_files
+from engine.source import open_source
+from engine.utils import DDLDefinitionRecord, DDLObjectTypeSupported, LineCounter
+
+# Bumped when the form of the definitions kept by the incremental manifests changes
+DEFINITIONS_FORMAT = 2
+
+
+def find_definitions(dots: DDLObjectTypeSupported, filepath: str, data: bytes,
+                     tokens: Iterable[Definition] | None = None) -> dict[str, DDLDefinitionRecord]:
+    records = {}
+    lines = LineCounter(data)
+    kind = dots.value[:-1]
+
+    # Every kind is found by the same pass of the lexer (unless the definitions were already lexed), only the
+    # definitions of `dots` are kept
+    for token in definitions(data) if tokens is None else tokens:
+        if token.dots != dots:
+            continue
+
+        # Only the matched name is decoded
+        name = token.name.decode("utf-8", errors="replace")
+        line, column = lines.position(token.offset)
+        try:
+            record = DDLDefinitionRecord.from_definition(name, filepath, line, lines.position(token.end), column)
+        except InvalidNameError:
+            # e.g. `database.schema.name`: only this definition is skipped, not the file
+            output.warning(f"[WARNING] ⚠️ The {kind} '{name}' at line {line} was skipped, its name is not [schema.]name")
+            continue
+
+        if record.fullname in records:
+            output.warning(f"[WARNING] ⚠️ The {kind} '{record.fullname}' declaration is duplicated at line {record.line}")
+        else:
+            output.detail(f"[INFO] ✅ A new {kind} was found at line {record.line}: '{record.fullname}'")
+            records[record.fullname] = record
+
+    return records
+
+
+def scan_dot_definitions_from_file(dots: DDLObjectTypeSupported, src_file: Path) -> dict[str, DDLDefinitionRecord]:
+    output.detail(f"[INFO] 🔍 Searching definitions of {dots.value} in {src_file.absolute()}")
+
+    # The file is never loaded as a whole, the lexer runs over its memory map
+    with open_source(src_file) as data:
+        return find_definitions(dots, f"{src_file.absolute()}", data)
+
+
+def scan_dot_definitions_from_files(dots: DDLObjectTypeSupported, src_filepaths: Iterable[Path], jobs: int = 1,
+                                    manifest: FileManifest | None = None) -> Iterator[tuple[Path, dict]]:
+    # Files can be scanned in parallel, but the results are always yielded in the files order, and the files are
+    # scanned as soon as they are found
+    src_filepaths, call_filepaths = tee(src_filepaths)
+    if manifest is None:
+        scans = map_files(scan_dot_definitions_from_file, ((src_file,) for src_file in call_filepaths), jobs,
+                          shared=(dots,))
+    else:
+        scans = map_files_incremental(
+            manifest, scan_dot_definitions_from_file, call_filepaths, jobs, shared=(dots,),
+            encode=lambda records: {key: record.as_entry() for key, record in records.items()},
+            decode=lambda entries: {key: DDLDefinitionRecord.from_entry(entry) for key, entry in entries.items()})
+    return release(zip(src_filepaths, scans, strict=True))
+
+
+def find_dot_definition_from_file(dots: DDLObjectTypeSupported, src_filepaths: Iterable[Path], jobs: int = 1,
+                                  manifest: FileManifest | None = None):
+    return merge_dot_definitions(dots, scan_dot_definitions_from_files(dots, src_filepaths, jobs, manifest))
+
+
+def merge_dot_definitions(dots: DDLObjectTypeSupported,
+                          scans: Iterable[tuple[Path, dict[str, DDLDefinitionRecord]]]) -> dict[str, DDLDefinitionRecord]:
+    # The definitions of every file, in the files order, following the `policy.collision` configuration
     dot_table = {}
-
-    for src_file in src_filepaths:
-        echo(f"[INFO] 🔍 Searching definitions of {dots.value} in {src_file.absolute()}")
-
-        # Make sure to clean the data input
-        with open(src_file, "r") as fp:
-            data = "\n".join([line.strip().lower() for line in fp.readlines()])
-
-        dot_objects = find_object_func(f"{src_file.absolute()}", data)
-        for key in dot_objects.keys():
-            if key in dot_table:
-                echo("[WARNING] ⚠️ Found a collision for DDL object definition: ")
-                echo(f"\t📄 ORIGINAL:  {dot_table[key]}")
-                echo(f"\t📄 COLLISION: {dot_objects[key]}")
-
-                # Check collision policy
-                policy = get_config("policy.collision")
-                match policy:
-                    case ConfPolicy.Collision.FAILURE.value:
-                        echo(
-                            "[ERROR] ❌ Collision Policy is set to FAILURE, to change it please use: `app config set 'policy.collision' [keep-original | override]`")
-                        exit(1)
-                    case ConfPolicy.Collision.KEEP_ORIGINAL.value:
-                        echo(
-                            "[INFO] 💬 Collision Policy is set to KEEP-ORIGINAL, to change it please use: `app config set 'policy.collision' [failure | override]`")
-                        continue  # Skip this collision
-                    case ConfPolicy.Collision.OVERRIDE.value:
-                        echo(
-                            "[INFO] 💬 Collision Policy is set to OVERRIDE, to change it please use: `app config set 'policy.collision' [keep-original | failure]`")
-
-            dot_table[key] = dot_objects[key]
-
-        echo(f"[INFO] {'-' * 80}")
-
+    output.progress_start(f"find {dots.value}")
+    matches = files = 0
+    with profiling.phase("scan"):
+        for src_file, dot_objects in scans:
+            for key in dot_objects.keys():
+                if key in dot_table:
+                    output.warning("[WARNING] ⚠️ Found a collision for DDL object definition: ")
+                    output.warning(f"\t📄 ORIGINAL:  {dot_table[key]}")
+                    output.warning(f"\t📄 COLLISION: {dot_objects[key]}")
+
+                    # Check collision policy
+                    policy = settings().policy_collision
+                    match policy:
+                        case ConfPolicy.Collision.FAILURE.value:
+                            raise CollisionError(
+                                f"Collision of '{key}', Collision Policy is set to FAILURE, to change it please use: `app config set 'policy.collision' [keep-original | override]`")
+                        case ConfPolicy.Collision.KEEP_ORIGINAL.value:
+                            output.info(
+                                "[INFO] 💬 Collision Policy is set to KEEP-ORIGINAL, to change it please use: `app config set 'policy.collision' [failure | override]`")
+                            continue  # Skip this collision
+                        case ConfPolicy.Collision.OVERRIDE.value:
+                            output.info(
+                                "[INFO] 💬 Collision Policy is set to OVERRIDE, to change it please use: `app config set 'policy.collision' [keep-original | failure]`")
+
+                dot_table[key] = dot_objects[key]
+
+            files += 1
+            matches += len(dot_objects)
+            output.detail(f"[INFO] {'-' * 80}")
+            output.progress(src_file, len(dot_objects))
+
+    profiling.count("matches", matches)
+    output.info(f"[INFO] ✅ {len(dot_table)} definitions of {dots.value} found in {files} files")
     return dot_table
 
 
-def store_dot_definitions(ds_name: str, dots: DDLObjectTypeSupported, dot_table: dict[str, DDLDefinitionRecord]):
-    ds = storage.load_dataset(ds_name)
-
-    collection = ds.get('definitions', {})
+def find_fingerprint() -> str:
+    # The definitions of a file depend on the lexer, and on the schema given to the names which are not qualified
+    return fingerprint(LEXER_VERSION, DEFINITIONS_FORMAT, settings().db_schema)
 
-    table = collection.get(dots.value, {})
 
-    for key, entry in dot_table.items():
-        entry = entry.__dict__
-        entry['timestamp'] = datetime.now().timestamp()
+def store_dot_definitions(session: storage.DatasetSession, dots: DDLObjectTypeSupported,
+                          dot_table: dict[str, DDLDefinitionRecord], manifest: FileManifest | None = None):
+    timestamp = datetime.now().timestamp()
 
-        table[key] = entry
+    if manifest is not None:
+        # Drop the definitions of the deleted files
+        session.write(storage.delete_definitions_of_files, dots, manifest.removed)
+        manifest.save(session, 'definitions', dots)
 
-    collection[dots.value] = table
-    ds['definitions'] = collection
-    storage.save_dataset(ds, ds_name)
+    session.write(storage.upsert_definitions, dots, {key: {**entry.as_entry(), "timestamp": timestamp}
+                                                     for key, entry in dot_table.items()})
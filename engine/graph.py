@@ -0,0 +1,106 @@
+import sqlite3
+from collections import deque
+from enum import Enum
+
+from engine import output
+from engine import profiling
+from engine import storage
+from engine.utils import DDLObjectTypeSupported
+
+
+class Direction(str, Enum):
+    UPSTREAM = "upstream"  # What the object depends on
+    DOWNSTREAM = "downstream"  # What depends on the object, i.e. what breaks if it's dropped
+    BOTH = "both"  # Only for queries, never cached
+
+
+def update_dependencies(conn: sqlite3.Connection, dots: DDLObjectTypeSupported) -> int:
+    """
+    Builds again the dependencies of `dots` from the definitions and the usages of the dataset, and drops the cached
+    closures the changed dependencies can affect.
+
+    An edge `a -> b` can only change the closures starting from `a` or `b`, or reaching any of them, so every other
+    closure is kept.
+
+    :return: the number of objects whose dependencies changed
+    """
+    graph = {}
+    for row in storage.attributed_dependencies(conn, dots):
+        graph.setdefault(row['key'], []).append(row['depends_on'])
+
+    stored = storage.load_dependencies(conn, dots)
+    changed = {key: graph.get(key, []) for key in graph.keys() | stored.keys()
+               if graph.get(key, []) != stored.get(key, [])}
+    if not changed:
+        return 0
+
+    nodes = set(changed)
+    for key, depends_on in changed.items():
+        nodes.update(set(depends_on).symmetric_difference(stored.get(key, [])))
+    invalidated = storage.invalidate_closures(conn, dots, nodes)
+    storage.replace_dependencies(conn, dots, changed)
+
+    profiling.count("closures invalidated", invalidated)
+    output.info(f"[INFO] 🕸️ Dependencies of {len(changed)} {dots.value} changed")
+    return len(changed)
+
+
+def store_dependencies(session: storage.DatasetSession, dots: DDLObjectTypeSupported):
+    # Runs last in the flush, once the definitions and the usages are written
+    session.write(update_dependencies, dots)
+
+
+class DependencyGraph(object):
+    """
+    Dependencies of the objects of a dataset table, stored as adjacency lists (`key -> depends on`).
+
+    Transitive closures are cached in the dataset and only computed (by a breadth-first walk of the whole graph) on a
+    miss, so the graph is only loaded when needed. The depth of a node is its distance from the queried object.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, dots: DDLObjectTypeSupported):
+        self.conn = conn
+        self.dots = dots
+        self._adjacency: dict[Direction, dict[str, list[str]]] = {}
+
+    def adjacency(self, direction: Direction) -> dict[str, list[str]]:
+        if direction not in self._adjacency:
+            with profiling.phase("dataset load"):
+                if Direction.UPSTREAM not in self._adjacency:
+                    self._adjacency[Direction.UPSTREAM] = storage.load_dependencies(self.conn, self.dots)
+
+                if direction == Direction.DOWNSTREAM:
+                    reverse = {}
+                    for key, depends_on in self._adjacency[Direction.UPSTREAM].items():
+                        for node in depends_on:
+                            reverse.setdefault(node, []).append(key)
+                    self._adjacency[Direction.DOWNSTREAM] = reverse
+        return self._adjacency[direction]
+
+    def resolve(self, name: str) -> list[str]:
+        # By schema-qualified or bare name
+        name = name.lower()
+        return [key for key in storage.definition_keys(self.conn, self.dots)
+                if key.lower() == name or key.lower().split(".", 1)[-1] == name]
+
+    def closure(self, key: str, direction: Direction) -> dict[str, int]:
+        closure = storage.load_closure(self.conn, self.dots, direction.value, key)
+        if closure is not None:
+            profiling.count("closure hits")
+            closure.pop(key, None)
+            return closure
+
+        profiling.count("closure misses")
+        adjacency = self.adjacency(direction)
+        closure, queue = {key: 0}, deque([key])
+        while queue:
+            node = queue.popleft()
+            for neighbour in adjacency.get(node, ()):
+                if neighbour not in closure:
+                    closure[neighbour] = closure[node] + 1
+                    queue.append(neighbour)
+
+        # Committed with the transaction of the caller
+        storage.save_closure(self.conn, self.dots, direction.value, key, closure)
+        closure.pop(key)
+        return closure
@@ -0,0 +1,195 @@
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from engine import graph
+from engine import lookup
+from engine import output
+from engine import profiling
+from engine import storage
+from engine.utils import DDLObjectTypeSupported, UsageTable
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+VERSION = 2
+ENTRY_SUFFIX = ".entry"
+
+# The writes an entry can hold, by name: the function, and how its first arguments are read back from JSON (`None`
+# keeps the value as it is). An entry is only data, it never names code to load
+OPERATIONS: dict[str, tuple[Callable, tuple]] = {
+    "upsert_definitions": (storage.upsert_definitions, (DDLObjectTypeSupported,)),
+    "delete_definitions_of_files": (storage.delete_definitions_of_files, (DDLObjectTypeSupported,)),
+    "delete_usages_of_files": (storage.delete_usages_of_files, (DDLObjectTypeSupported,)),
+    "save_manifest": (storage.save_manifest, (None, DDLObjectTypeSupported)),
+    "add_run_files": (storage.add_run_files, ()),
+    "write_usages": (lookup.write_usages, (DDLObjectTypeSupported, None, UsageTable.decode)),
+    "end_run": (lookup.end_run, ()),
+    "update_dependencies": (graph.update_dependencies, (DDLObjectTypeSupported,)),
+}
+_NAMES = {func: name for name, (func, _) in OPERATIONS.items()}
+
+
+def journal_path(ds_name: str) -> Path:
+    return storage.ds_filepath(ds_name, ".journal")
+
+
+def entries(ds_name: str) -> list[Path]:
+    # Named by creation time, so they are merged in the order they were written
+    try:
+        return sorted(path for path in journal_path(ds_name).iterdir() if path.name.endswith(ENTRY_SUFFIX))
+    except FileNotFoundError:
+        return []
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, UsageTable):
+        return value.encode()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Not a journal value: {type(value).__name__}")
+
+
+def encode(pending: list[tuple[Callable, tuple]]) -> str:
+    operations = []
+    for func, args in pending:
+        if func not in _NAMES:
+            raise ValueError(f"Not a journal operation: {func.__qualname__}")
+        operations.append([_NAMES[func], args])
+    return json.dumps({"version": VERSION, "pending": operations}, default=_encode)
+
+
+def decode(path: Path) -> list[tuple[Callable, tuple]]:
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            entry = json.load(fp)
+    except ValueError:
+        # Entries of previous versions were not JSON
+        entry = None
+    if not isinstance(entry, dict) or entry.get("version") != VERSION:
+        raise ValueError(f"Unsupported journal entry version: {path}")
+
+    pending = []
+    for name, args in entry["pending"]:
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown journal operation '{name}': {path}")
+        func, readers = OPERATIONS[name]
+        pending.append((func, (*(arg if read is None else read(arg) for read, arg in zip(readers, args)),
+                               *args[len(readers):])))
+    return pending
+
+
+def append(ds_name: str, pending: list[tuple[Callable, tuple]]) -> Path:
+    """
+    Writes the pending writes of a session as a new entry of the journal of the dataset.
+
+    The entry is written to a temporary file first, then renamed: the rename is atomic, so a merge never sees a partial
+    entry, and writers never wait for each other.
+    """
+    folder = journal_path(ds_name)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    name = f"{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex}"
+    tmp_path, entry_path = folder / f"{name}.tmp", folder / f"{name}{ENTRY_SUFFIX}"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        fp.write(encode(pending))
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, entry_path)
+    return entry_path
+
+
+@contextmanager
+def _merge_lock(ds_name: str, wait: bool) -> Iterator[bool]:
+    # Only one process merges the journal at a time, the others keep appending
+    folder = journal_path(ds_name)
+    folder.mkdir(parents=True, exist_ok=True)
+    with open(folder / ".lock", "a+b") as fp:
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fp.fileno(), fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+                else:
+                    fp.seek(0)
+                    msvcrt.locking(fp.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if not wait:
+                    yield False
+                    return
+                time.sleep(0.1)
+
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+            else:
+                fp.seek(0)
+                msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _merge(ds_name: str) -> int:
+    paths = entries(ds_name)
+    if not paths:
+        return 0
+
+    conn = storage.connect(ds_name)
+    try:
+        # An entry is recorded as merged in the same transaction as its writes, so an entry left behind by a merge
+        # which stopped before deleting it is never applied twice
+        merged = {row['entry'] for row in conn.execute("SELECT entry FROM journal")}
+        with profiling.phase("dataset save"), conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for path in paths:
+                if path.name in merged:
+                    continue
+                storage.apply(conn, decode(path))
+                conn.execute("INSERT INTO journal (entry) VALUES (?)", (path.name,))
+
+        for path in paths:
+            path.unlink(missing_ok=True)
+        with conn:
+            conn.executemany("DELETE FROM journal WHERE entry = ?", ((path.name,) for path in paths))
+    finally:
+        conn.close()
+
+    profiling.count("journal entries merged", len(paths))
+    return len(paths)
+
+
+def checkpoint(ds_name: str, wait: bool = True) -> int:
+    """
+    Folds every entry of the journal into the dataset, in a single transaction, then deletes them.
+
+    :param wait: wait for the merge of another process, otherwise leave the journal to it
+    :return: the number of entries merged
+    """
+    merged = 0
+    while True:
+        with _merge_lock(ds_name, wait) as locked:
+            if not locked:
+                return merged
+            merged += _merge(ds_name)
+
+        # An entry written while the lock was held, by a writer which could not take it, is merged now
+        if not entries(ds_name):
+            return merged
+        wait = False
+
+
+def write(ds_name: str, pending: list[tuple[Callable, tuple]]):
+    entry_path = append(ds_name, pending)
+    output.info(f"[INFO] 📝 Results were appended to the journal of dataset {ds_name}: {entry_path.name}")
+
+    merged = checkpoint(ds_name, wait=False)
+    if merged > 0:
+        output.info(f"[INFO] 💾 {merged} journal entries were merged into dataset {ds_name}")
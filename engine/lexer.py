@@ -0,0 +1,221 @@
+import re
+from array import array
+from typing import Iterator, NamedTuple
+
+from engine.utils import DDLObjectTypeSupported
+
+# Bumped when the tokens found change, so the results kept by the incremental manifests are not reused
+VERSION = 3
+
+# Comments, literals and quoted identifiers are consumed as a whole, so nothing inside them is ever seen as a word
+_SKIPPED = rb"""
+      (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<literal>[qQ]'(?:\[.*?\]|\{.*?\}|\(.*?\)|<.*?>|(?P<delimiter>.).*?(?P=delimiter))'|'(?:[^']|'')*(?:'|\Z))
+    | (?P<quoted>"[^"]*(?:"|\Z)|`[^`]*(?:`|\Z))
+"""
+
+# `CREATE [OR REPLACE] [modifiers] <kind> [BODY] [IF NOT EXISTS] <name>`
+_CREATE = rb"""
+    (?P<create>create\s+
+        (?:(?:or\s+replace|force|noforce|editionable|noneditionable|editioning|public|global|temporary|private|
+              materialized|secure|recursive|unlogged|temp)\s+)*
+        (?P<kind>view|table|synonym|procedure|function|package)\s+
+        (?:(?P<body>body)\s+)?
+        (?:if\s+not\s+exists\s+)?
+        (?P<name>[a-z_][\w$\#]*(?:\.[a-z_][\w$\#]*)*))
+"""
+
+# A statement ends with `;` (except inside a PL/SQL block) or with a `/` alone on its line
+_END = rb"""
+      (?P<semicolon>;)
+    | (?P<slash>^[ \t]*/[ \t\r]*$)
+"""
+
+# Every token of a file, used to find the definitions and the references in the same pass
+TOKENS = re.compile(_SKIPPED + b"|" + _CREATE + rb"""
+    | (?P<skip>\d[\w.]*|[:&@][\w$\#]+)
+    | (?P<word>[a-z_][\w$\#]*(?:\.[a-z_][\w$\#]*)*)
+    | """ + _END, re.VERBOSE | re.DOTALL | re.IGNORECASE | re.MULTILINE)
+WORD = TOKENS.groupindex["word"]
+
+# Definitions are searched on their own (the regex engine jumps straight to every `CREATE`), then only the text
+# before each one is lexed, to know whether it's inside a comment or a literal
+CREATE = re.compile(_CREATE, re.VERBOSE | re.IGNORECASE)
+SKIPPED = re.compile(_SKIPPED, re.VERBOSE | re.DOTALL)
+OPENERS = re.compile(rb"--|/\*|[qQ]'|['\"`]")
+# The end of a statement, or the next definition when it has none (the `CREATE` not being part of a word)
+ENDS = re.compile(rb"(?P<opener>--|/\*|[qQ]'|['\"`])|" + _END + rb"| (?<![\w$\#])" + _CREATE,
+                  re.VERBOSE | re.IGNORECASE | re.MULTILINE)
+WORD_CHARS = frozenset(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$#")
+
+KINDS = {
+    b"view": DDLObjectTypeSupported.views,
+    b"table": DDLObjectTypeSupported.tables,
+    b"synonym": DDLObjectTypeSupported.synonyms,
+    b"procedure": DDLObjectTypeSupported.procedures,
+    b"function": DDLObjectTypeSupported.functions,
+    b"package": DDLObjectTypeSupported.packages,
+}
+
+# Reserved words of SQL and PL/SQL, which can't name an object unless quoted (and quoted identifiers are skipped): they
+# are never references
+KEYWORDS = frozenset(b"""
+    all alter and any as asc begin between by case check connect create cursor declare default delete desc distinct
+    drop else elsif end exception exists for from function grant group having if in index insert intersect into is
+    like loop minus not null of on or order procedure prior select set start table then to trigger union unique update
+    values view when where while with
+""".split())
+
+# Kinds defined by a PL/SQL block, where `;` ends the inner statements and not the definition
+BLOCKS = frozenset({DDLObjectTypeSupported.procedures, DDLObjectTypeSupported.functions,
+                    DDLObjectTypeSupported.packages})
+
+
+class Definition(NamedTuple):
+    dots: DDLObjectTypeSupported
+    name: bytes  # Lowered, schema-qualified or not
+    offset: int
+    end: int = -1  # Offset of the last byte of its statement
+
+
+class Reference(NamedTuple):
+    name: bytes  # Lowered, schema-qualified or not, with the trailing parts (e.g. a column) already dropped
+    offset: int
+
+
+def _definition(matching: re.Match) -> Definition | None:
+    # A `PACKAGE BODY` is the implementation of a package already defined by its spec
+    if matching.group("body") is not None:
+        return None
+    return Definition(KINDS[matching.group("kind").lower()], matching.group("name").lower(), matching.start("name"))
+
+
+def _statement_end(data: bytes, pos: int, block: bool) -> int:
+    # Offset of the last byte of the statement going on at `pos` (which is outside of any comment or literal): its
+    # terminator, or the byte before the next definition (or the end of the data) when it has none
+    while (matching := ENDS.search(data, pos)) is not None:
+        group = matching.lastgroup
+        if group == "opener":
+            if matching.group() in (b"q'", b"Q'") and data[matching.start() - 1] in WORD_CHARS:
+                pos = matching.start() + 1
+                continue
+            skipped = SKIPPED.match(data, matching.start())
+            pos = skipped.end() if skipped is not None else matching.end()
+        elif group == "semicolon" and block:
+            pos = matching.end()
+        elif group in ("semicolon", "slash"):
+            return matching.end() - 1
+        else:
+            return matching.start() - 1
+    return len(data) - 1
+
+
+def definitions(data: bytes) -> Iterator[Definition]:
+    """
+    Every object created in SQL source (any kind), in the file order. Comments, string literals and quoted identifiers
+    are skipped.
+    """
+    pos = 0  # Everything before `pos` was lexed, and is outside of any comment or literal
+    for matching in CREATE.finditer(data):
+        start = matching.start()
+        if start < pos or (start > 0 and data[start - 1] in WORD_CHARS):
+            continue
+
+        # Skips the comments and literals up to the definition, or finds the one holding it
+        while True:
+            opener = OPENERS.search(data, pos, start)
+            if opener is None:
+                pos = start
+                break
+            if opener.group() in (b"q'", b"Q'") and opener.start() > 0 and data[opener.start() - 1] in WORD_CHARS:
+                # `q` ending a word, e.g. `seq'`: only the quote opens a literal
+                pos = opener.start() + 1
+                continue
+
+            skipped = SKIPPED.match(data, opener.start())
+            pos = skipped.end() if skipped is not None else opener.end()
+            if pos > start:
+                break
+
+        if pos == start:
+            definition = _definition(matching)
+            if definition is not None:
+                end = _statement_end(data, matching.end(), definition.dots in BLOCKS)
+                yield definition._replace(end=end)
+                pos = end + 1
+
+
+def offset_typecode(size: int) -> str:
+    # Offsets of data smaller than 4 GB fit in 4 bytes
+    return "I" if size <= 0xFFFFFFFF else "Q"
+
+
+def reference_name(word: bytes) -> bytes:
+    # `schema.object.column`: only the object part is a name
+    return word if word.count(b".") < 2 else b".".join(word.split(b".", 2)[:2])
+
+
+def scan(data: bytes) -> Iterator[Definition | Reference]:
+    """
+    Single pass over SQL source: yields every word used as a name anywhere, and the definition of every object created
+    (any kind) once its statement ended, all in the file order.
+
+    Comments, string literals and quoted identifiers are skipped, and the name of a definition (or of a package body)
+    is never yielded as a reference.
+    """
+    pending = None  # The definition whose statement goes on
+    for matching in TOKENS.finditer(data):
+        group = matching.lastgroup
+        if group == "word":
+            word = matching.group("word").lower()
+            if word not in KEYWORDS:
+                yield Reference(reference_name(word), matching.start())
+        elif pending is None:
+            if group == "create":
+                pending = _definition(matching)
+        elif group == "create":
+            yield pending._replace(end=matching.start() - 1)
+            pending = _definition(matching)
+        elif group == "slash" or (group == "semicolon" and pending.dots not in BLOCKS):
+            yield pending._replace(end=matching.end() - 1)
+            pending = None
+    if pending is not None:
+        yield pending._replace(end=len(data) - 1)
+
+
+def index(data: bytes) -> tuple[list[Definition], dict[bytes, array]]:
+    """
+    Same tokens as `scan`, grouped: the definitions in the file order, and the offsets of every distinct reference
+    (in the file order too).
+    """
+    found: list[Definition] = []
+    references: dict[bytes, array] = {}
+    get = references.get
+    typecode = offset_typecode(len(data))
+    pending = None
+    # Inlined, since it runs for every word of every file
+    for matching in TOKENS.finditer(data):
+        lastindex = matching.lastindex
+        if lastindex == WORD:
+            word = matching.group(WORD).lower()
+            if b"." in word and word.count(b".") > 1:
+                word = reference_name(word)
+            elif word in KEYWORDS:
+                continue
+            offsets = get(word)
+            if offsets is None:
+                offsets = references[word] = array(typecode)
+            offsets.append(matching.start())
+            continue
+
+        group = matching.lastgroup
+        if group == "create":
+            if pending is not None:
+                found.append(pending._replace(end=matching.start() - 1))
+            pending = _definition(matching)
+        elif pending is not None and (group == "slash" or (group == "semicolon" and pending.dots not in BLOCKS)):
+            found.append(pending._replace(end=matching.end() - 1))
+            pending = None
+    if pending is not None:
+        found.append(pending._replace(end=len(data) - 1))
+    return found, references
@@ -1,94 +1,325 @@
-import re
+import sqlite3
+import time
 from datetime import datetime
+from functools import lru_cache
+from itertools import tee
 from pathlib import Path
-from typing import Any
-
-from typer import echo
+from typing import Iterable, Iterator, List
 
+from engine import output
+from engine import profiling
 from engine import storage
-from engine.utils import DDLObjectTypeSupported
+from engine.archive import release
+from engine.configuration import ConfPolicy
+from engine.configuration import settings
+from engine.errors import EmptyDefinitionTableError
+from engine.errors import InvalidNameError
+from engine.lexer import VERSION as LEXER_VERSION
+from engine.lexer import KEYWORDS
+from engine.lexer import TOKENS
+from engine.lexer import WORD
+from engine.lexer import reference_name
+from engine.manifest import FileManifest
+from engine.manifest import fingerprint
+from engine.manifest import map_files_incremental
+from engine.parallel import map_files
+from engine.source import open_source
+from engine.utils import DDLObjectTypeSupported, LineCounter, UsageTable
 
+# Bumped when the form of the usages kept by the incremental manifests changes
+USAGES_FORMAT = 2
 
-class DDLObjectTypeRegexBuilder:
-    @staticmethod
-    def views(name: str) -> re.Pattern:
-        parts = name.split(".", 1)
 
-        if len(parts) == 2 and "." in parts[1]:
-            raise ValueError(f"This view name is invalid: {name}")
+class DDLObjectTypeMatcher:
+    """
+    Matches every name of a definition table against the references found by the lexer, in a single pass.
 
-        if len(parts) == 1:
-            return re.compile(r"\s+" + re.escape(name) + r"(?:\s+|($)?)", re.IGNORECASE | re.VERBOSE)
-        else:
-            return re.compile(r"\s+((?:" + re.escape(parts[0]) + r"\.)?" + re.escape(parts[1]) + r")(?:\s+|($)?)",
-                              re.IGNORECASE | re.VERBOSE)
+    Schema-qualified names are also indexed by their bare name, so both `schema.name` and `name` are found. Only whole
+    names match: a name is never found as the prefix of a longer one, nor inside comments, literals or definitions, and
+    a reserved word is never a name.
+    """
 
+    def __init__(self, names: Iterable[str]):
+        self.names: dict[bytes, list[str]] = {}
 
-def lookup_dot_usages_from_file(dots: DDLObjectTypeSupported, do_name: str, ds_name: str, src_file: Path):
-    # Check if the given dataset name exists!
-    if not storage.exists(ds_name):
-        raise FileNotFoundError(f"Given dataset name is not valid, does not exist: {ds_name}")
-    else:
-        ds = storage.load_dataset(ds_name)
+        for name in names:
+            parts = name.split(".", 1)
+            if len(parts) == 2 and "." in parts[1]:
+                raise InvalidNameError(f"This name is invalid: {name}")
+
+            self._index(name.lower().encode(), name)
+            if len(parts) == 2:
+                self._index(parts[1].lower().encode(), name)
+
+        profiling.count("patterns compiled")
+
+    def _index(self, key: bytes, name: str):
+        if key in KEYWORDS:
+            return
+        names = self.names.setdefault(key, [])
+        if name not in names:
+            names.append(name)
+
+    def finditer(self, data: bytes) -> Iterator[tuple[str, int]]:
+        # Same tokens as `lexer.scan`, inlined since it runs for every word of every file
+        get = self.names.get
+        for matching in TOKENS.finditer(data):
+            if matching.lastindex != WORD:
+                continue
 
+            word = matching.group(WORD).lower()
+            found = get(word)
+            if found is None and b"." in word:
+                # `schema.object.column` or `object.column`
+                found = get(reference_name(word)) if word.count(b".") > 1 else None
+                if found is None:
+                    found = get(word.split(b".", 1)[0])
+            if found is not None:
+                for name in found:
+                    yield name, matching.start()
+
+    def find(self, reference: bytes) -> list[str] | None:
+        # A reference already reduced by `lexer.reference_name`: `schema.object` or `object.column`, then `object`
+        found = self.names.get(reference)
+        if found is None and b"." in reference:
+            found = self.names.get(reference.split(b".", 1)[0])
+        return found
+
+
+@lru_cache(maxsize=8)
+def build_matcher(names: tuple[str, ...]) -> DDLObjectTypeMatcher:
+    # Every kind of object is referenced the same way, a table is compiled once per process
+    return DDLObjectTypeMatcher(names)
+
+
+def lookup_table(session: storage.DatasetSession, dots: DDLObjectTypeSupported, do_name: str) -> list[str]:
     if do_name != "*":
         # DDL Object name is the one given by parameter
-        table = [do_name]
+        return [do_name]
+
+    # Loads the given DDL Object Type definition table from the dataset, then use the keys
+    table = session.definition_keys(dots)
+    if len(table) == 0:
+        raise EmptyDefinitionTableError(
+            "DDL Type object definition table is empty, please first run: `app find <dots> <input path>`")
+    return table
+
+
+def lookup_dot_usages_from_file(dots: DDLObjectTypeSupported, table: tuple[str, ...], src_file: Path) -> UsageTable:
+    output.detail(f"[INFO] 🔍 Looking up usages of {len(table)} {dots.value} in {src_file.absolute()}")
+
+    # The whole table is compiled once and matched in a single pass
+    matcher = build_matcher(table)
+
+    usage_records = UsageTable()
+    path_id = usage_records.add_file(str(src_file.absolute()), datetime.now().timestamp())
+    # The file is never loaded as a whole, the lexer runs over its memory map
+    with open_source(src_file) as data:
+        lines = LineCounter(data)
+        for name, offset in matcher.finditer(data):
+            line, column = lines.position(offset)
+            output.detail(f"[INFO] ✅ New usage entry found for '{name}' at line: {line}")
+            usage_records.add(name, path_id, line, column)
+
+    output.detail(f"[INFO] {'-' * 80}")
+
+    # Keep the order of the definition table
+    return usage_records.ordered(table)
+
+
+def scan_dot_usages_from_files(dots: DDLObjectTypeSupported, table: List[str], src_filepaths: Iterable[Path],
+                               jobs: int = 1, manifest: FileManifest | None = None) -> Iterator[tuple[Path, dict]]:
+    # The table is sent once to every worker, files are scanned in parallel (as soon as they are found) but yielded in
+    # the files order
+    shared = (dots, tuple(table))
+    src_filepaths, call_filepaths = tee(src_filepaths)
+    if manifest is None:
+        scans = map_files(lookup_dot_usages_from_file, ((src_file,) for src_file in call_filepaths), jobs,
+                          shared=shared)
     else:
-        # Loads the given DDL Object Type definition table from the dataset, then use the keys
-        table = list(ds.get('definitions', {}).get(dots.value, {}).keys())
-        if len(table) == 0:
-            echo("[WARNING] ⚠️ DDL Type object definition table is empty, please first run: `app find <dots> <input path>`")
-            exit(1)
-
-    with open(src_file, "r") as fp:
-        data = fp.read()
-
-    usage_records = {}
-    for name in table:
-        echo(f"[INFO] 🔍 Looking up usages of {dots.value} '{name}' in {src_file.absolute()}")
-
-        # Check only DDL object names (views, but can be extended to any other)
-        regex = getattr(DDLObjectTypeRegexBuilder, dots.value)
-        if not regex:
-            raise ValueError(f"Unsupported DOTS for Regex Builder: {dots.value}")
-
-        regex = regex(name)
-        for matching in regex.finditer(data):
-            entry = {"filepath": str(src_file.absolute()), "line": data.count('\n', 0, matching.start()) + 1,
-                     "timestamp": datetime.now().timestamp()}
-            echo(f"[INFO] ✅ New usage entry found at line: {entry['line']}")
-            if name not in usage_records:
-                usage_records[name] = [entry]
-            else:
-                usage_records[name].append(entry)
-        else:
-            echo(f"[INFO] {'-' * 80}")
-    return usage_records
+        scans = map_files_incremental(manifest, lookup_dot_usages_from_file, call_filepaths, jobs, shared=shared,
+                                      encode=UsageTable.encode, decode=UsageTable.decode)
+    return release(zip(src_filepaths, scans, strict=True))
+
+
+def lookup_dot_usages_from_files(dots: DDLObjectTypeSupported, table: List[str], src_filepaths: Iterable[Path],
+                                 jobs: int = 1, manifest: FileManifest | None = None) -> dict[Path, UsageTable]:
+    return collect_dot_usages(dots, table, scan_dot_usages_from_files(dots, table, src_filepaths, jobs, manifest))
+
+
+def collect_dot_usages(dots: DDLObjectTypeSupported, table: List[str],
+                       scans: Iterable[tuple[Path, UsageTable]]) -> dict[Path, UsageTable]:
+    return dict(stream_dot_usages(dots, table, scans))
 
 
-def store_dot_usages(ds_name: str, dots: DDLObjectTypeSupported, records: dict[str, dict[str, Any]]):
-    ds = storage.load_dataset(ds_name)
+def stream_dot_usages(dots: DDLObjectTypeSupported, table: List[str],
+                      scans: Iterable[tuple[Path, UsageTable]]) -> Iterator[tuple[Path, UsageTable]]:
+    # The usages of every file are handed on as soon as it's scanned, only the counters are kept
+    output.progress_start(f"lookup {dots.value}")
+    files, matches = 0, 0
+    with profiling.phase("scan"):
+        for src_file, usage_records in scans:
+            found = sum(len(usages) for usages in usage_records.values())
+            files += 1
+            matches += found
+            output.progress(src_file, found)
+            yield src_file, usage_records
+    profiling.count("matches", matches)
 
-    collection = ds.get('usages', {})
+    output.info(f"[INFO] ✅ {matches} usages of {len(table)} {dots.value} found in {files} files")
 
-    generation = collection.get('generation', 0) + 1
 
-    table = collection.get(dots.value, {})
+def lookup_fingerprint(table: List[str]) -> str:
+    # The usages of a file depend on the names looked up, not on their order
+    return fingerprint(LEXER_VERSION, USAGES_FORMAT, sorted(table))
 
-    # Create and formalize the usage table
-    usage_table = {}
-    for filepath, dot_tables in records.items():
-        for dot_name, usages in dot_tables.items():
-            if dot_name not in usage_table:
-                usage_table[dot_name] = []
-            usage_table[dot_name] += [{**usage, "generation": generation} for usage in usages]
 
-    table.update(usage_table)
-    collection[dots.value] = table
-    collection['generation'] = generation
-    ds['usages'] = collection
+def run_fingerprint(table: List[str], src_input_path: Path, src_file_patterns: List[str], excludes: Iterable[str],
+                    use_ignore_files: bool) -> str:
+    # An interrupted lookup is only resumed by the same lookup: same names, same files
+    return fingerprint(lookup_fingerprint(table), str(src_input_path.absolute()), src_file_patterns, sorted(excludes),
+                       use_ignore_files)
 
 
-    storage.save_dataset(ds, ds_name)
-    echo(f"[INFO] 💾 New lookup result was stored with generation {generation}")
+def store_dot_usages(session: storage.DatasetSession, dots: DDLObjectTypeSupported,
+                     records: dict[Path, UsageTable], manifest: FileManifest | None = None,
+                     names: List[str] | None = None):
+    """
+    Stores the usages found by a lookup as a new generation, following the `policy.retention` configuration.
+
+    :param names: names looked up, when they are not the whole definition table: only their usages are replaced
+    """
+    retention = settings().policy_retention
+
+    if retention == ConfPolicy.Retention.LATEST.value and manifest is not None:
+        # The usages of the unchanged files are already stored
+        records = {src_file: usages for src_file, usages in records.items()
+                   if str(src_file.absolute()) in manifest.updated}
+
+    # The usages of every file are merged in a single table, each path is kept once
+    usage_table = UsageTable()
+    for file_usages in records.values():
+        usage_table.update(file_usages)
+
+    if manifest is not None:
+        # Drop the usages of the deleted files
+        session.write(storage.delete_usages_of_files, dots, manifest.removed)
+        manifest.save(session, 'usages', dots)
+
+    session.write(write_usages, dots, [str(src_file.absolute()) for src_file in records], usage_table, names,
+                  retention, settings().retention_generations)
+
+
+def write_usages(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, filepaths: List[str],
+                 usage_table: UsageTable, names: List[str] | None, retention: str, generations: int,
+                 run: tuple[str, str] | None = None):
+    # The generation is taken in the transaction which writes it, so concurrent writers never get the same one. Every
+    # batch of a run (id, fingerprint) gets the generation of its first one
+    if run is None:
+        generation = storage.get_meta(conn, 'usages.generation', 0) + 1
+        storage.set_meta(conn, 'usages.generation', generation)
+    else:
+        generation = storage.run_generation(conn, run[0], dots, run[1])
+    usage_table.generation = generation
+
+    match retention:
+        case ConfPolicy.Retention.GENERATIONS.value:
+            # Every lookup is kept as a whole, until it's older than the last N generations
+            storage.insert_usages(conn, dots, usage_table)
+            storage.prune_usages(conn, dots, generation - generations + 1, names)
+        case _:
+            # A file looked up again replaces its usages
+            storage.replace_usages_of_files(conn, dots, filepaths, usage_table, names)
+
+    if run is None:
+        output.info(f"[INFO] 💾 New lookup result was stored with generation {generation}")
+    elif filepaths:
+        output.detail(f"[INFO] 💾 Usages of {len(filepaths)} files were stored with generation {generation}")
+
+
+def end_run(conn: sqlite3.Connection, run_id: str):
+    generation = storage.end_run(conn, run_id)
+    output.info(f"[INFO] 💾 New lookup result was stored with generation {generation}")
+
+
+class UsageWriter(object):
+    """
+    Stores the usages of a lookup by batches, while the files are still scanned: a batch is written (in a transaction
+    of its own, or a journal entry) every `lookup.batch.usages` usages or `lookup.batch.seconds` seconds, so only the
+    usages of the current batch are kept in memory.
+
+    Every batch of the run gets the generation taken by the first one, and records its files: an interrupted run is
+    resumed by skipping them (see `storage.load_run`). The last batch, written by `close`, ends the run.
+    """
+
+    def __init__(self, session: storage.DatasetSession, dots: DDLObjectTypeSupported, run_id: str, run_fingerprint: str,
+                 manifest: FileManifest | None = None, names: List[str] | None = None):
+        self.session = session
+        self.dots = dots
+        self.run = (run_id, run_fingerprint)
+        self.manifest = manifest
+        self.names = names
+        conf = settings()
+        self.retention, self.generations = conf.policy_retention, conf.retention_generations
+        self.batch_usages, self.batch_seconds = conf.lookup_batch_usages, conf.lookup_batch_seconds
+
+        self.pending: dict[Path, UsageTable] = {}
+        self.size = 0
+        self.started = time.monotonic()
+        self.usage_table: UsageTable | None = None
+
+    @property
+    def generation(self) -> int | None:
+        # Known once a batch is committed, journaled batches get it once merged
+        return None if self.usage_table is None else self.usage_table.generation
+
+    def add(self, src_file: Path, usage_records: UsageTable) -> dict[Path, UsageTable] | None:
+        """
+        :return: the usages of the batch written, if the file completed one
+        """
+        self.pending[src_file] = usage_records
+        # A file without usages still counts, its path is stored
+        self.size += max(1, sum(len(usages) for usages in usage_records.values()))
+        if self.size >= self.batch_usages or time.monotonic() - self.started >= self.batch_seconds:
+            batch = self._write(final=False)
+            self.session.flush()
+            if self.manifest is not None:
+                # Saved with the batch
+                self.manifest.updated.clear()
+                self.manifest.reset = False
+            return batch
+        return None
+
+    def close(self) -> dict[Path, UsageTable]:
+        """
+        Queues the last batch in the session, which ends the run once flushed.
+
+        :return: the usages of the last batch
+        """
+        return self._write(final=True)
+
+    def _write(self, final: bool) -> dict[Path, UsageTable]:
+        batch, self.pending, self.size, self.started = self.pending, {}, 0, time.monotonic()
+        records = batch
+        if self.retention == ConfPolicy.Retention.LATEST.value and self.manifest is not None:
+            # The usages of the unchanged files are already stored
+            records = {src_file: usages for src_file, usages in batch.items()
+                       if str(src_file.absolute()) in self.manifest.updated}
+
+        self.usage_table = UsageTable()
+        for file_usages in records.values():
+            self.usage_table.update(file_usages)
+
+        if self.manifest is not None:
+            if final:
+                # Drop the usages of the deleted files
+                self.session.write(storage.delete_usages_of_files, self.dots, self.manifest.removed)
+            self.manifest.save(self.session, 'usages', self.dots)
+
+        self.session.write(write_usages, self.dots, [str(src_file.absolute()) for src_file in records],
+                           self.usage_table, self.names, self.retention, self.generations, self.run)
+        if final:
+            self.session.write(end_run, self.run[0])
+        else:
+            self.session.write(storage.add_run_files, self.run[0], [str(src_file.absolute()) for src_file in batch])
+        return batch
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import sqlite3
+from collections import deque
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Iterable, Iterator, List
+
+from engine import output
+from engine import source
+from engine import storage
+from engine.archive import split_member
+from engine.parallel import map_files
+from engine.utils import DDLObjectTypeSupported
+
+
+def file_digest(src_file: Path) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with src_file.open("rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(*values: Any) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+class FileManifest(object):
+    """
+    Scanned files of a dataset table (path, size, mtime and content hash) with the records each file produced.
+
+    It is stored in the `manifest` collection of the dataset. The `fingerprint` identifies everything else the
+    records depend on (e.g. the definition table of a lookup), if it changes nothing can be reused.
+    """
+
+    def __init__(self, files: dict[str, dict] | None = None, fingerprint: str | None = None, reset: bool = False):
+        self.files = files if files is not None else {}
+        self.fingerprint = fingerprint
+        self.reset = reset
+        self.updated = set()
+        self.removed = set()
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, collection_name: str, dots: DDLObjectTypeSupported,
+             fingerprint: str | None = None) -> 'FileManifest':
+        stored_fingerprint, files = storage.load_manifest(conn, collection_name, dots)
+        if stored_fingerprint != fingerprint:
+            return cls({}, fingerprint, reset=True)
+        return cls(files, fingerprint)
+
+    def save(self, session: storage.DatasetSession, collection_name: str, dots: DDLObjectTypeSupported):
+        # Queued as the manifest is now: only the updated and removed files are written
+        session.write(storage.save_manifest, collection_name, dots, self.fingerprint,
+                      {filepath: self.files[filepath] for filepath in self.updated if filepath in self.files},
+                      sorted(self.removed), self.reset)
+
+    def cached(self, filepath: str, stat: os.stat_result) -> dict | None:
+        entry = self.files.get(filepath)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry
+        return None
+
+    def update(self, filepath: str, stat: os.stat_result, digest: str, records: Any, encoding: str | None = None):
+        self.files[filepath] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": digest, "records": records,
+                                "encoding": encoding}
+        self.updated.add(filepath)
+
+    def prune(self, src_input_path: Path, src_file_patterns: List[str], filepaths: Iterable[str]):
+        # Files under the scanned path which match the patterns, but were not found anymore (`filepaths` are the
+        # absolute paths found), were deleted
+        root = src_input_path.absolute()
+        seen = set(filepaths)
+        for filepath in list(self.files.keys()):
+            if filepath in seen:
+                continue
+
+            # The members of an archive are under the archive
+            parts = split_member(filepath)
+            if parts is not None:
+                if parts[0] != str(root):
+                    continue
+                relative = PurePosixPath(parts[1])
+            else:
+                path = Path(filepath)
+                if not path.is_relative_to(root):
+                    continue
+                relative = path.relative_to(root)
+            if any(relative.match(pattern) for pattern in src_file_patterns):
+                del self.files[filepath]
+                self.removed.add(filepath)
+
+
+def _scan_changed_file(func: Callable, shared: tuple, src_file: Path, expected_digest: str | None,
+                       args: tuple) -> tuple[str, str | None, Any]:
+    digest = file_digest(src_file)
+    if digest == expected_digest:
+        # Only the metadata changed, the previous records are still valid
+        return digest, None, None
+    records = func(*shared, *args)
+    # The encoding detected by the scan is kept with its records
+    return digest, source.last_encoding(), records
+
+
+def map_files_incremental(manifest: FileManifest, func: Callable, src_filepaths: Iterable[Path], jobs: int = 1,
+                          shared: tuple = (), encode: Callable = lambda records: records,
+                          decode: Callable = lambda records: records) -> Iterator[Any]:
+    """
+    Same as `map_files` (calling `func(*shared, src_file)`), but reuses the records of the manifest for the files which
+    did not change.
+
+    A file is unchanged if its size and mtime are the same, otherwise it is hashed and only rescanned if its content
+    changed. The manifest is updated with the records of the rescanned files.
+
+    :param encode: converts the records of `func` into the JSON manifest form
+    :param decode: converts the records of the manifest back into the `func` form
+    """
+    # Files checked as they are sent to `map_files`, and not handed yet
+    checked = deque()
+
+    def calls() -> Iterator[tuple | None]:
+        for src_file in src_filepaths:
+            filepath = str(src_file.absolute())
+            stat = src_file.stat()
+
+            entry = manifest.files.get(filepath)
+            changed = manifest.cached(filepath, stat) is None
+            checked.append((filepath, stat, changed))
+            # Unchanged files are not sent to the workers
+            yield (src_file, entry['hash'] if entry else None, (src_file,)) if changed else None
+
+    reused = 0
+    for scan in map_files(_scan_changed_file, calls(), jobs, shared=(func, shared)):
+        filepath, stat, changed = checked.popleft()
+        if changed:
+            digest, encoding, records = scan
+            if records is not None:
+                manifest.update(filepath, stat, digest, encode(records), encoding)
+                yield records
+                continue
+            entry = manifest.files[filepath]
+            manifest.update(filepath, stat, digest, entry['records'], entry.get('encoding'))
+
+        reused += 1
+        yield decode(manifest.files[filepath]['records'])
+
+    output.info(f"[INFO] ♻️ {reused} unchanged files reused the results of the previous scan")
@@ -0,0 +1,148 @@
+import atexit
+import json
+import sys
+import time
+from enum import IntEnum
+from pathlib import Path
+from typing import TextIO
+
+from engine import profiling
+
+
+class Verbosity(IntEnum):
+    QUIET = 0  # Errors only
+    NORMAL = 1  # Errors, warnings and summaries
+    VERBOSE = 2  # Everything, including an entry for every file and every match
+
+
+class ProgressStream(object):
+    """
+    Machine-readable progress of a scan: JSON lines with the files, bytes and matches processed and their rates.
+    """
+
+    def __init__(self, fp: TextIO, interval: float = 1.0):
+        self.fp = fp
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.emitted = self.started
+        self.command = None
+        self.files = 0
+        self.bytes = 0
+        self.matches = 0
+
+    def start(self, command: str):
+        self.command = command
+        self.started = self.emitted = time.perf_counter()
+        self.files = self.bytes = self.matches = 0
+        self.emit("start")
+
+    def update(self, files: int, size: int, matches: int):
+        self.files += files
+        self.bytes += size
+        self.matches += matches
+
+        now = time.perf_counter()
+        if now - self.emitted >= self.interval:
+            self.emitted = now
+            self.emit("progress")
+
+    def emit(self, event: str):
+        elapsed = time.perf_counter() - self.started
+        self.fp.write(json.dumps({
+            "event": event, "command": self.command, "elapsed": round(elapsed, 3),
+            "files": self.files, "bytes": self.bytes, "matches": self.matches,
+            "files_per_s": round(self.files / elapsed, 3) if elapsed > 0 else 0.0,
+            "bytes_per_s": round(self.bytes / elapsed, 3) if elapsed > 0 else 0.0}) + "\n")
+        self.fp.flush()
+
+    def close(self):
+        self.emit("end")
+        if self.fp is not sys.stderr:
+            self.fp.close()
+
+
+class Output(object):
+    """
+    Console output of the app, filtered by verbosity and written by blocks instead of line by line.
+    """
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, verbosity: Verbosity = Verbosity.NORMAL):
+        self.verbosity = verbosity
+        self.buffer = []
+        self.buffered = 0
+        self.progress_stream: ProgressStream | None = None
+
+    def write(self, text: str):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        with profiling.phase("output"):
+            if self.buffer:
+                sys.stdout.write("".join(self.buffer))
+                self.buffer.clear()
+                self.buffered = 0
+            sys.stdout.flush()
+
+
+_output = Output()
+atexit.register(lambda: _output.flush())
+
+
+def setup(verbosity: Verbosity = Verbosity.NORMAL, progress: Path | None = None):
+    _output.verbosity = verbosity
+    if progress is not None:
+        fp = sys.stderr if str(progress) == "-" else open(progress, "w", encoding="utf-8")
+        _output.progress_stream = ProgressStream(fp)
+        atexit.register(_output.progress_stream.close)
+
+
+def verbosity() -> Verbosity:
+    return _output.verbosity
+
+
+def is_verbose() -> bool:
+    return _output.verbosity >= Verbosity.VERBOSE
+
+
+def error(message: str):
+    _output.write(message + "\n")
+    _output.flush()
+
+
+def warning(message: str):
+    if _output.verbosity >= Verbosity.NORMAL:
+        _output.write(message + "\n")
+
+
+def info(message: str):
+    if _output.verbosity >= Verbosity.NORMAL:
+        _output.write(message + "\n")
+
+
+def detail(message: str):
+    # Events for every file or match, only shown on verbose mode
+    if _output.verbosity >= Verbosity.VERBOSE:
+        _output.write(message + "\n")
+
+
+def raw(text: str):
+    # Already filtered output, e.g. replayed from a worker process
+    _output.write(text)
+
+
+def flush():
+    _output.flush()
+
+
+def progress_start(command: str):
+    if _output.progress_stream is not None:
+        _output.progress_stream.start(command)
+
+
+def progress(src_file: Path, matches: int):
+    if _output.progress_stream is not None:
+        _output.progress_stream.update(1, src_file.stat().st_size, matches)
@@ -0,0 +1,116 @@
+import io
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import redirect_stdout
+from itertools import chain, islice
+from typing import Any, Callable, Iterable, Iterator
+
+from engine import configuration
+from engine import output
+from engine import profiling
+
+
+def cpu_jobs(jobs: int) -> int:
+    # 0 means: use every CPU core
+    return jobs if jobs > 0 else (os.cpu_count() or 1)
+
+
+# Arguments shared by every call of a worker, sent only once when the worker starts
+_shared: tuple = ()
+
+
+def _init_worker(snapshot: configuration.Settings, verbosity: output.Verbosity, profile: bool, shared: tuple):
+    global _shared
+    # Workers get the settings of the parent process, instead of reading the configuration file again
+    configuration.install_settings(snapshot)
+    output.setup(verbosity)
+    if profile:
+        profiling.enable()
+    _shared = shared
+
+
+def _run_captured(func: Callable, args: tuple) -> tuple[Any, str, dict | None]:
+    # The console output (and the profile) of a worker is kept and replayed by the parent, in the order of a serial run
+    buffer = io.StringIO()
+    try:
+        with redirect_stdout(buffer):
+            try:
+                result = func(*_shared, *args)
+            finally:
+                output.flush()
+    except SystemExit as e:
+        result = SystemExit(e.code)
+    return result, buffer.getvalue(), profiling.take()
+
+
+def _run_chunk(func: Callable, chunk: list[tuple | None]) -> list[tuple[Any, str, dict | None]]:
+    return [(None, "", None) if args is None else _run_captured(func, args) for args in chunk]
+
+
+def _chunks(calls: Iterable[tuple | None], window: int, limit: int = 64) -> Iterator[list[tuple | None]]:
+    # Small files are sent by chunks to save the round trips with the workers. Without knowing the number of calls
+    # ahead, the chunks grow by one call every `window` chunks (up to `limit`), so a short run is still spread over
+    # every worker, and a few large files are never sent together
+    chunk, sent = [], 0
+    for args in calls:
+        chunk.append(args)
+        if len(chunk) >= min(limit, 1 + sent // window):
+            yield chunk
+            chunk, sent = [], sent + 1
+    if chunk:
+        yield chunk
+
+
+def map_files(func: Callable, calls: Iterable[tuple | None], jobs: int = 1, shared: tuple = ()) -> Iterator[Any]:
+    """
+    Runs `func(*shared, *args)` for every args of `calls`, yielding the results in the given order.
+
+    :param func: per-file function, must be importable by the worker processes
+    :param calls: arguments for every call, read as the calls are sent to the workers. A `None` call yields `None`
+        without running anything
+    :param jobs: number of processes, 1 runs in this process and 0 uses every CPU core
+    :param shared: first arguments of every call, sent only once to each worker (e.g. a large name table)
+    :return: the results in the same order as `calls`, at most `jobs * 4` chunks of them are computed ahead of the
+        consumer, so they don't pile up in memory while it stores them
+    """
+    jobs = cpu_jobs(jobs)
+    if jobs == 1:
+        for args in calls:
+            yield None if args is None else func(*shared, *args)
+        return
+
+    calls = iter(calls)
+    head = list(islice(calls, jobs))
+    if not head:
+        return
+
+    # Nothing buffered must be inherited by the workers
+    output.flush()
+    with ProcessPoolExecutor(max_workers=len(head), initializer=_init_worker,
+                             initargs=(configuration.settings(), output.verbosity(), profiling.enabled(),
+                                       shared)) as executor:
+        def submit(chunk: list[tuple | None]) -> Future | list:
+            # A chunk without anything to run is never sent
+            if all(args is None for args in chunk):
+                return [(None, "", None)] * len(chunk)
+            return executor.submit(_run_chunk, func, chunk)
+
+        chunks = _chunks(chain(head, calls), jobs * 4)
+        running = deque(submit(chunk) for _, chunk in zip(range(jobs * 4), chunks))
+        while running:
+            done = running.popleft()
+            results = done if isinstance(done, list) else done.result()
+            # The next chunk is sent before the results are handed, so the workers never wait for the consumer
+            chunk = next(chunks, None)
+            if chunk is not None:
+                running.append(submit(chunk))
+
+            for result, text, profile in results:
+                profiling.merge(profile)
+                if text:
+                    output.raw(text)
+                if isinstance(result, SystemExit):
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise result
+                yield result
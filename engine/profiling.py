@@ -0,0 +1,146 @@
+import cProfile
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Iterable, Iterator, TextIO
+
+
+class Profiler(object):
+    """
+    Wall and CPU time of the phases of a command, plus counters (files, bytes, matches, ...).
+
+    Phases can be nested, the time of a phase includes the time of its inner phases.
+    """
+
+    def __init__(self, cprofile_path: Path | None = None):
+        self.phases: dict[str, list] = {}  # name -> [calls, wall, cpu]
+        self.counters = Counter()
+        self.started = time.perf_counter()
+        self.cprofile_path = cprofile_path
+        self.cprofile = None
+        if cprofile_path is not None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, 1, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add_phase(self, name: str, calls: int, wall: float, cpu: float):
+        phase = self.phases.setdefault(name, [0, 0.0, 0.0])
+        phase[0] += calls
+        phase[1] += wall
+        phase[2] += cpu
+
+    def take(self) -> dict:
+        # Hands the data recorded so far (e.g. by a worker process) and starts again
+        data = {"phases": self.phases, "counters": dict(self.counters)}
+        self.phases, self.counters = {}, Counter()
+        return data
+
+    def merge(self, data: dict):
+        for name, (calls, wall, cpu) in data["phases"].items():
+            self.add_phase(name, calls, wall, cpu)
+        self.counters.update(data["counters"])
+
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_path)
+            self.cprofile = None
+
+    def summary(self, command: str | None) -> dict:
+        return {"command": command, "wall": time.perf_counter() - self.started,
+                "phases": {name: {"calls": calls, "wall": wall, "cpu": cpu}
+                           for name, (calls, wall, cpu) in self.phases.items()},
+                "counters": dict(self.counters)}
+
+
+_profiler: Profiler | None = None
+_null_phase = nullcontext()
+
+
+def enable(cprofile_path: Path | None = None):
+    global _profiler
+    _profiler = Profiler(cprofile_path)
+
+
+def enabled() -> bool:
+    return _profiler is not None
+
+
+def phase(name: str):
+    # Nothing is measured when the profiler is off
+    if _profiler is None:
+        return _null_phase
+    return _profiler.phase(name)
+
+
+def timed(items: Iterable, name: str) -> Iterable:
+    """
+    Records the time spent producing the items of a lazy iterable (e.g. a walk of the files) as a phase, without the
+    time its consumer spends between the items.
+    """
+    if _profiler is None:
+        return items
+    return _timed(iter(items), name)
+
+
+def _timed(items: Iterator, name: str) -> Iterator:
+    wall = cpu = 0.0
+    try:
+        while True:
+            started, started_cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(items)
+            finally:
+                wall += time.perf_counter() - started
+                cpu += time.process_time() - started_cpu
+            yield item
+    except StopIteration:
+        pass
+    finally:
+        if _profiler is not None:
+            _profiler.add_phase(name, 1, wall, cpu)
+
+
+def count(name: str, value: int = 1):
+    if _profiler is not None:
+        _profiler.counters[name] += value
+
+
+def take() -> dict | None:
+    return _profiler.take() if _profiler is not None else None
+
+
+def merge(data: dict | None):
+    if _profiler is not None and data is not None:
+        _profiler.merge(data)
+
+
+def report(fp: TextIO, command: str | None, output_path: Path | None = None):
+    if _profiler is None:
+        return
+    _profiler.stop()
+    summary = _profiler.summary(command)
+
+    if output_path is not None:
+        with open(output_path, "w", encoding="utf-8") as out:
+            json.dump(summary, out, indent=2)
+
+    fp.write(f"[INFO] ⏱️ Profile of '{command}': {summary['wall']:.3f} s\n")
+    fp.write(f"    {'Phase':<20} {'Calls':>8} {'Wall (s)':>10} {'CPU (s)':>10}\n")
+    for name, timing in summary["phases"].items():
+        fp.write(f"    {name:<20} {timing['calls']:>8} {timing['wall']:>10.3f} {timing['cpu']:>10.3f}\n")
+    fp.write(f"    {'Counter':<20} {'Value':>8}\n")
+    for name, value in sorted(summary["counters"].items()):
+        fp.write(f"    {name:<20} {value:>8}\n")
+    if _profiler.cprofile_path is not None:
+        fp.write(f"[INFO] 💾 cProfile stats saved to {_profiler.cprofile_path}\n")
+    fp.flush()
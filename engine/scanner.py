@@ -0,0 +1,159 @@
+import marshal
+import re
+import tempfile
+from array import array
+from bisect import bisect_right
+from heapq import merge
+from datetime import datetime
+from itertools import repeat, tee
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from engine import output
+from engine import storage
+from engine.archive import release
+from engine.finder import find_definitions
+from engine.finder import merge_dot_definitions
+from engine.lexer import index
+from engine.lexer import offset_typecode
+from engine.lookup import DDLObjectTypeMatcher
+from engine.lookup import build_matcher
+from engine.lookup import collect_dot_usages
+from engine.parallel import map_files
+from engine.source import open_source
+from engine.utils import DDLDefinitionRecord, DDLObjectTypeSupported, UsageTable, text_start
+
+NEWLINE = re.compile(b"\n")
+
+
+class FileTokens(object):
+    """
+    References found in a file, kept to be matched against a definition table once it's complete, without reading the
+    file again.
+
+    Only the offsets of every distinct reference (keywords are not references) are kept, and the offsets of the
+    newlines to get the line and the column of the ones which match: 4 bytes per name and per line of the file.
+    """
+    __slots__ = ("references", "newlines", "start", "timestamp")
+
+    def __init__(self, references: dict[bytes, array], newlines: array, start: int, timestamp: float):
+        self.references = references
+        self.newlines = newlines
+        self.start = start  # Offset of the first line
+        self.timestamp = timestamp
+
+    def dump(self) -> tuple:
+        return ({reference: offsets.tobytes() for reference, offsets in self.references.items()},
+                self.newlines.typecode, self.newlines.tobytes(), self.start, self.timestamp)
+
+    @classmethod
+    def load(cls, dumped: tuple) -> 'FileTokens':
+        references, typecode, newlines, start, timestamp = dumped
+        return cls({reference: array(typecode, offsets) for reference, offsets in references.items()},
+                   array(typecode, newlines), start, timestamp)
+
+    def position(self, offset: int) -> tuple[int, int]:
+        # Same line and column as `LineCounter`
+        line = bisect_right(self.newlines, offset)
+        line_start = self.newlines[line - 1] + 1 if line > 0 else self.start
+        return line + 1, offset - line_start + 1
+
+    def matches(self, matcher: DDLObjectTypeMatcher) -> Iterator[tuple[int, str]]:
+        # Every reference is looked up once, the usages are merged back in the file order without being copied
+        found = []
+        for reference, offsets in self.references.items():
+            names = matcher.find(reference)
+            if names is not None:
+                found += [zip(offsets, repeat(name)) for name in names]
+        return merge(*found)
+
+
+class TokenSpill(object):
+    """
+    Tokens of the files scanned, written to a temporary file as soon as they are found and read back in the same order,
+    so the memory used does not depend on the size of the tree.
+    """
+
+    def __init__(self):
+        self.fp = tempfile.TemporaryFile(prefix="dot-handler-")
+        self.files: list[Path] = []
+
+    def __enter__(self) -> 'TokenSpill':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.fp.close()
+
+    def append(self, src_file: Path, tokens: FileTokens):
+        marshal.dump(tokens.dump(), self.fp)
+        self.files.append(src_file)
+
+    def __iter__(self) -> Iterator[tuple[Path, FileTokens]]:
+        self.fp.seek(0)
+        for src_file in self.files:
+            yield src_file, FileTokens.load(marshal.load(self.fp))
+
+
+def scan_file(dots: DDLObjectTypeSupported, src_file: Path) -> tuple[dict[str, DDLDefinitionRecord], FileTokens]:
+    output.detail(f"[INFO] 🔍 Scanning definitions and references of {dots.value} in {src_file.absolute()}")
+
+    timestamp = datetime.now().timestamp()
+    with open_source(src_file) as data:
+        # A single pass of the lexer finds both the definitions and the references
+        definitions, references = index(data)
+        newlines = array(offset_typecode(len(data)), (matching.start() for matching in NEWLINE.finditer(data)))
+        records = find_definitions(dots, f"{src_file.absolute()}", data, definitions)
+        start = text_start(data)
+    return records, FileTokens(references, newlines, start, timestamp)
+
+
+def match_file(dots: DDLObjectTypeSupported, table: tuple[str, ...], src_file: Path, tokens: FileTokens) -> UsageTable:
+    output.detail(f"[INFO] 🔍 Looking up usages of {len(table)} {dots.value} in {src_file.absolute()}")
+
+    matcher = build_matcher(table)
+    usage_records = UsageTable()
+    path_id = usage_records.add_file(str(src_file.absolute()), tokens.timestamp)
+    for offset, name in tokens.matches(matcher):
+        line, column = tokens.position(offset)
+        output.detail(f"[INFO] ✅ New usage entry found for '{name}' at line: {line}")
+        usage_records.add(name, path_id, line, column)
+
+    output.detail(f"[INFO] {'-' * 80}")
+
+    # Keep the order of the definition table
+    return usage_records.ordered(table)
+
+
+def scan_files(dots: DDLObjectTypeSupported, src_filepaths: Iterable[Path],
+               jobs: int = 1) -> Iterator[tuple[Path, tuple[dict[str, DDLDefinitionRecord], FileTokens]]]:
+    # The files are scanned as soon as they are found, in parallel, but yielded in the files order
+    src_filepaths, call_filepaths = tee(src_filepaths)
+    scans = map_files(scan_file, ((src_file,) for src_file in call_filepaths), jobs, shared=(dots,))
+    return release(zip(src_filepaths, scans, strict=True))
+
+
+def scan_dot_definitions_and_usages(session: storage.DatasetSession, dots: DDLObjectTypeSupported,
+                                    src_filepaths: Iterable[Path], jobs: int = 1
+                                    ) -> tuple[dict[str, DDLDefinitionRecord], dict[Path, UsageTable]]:
+    """
+    Finds the definitions of `dots` and their usages, reading every file once: the references of every file are spilled
+    to a temporary file while the definitions are found, then matched against the complete definition table, which is
+    the one a `lookup` following a `find` would use (the definitions of the dataset, then the new ones).
+
+    :return: the definitions found and the usages of every file
+    """
+    with TokenSpill() as spill:
+        def definitions() -> Iterator[tuple[Path, dict[str, DDLDefinitionRecord]]]:
+            for src_file, (records, file_tokens) in scan_files(dots, src_filepaths, jobs):
+                spill.append(src_file, file_tokens)
+                yield src_file, records
+
+        dot_table = merge_dot_definitions(dots, definitions())
+
+        stored = session.definition_keys(dots)
+        known = set(stored)
+        table = tuple(stored + [key for key in dot_table if key not in known])
+
+        # Only the references of the file being matched are loaded
+        usages = ((src_file, match_file(dots, table, src_file, file_tokens)) for src_file, file_tokens in spill)
+        return dot_table, collect_dot_usages(dots, list(table), usages)
@@ -0,0 +1,140 @@
+import codecs
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator
+
+from engine import output
+from engine import profiling
+from engine.archive import ArchiveMember
+from engine.configuration import settings
+from engine.errors import ConfigurationError
+
+# Checked in this order, the BOM of UTF-32-LE starts with the one of UTF-16-LE
+BOMS = ((codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+SNIFF_SIZE = 4096
+VALIDATION_SIZE = 1 << 20
+TRANSCODE_WINDOW = 1 << 20
+
+# Encoding of the last source opened by this process, kept with the scan results of the file
+_last_encoding: str | None = None
+
+
+@lru_cache(maxsize=16)
+def _is_ascii_compatible(encoding: str) -> bool:
+    # Keywords and names are always ASCII: such a file is scanned as it is, whatever its other characters are
+    return bytes(range(128)).decode(encoding, errors="replace") == "".join(map(chr, range(128)))
+
+
+def fallback_encoding() -> str:
+    encoding = settings().source_encoding_fallback
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        raise ConfigurationError(f"Unknown encoding set in 'source.encoding.fallback': {encoding}") from None
+
+
+def _is_utf8(head: bytes, final: bool) -> bool:
+    # A character cut by the end of the head is not an error, unless it's the end of the file too
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=final)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def detect_encoding(data: bytes | mmap.mmap) -> str:
+    """
+    Encoding of a source: given by its BOM, or UTF-16 if every other byte of its start is a NUL, or UTF-8 if its start
+    is valid UTF-8 (ASCII included), otherwise the `source.encoding.fallback` configuration.
+
+    Only the first `VALIDATION_SIZE` bytes are read: a later byte which is not UTF-8 can't change how the file is
+    scanned (as it is, like any encoding storing ASCII as ASCII), and an encoding which doesn't shows from the start.
+    """
+    head = data[:SNIFF_SIZE]
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    if head.count(0) > len(head) // 4:
+        return "utf-16-le" if head[1::2].count(0) > head[0::2].count(0) else "utf-16-be"
+
+    start = data[:VALIDATION_SIZE]
+    if start.isascii() or _is_utf8(start, final=len(start) == len(data)):
+        return "utf-8"
+    return fallback_encoding()
+
+
+def last_encoding() -> str | None:
+    return _last_encoding
+
+
+@contextmanager
+def _transcoded(data: bytes | mmap.mmap, encoding: str) -> Iterator[bytes | mmap.mmap]:
+    # Converted by windows into a temporary file, mapped like a source file: the memory used does not depend on the
+    # size of the file
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    with tempfile.TemporaryFile(prefix="dot-handler-") as fp:
+        for offset in range(0, len(data), TRANSCODE_WINDOW):
+            fp.write(decoder.decode(data[offset:offset + TRANSCODE_WINDOW]).encode("utf-8"))
+        fp.write(decoder.decode(b"", final=True).encode("utf-8"))
+        fp.flush()
+        if fp.tell() == 0:
+            yield b""
+            return
+
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+@contextmanager
+def _decoded(data: bytes | mmap.mmap) -> Iterator[bytes | mmap.mmap]:
+    global _last_encoding
+    _last_encoding = encoding = detect_encoding(data)
+    if encoding in ("utf-8", "utf-8-sig") or (encoding not in ("utf-16", "utf-32") and _is_ascii_compatible(encoding)):
+        # The BOM of UTF-8 is kept: it's never part of a token, and it's not counted in the columns of the first line
+        # (see `text_start`)
+        yield data
+        return
+
+    # Only the files in an encoding which is not a superset of ASCII are converted
+    profiling.count("files transcoded")
+    output.detail(f"[INFO] 🔤 Read as {encoding}")
+    with _transcoded(data, encoding) as transcoded:
+        yield transcoded
+
+
+@contextmanager
+def open_source(src_file: Path | ArchiveMember) -> Iterator[bytes | mmap.mmap]:
+    """
+    Opens a source file as a read-only memory map.
+
+    Compiled `bytes` patterns run directly over the map, pages are loaded (and dropped) by the OS on demand, so the
+    memory used does not depend on the size of the file. A member of an archive is read as a whole instead.
+
+    The encoding of the file is detected (see `detect_encoding`): a file whose ASCII characters are not stored as ASCII
+    bytes (e.g. UTF-16) is converted to UTF-8 into a temporary file, every other one is scanned as it is.
+    """
+    if isinstance(src_file, ArchiveMember):
+        data = src_file.read_bytes()
+        profiling.count("files")
+        profiling.count("bytes", len(data))
+        with _decoded(data) as decoded:
+            yield decoded
+        return
+
+    with open(src_file, "rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        profiling.count("files")
+        profiling.count("bytes", size)
+        if size == 0:
+            # Empty files can't be mapped
+            with _decoded(b"") as decoded:
+                yield decoded
+            return
+
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer, _decoded(buffer) as decoded:
+            yield decoded
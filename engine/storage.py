@@ -1,57 +1,890 @@
 import json
-from datetime import datetime
-from typing import Any
-
-import typer
+import shutil
+import sqlite3
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
 
+from engine import archive
+from engine import output
+from engine import profiling
 from engine.configuration import STORAGE_MAIN_DIR
-from engine.utils import DDLDefinitionRecord
+from engine.utils import DDLObjectTypeSupported, UsageTable
+
+COLLECTIONS = ("definitions", "usages", "manifest", "dependencies")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+
+CREATE TABLE IF NOT EXISTS definitions (
+    dots TEXT NOT NULL,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    schema TEXT NOT NULL,
+    filepath TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    end_line INTEGER,
+    end_column INTEGER,
+    "column" INTEGER,
+    PRIMARY KEY (dots, key)
+);
+CREATE INDEX IF NOT EXISTS definitions_name ON definitions (dots, name);
+CREATE INDEX IF NOT EXISTS definitions_schema ON definitions (dots, schema);
+CREATE INDEX IF NOT EXISTS definitions_filepath ON definitions (filepath);
+CREATE INDEX IF NOT EXISTS definitions_start ON definitions (filepath, line, "column");
+
+-- Every path is stored once, the usages only hold its id
+CREATE TABLE IF NOT EXISTS paths (
+    id INTEGER PRIMARY KEY,
+    filepath TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS usages (
+    id INTEGER PRIMARY KEY,
+    dots TEXT NOT NULL,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    schema TEXT,
+    path_id INTEGER NOT NULL REFERENCES paths (id),
+    line INTEGER NOT NULL,
+    "column" INTEGER,
+    timestamp REAL NOT NULL,
+    generation INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usages_key ON usages (dots, key);
+CREATE INDEX IF NOT EXISTS usages_name ON usages (dots, name);
+CREATE INDEX IF NOT EXISTS usages_schema ON usages (dots, schema);
+CREATE INDEX IF NOT EXISTS usages_path ON usages (path_id);
+
+CREATE TABLE IF NOT EXISTS manifest (
+    dots TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    filepath TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    records TEXT NOT NULL,
+    encoding TEXT,
+    PRIMARY KEY (dots, collection, filepath)
+);
+
+CREATE TABLE IF NOT EXISTS dependencies (
+    dots TEXT NOT NULL,
+    key TEXT NOT NULL,
+    depends_on TEXT NOT NULL,
+    PRIMARY KEY (dots, key)
+);
+
+CREATE TABLE IF NOT EXISTS closures (
+    dots TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    key TEXT NOT NULL,
+    node TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (dots, direction, key, node)
+);
+CREATE INDEX IF NOT EXISTS closures_node ON closures (dots, node);
+
+-- Lookups stored by batches, until their last batch is: the files already stored by an interrupted one are skipped
+-- when it's resumed
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    dots TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    generation INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_files (
+    run_id TEXT NOT NULL REFERENCES runs (id),
+    filepath TEXT NOT NULL,
+    PRIMARY KEY (run_id, filepath)
+);
+
+-- Journal entries merged, until their file is deleted
+CREATE TABLE IF NOT EXISTS journal (
+    entry TEXT PRIMARY KEY
+);
+"""
+
+# Aggregates of the usages, kept up to date by every write of the definitions and the usages (see `insert_usages` and
+# `_delete_usages`), so the stats never read the usages themselves. Created by `add_stats`
+STATS_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS object_stats (
+        dots TEXT NOT NULL,
+        key TEXT NOT NULL,
+        defined INTEGER NOT NULL DEFAULT 0,
+        usages INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dots, key)
+    )""",
+    "CREATE INDEX IF NOT EXISTS object_stats_usages ON object_stats (dots, usages)",
+    "CREATE INDEX IF NOT EXISTS object_stats_unused ON object_stats (dots, defined, usages, key)",
+    """CREATE TABLE IF NOT EXISTS file_stats (
+        dots TEXT NOT NULL,
+        path_id INTEGER NOT NULL,
+        usages INTEGER NOT NULL,
+        PRIMARY KEY (dots, path_id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS file_stats_usages ON file_stats (dots, usages)",
+    """CREATE TABLE IF NOT EXISTS generation_stats (
+        dots TEXT NOT NULL,
+        generation INTEGER NOT NULL,
+        usages INTEGER NOT NULL,
+        PRIMARY KEY (dots, generation)
+    )""",
+    """CREATE TABLE IF NOT EXISTS stats_totals (
+        dots TEXT PRIMARY KEY,
+        definitions INTEGER NOT NULL DEFAULT 0,
+        unused INTEGER NOT NULL DEFAULT 0,
+        files INTEGER NOT NULL DEFAULT 0
+    )""",
+)
+
+# Stats table -> column the usages are counted by
+_STATS_COLUMNS = {"object_stats": "key", "file_stats": "path_id", "generation_stats": "generation"}
+
+# Stats table -> total of `stats_totals` -> rows counted. The totals are kept by triggers, in the same statements which
+# change the rows of the stats, so they are never counted again
+_STATS_TOTALS = {
+    "object_stats": {"definitions": "{row}.defined = 1", "unused": "{row}.defined = 1 AND {row}.usages = 0"},
+    "file_stats": {"files": "{row}.usages > 0"},
+}
+
+
+def _totals_trigger(table: str, event: str, rows: tuple[str, ...]) -> str:
+    # The rows of the change are counted in (`+NEW`) or out (`-OLD`) of the totals of their `dots`
+    totals = _STATS_TOTALS[table]
+    values = ", ".join(" ".join(f"{row[0]} ({counted.format(row=row[1:])})" for row in rows)
+                       for counted in totals.values())
+    updates = ", ".join(f"{total} = {total} + excluded.{total}" for total in totals)
+    return (f"CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()} AFTER {event} ON {table} BEGIN "
+            f"INSERT INTO stats_totals (dots, {', '.join(totals)}) VALUES ({rows[0][1:]}.dots, {values}) "
+            f"ON CONFLICT (dots) DO UPDATE SET {updates}; END")
+
+
+STATS_SCHEMA += tuple(_totals_trigger(table, event, rows) for table in _STATS_TOTALS
+                      for event, rows in (("INSERT", ("+NEW",)), ("UPDATE", ("+NEW", "-OLD")), ("DELETE", ("-OLD",))))
+
+# Seconds a writer waits for another one to commit
+BUSY_TIMEOUT = 600
+
+
+def ds_filepath(ds_name: str, suffix: str = ".db") -> Path:
+    return STORAGE_MAIN_DIR / "dataset" / f"{ds_name}{suffix}"
 
 
 def rm(ds_name: str):
-    ds_filepath = STORAGE_MAIN_DIR / "dataset" / f"{ds_name}.json"
-    ds_filepath.unlink(missing_ok=True)
+    for suffix in (".db", ".db-wal", ".db-shm", ".json"):
+        ds_filepath(ds_name, suffix).unlink(missing_ok=True)
+    shutil.rmtree(ds_filepath(ds_name, ".journal"), ignore_errors=True)
+
+
+def size(ds_name: str) -> int:
+    return sum(ds_filepath(ds_name, suffix).stat().st_size for suffix in (".db", ".db-wal")
+               if ds_filepath(ds_name, suffix).exists())
+
+
+def vacuum(ds_name: str):
+    # Gives the free pages back to the file system, VACUUM can't run inside a transaction
+    conn = connect(ds_name)
+    try:
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
 
 
 def exists(ds_name: str) -> bool:
-    ds_filepath = STORAGE_MAIN_DIR / "dataset" / f"{ds_name}.json"
-    return ds_filepath.exists()
+    return any(ds_filepath(ds_name, suffix).exists() for suffix in (".db", ".json", ".journal"))
+
+
+def connect(ds_name: str) -> sqlite3.Connection:
+    profiling.count("dataset loads")
+    with profiling.phase("dataset load"):
+        return _connect(ds_name)
+
+
+def _connect(ds_name: str) -> sqlite3.Connection:
+    db_filepath = ds_filepath(ds_name)
+    db_filepath.parent.mkdir(parents=True, exist_ok=True)  # Make sure the "dataset" folder exists
+
+    json_filepath = ds_filepath(ds_name, ".json")
+    migrate = not db_filepath.exists() and json_filepath.exists()
+
+    conn = sqlite3.connect(db_filepath, timeout=BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if "filepath" in _columns(conn, "usages"):
+        migrate_usages_to_paths(conn)
+    if "name" in (columns := _columns(conn, "definitions")) and "column" not in columns:
+        # Before the schema, which indexes the new columns
+        add_definitions_position(conn)
+    conn.executescript(SCHEMA)
+    if "encoding" not in _columns(conn, "manifest"):
+        add_manifest_encoding(conn)
+    if not _columns(conn, "stats_totals"):
+        add_stats(conn)
+
+    if migrate:
+        with conn:
+            migrate_json_dataset(conn, json_filepath)
+        json_filepath.rename(json_filepath.with_suffix(".json.bak"))
+        output.info(f"[INFO] 💾 Dataset {ds_name} was migrated from JSON, the original file was kept as: "
+             f"{json_filepath.with_suffix('.json.bak')}")
+
+    return conn
+
+
+@contextmanager
+def snapshot(ds_name: str) -> Iterator[sqlite3.Connection]:
+    # Every read done in the block sees the dataset as it was when the first one started, whatever is committed meanwhile
+    conn = connect(ds_name)
+    try:
+        conn.execute("BEGIN")
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+@contextmanager
+def dataset(ds_name: str) -> Iterator[sqlite3.Connection]:
+    # Every write done in the block is committed as a single transaction
+    conn = connect(ds_name)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+class DatasetSession(object):
+    """
+    Dataset opened once for a whole command.
+
+    The definition tables are read only once, and every write is kept in memory until `flush`, which commits all of
+    them in a single transaction. Used as a context manager, it flushes when the block succeeds.
+
+    With `journaled`, the writes are appended to the journal of the dataset instead (see `engine.journal`), so
+    concurrent writers never wait for each other.
+    """
+
+    def __init__(self, ds_name: str, journaled: bool = False):
+        self.ds_name = ds_name
+        self.journaled = journaled
+        self.conn = connect(ds_name)
+        self.definitions: dict[DDLObjectTypeSupported, list[str]] = {}
+        self.pending: list[tuple[Callable, tuple]] = []
+
+    def __enter__(self) -> 'DatasetSession':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.close()
+
+    def definition_keys(self, dots: DDLObjectTypeSupported) -> list[str]:
+        if dots not in self.definitions:
+            with profiling.phase("dataset load"):
+                self.definitions[dots] = definition_keys(self.conn, dots)
+        return self.definitions[dots]
+
+    def write(self, func: Callable, *args: Any):
+        # `func(conn, *args)` is called on flush
+        self.pending.append((func, args))
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        profiling.count("dataset saves")
+        if self.journaled:
+            # Imported here, the journal is built on top of this module
+            from engine import journal
+            journal.write(self.ds_name, self.pending)
+        else:
+            with profiling.phase("dataset save"), self.conn:
+                # The write lock is taken first, a concurrent writer waits instead of failing halfway
+                self.conn.execute("BEGIN IMMEDIATE")
+                apply(self.conn, self.pending)
+        self.pending.clear()
+        self.definitions.clear()
+
+    def close(self):
+        self.conn.close()
+
+
+def _columns(conn: sqlite3.Connection, table_name: str) -> list[str]:
+    return [row['name'] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+
+
+def migrate_usages_to_paths(conn: sqlite3.Connection):
+    # Datasets of previous versions kept the whole filepath in every usage. Everything runs in a single transaction
+    # (`executescript` would commit), so a dataset is never left half migrated
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if "filepath" not in _columns(conn, "usages"):
+            # Migrated by a concurrent process meanwhile
+            conn.rollback()
+            return
+
+        for index in ("usages_key", "usages_name", "usages_schema", "usages_filepath"):
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        conn.execute("ALTER TABLE usages RENAME TO usages_filepath")
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+
+        conn.execute("INSERT OR IGNORE INTO paths (filepath) SELECT DISTINCT filepath FROM usages_filepath")
+        conn.execute(
+            'INSERT INTO usages (id, dots, key, name, schema, path_id, line, "column", timestamp, generation) '
+            'SELECT u.id, u.dots, u.key, u.name, u.schema, p.id, u.line, u."column", u.timestamp, u.generation '
+            'FROM usages_filepath AS u JOIN paths AS p ON p.filepath = u.filepath')
+        conn.execute("DROP TABLE usages_filepath")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def add_manifest_encoding(conn: sqlite3.Connection):
+    # Datasets created before the encodings were kept with the manifests
+    try:
+        conn.execute("ALTER TABLE manifest ADD COLUMN encoding TEXT")
+    except sqlite3.OperationalError:
+        # Added by a concurrent process
+        if "encoding" not in _columns(conn, "manifest"):
+            raise
+
+
+def add_definitions_position(conn: sqlite3.Connection):
+    # Datasets created before the start column and the end of the definitions were kept: their usages are attributed
+    # by line, up to the next definition, until the files are searched again
+    for column in ("end_line", "end_column", "column"):
+        try:
+            conn.execute(f'ALTER TABLE definitions ADD COLUMN "{column}" INTEGER')
+        except sqlite3.OperationalError:
+            # Added by a concurrent process
+            if column not in _columns(conn, "definitions"):
+                raise
+    conn.execute("DROP INDEX IF EXISTS definitions_position")
+
+
+def add_stats(conn: sqlite3.Connection):
+    # Datasets created before the stats (or their totals) were kept get them computed once, in a single transaction
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if _columns(conn, "stats_totals"):
+            # Added by a concurrent process meanwhile
+            conn.rollback()
+            return
+
+        for statement in STATS_SCHEMA:
+            conn.execute(statement)
+        compute_stats(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def apply(conn: sqlite3.Connection, pending: list[tuple[Callable, tuple]]):
+    for func, args in pending:
+        func(conn, *args)
+
+
+def migrate_json_dataset(conn: sqlite3.Connection, json_filepath: Path):
+    with open(json_filepath, "r") as fp:
+        ds: dict[str, Any] = json.load(fp)
+
+    for dots, table in ds.get('definitions', {}).items():
+        conn.executemany(
+            "INSERT OR REPLACE INTO definitions (dots, key, name, schema, filepath, line, timestamp) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((dots, key, entry['name'], entry['schema'], entry['filepath'], entry['line'], entry['timestamp'])
+             for key, entry in table.items()))
+
+    usages = ds.get('usages', {})
+    for dots, table in usages.items():
+        if dots == 'generation':
+            continue
+        for key, entries in table.items():
+            _insert_usage_entries(conn, dots, key, entries)
+    if 'generation' in usages:
+        set_meta(conn, 'usages.generation', usages['generation'])
+
+    for dots, collections in ds.get('manifest', {}).items():
+        for collection_name, manifest in collections.items():
+            set_meta(conn, f"manifest.{dots}.{collection_name}.fingerprint", manifest.get('fingerprint'))
+            conn.executemany(
+                "INSERT OR REPLACE INTO manifest (dots, collection, filepath, size, mtime, hash, records) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((dots, collection_name, filepath, entry['size'], entry['mtime'], entry['hash'],
+                  json.dumps(entry['records'])) for filepath, entry in manifest.get('files', {}).items()))
+
+    compute_stats(conn)
+
+
+def get_meta(conn: sqlite3.Connection, key: str, default: Any = None) -> Any:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return default if row is None else row['value']
+
+
+def set_meta(conn: sqlite3.Connection, key: str, value: Any):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+# Definitions
+def definition_keys(conn: sqlite3.Connection, dots: DDLObjectTypeSupported) -> list[str]:
+    return [row['key'] for row in
+            conn.execute("SELECT key FROM definitions WHERE dots = ? ORDER BY rowid", (dots.value,))]
+
 
+def _filters(dots: DDLObjectTypeSupported, name: str | None, schema: str | None,
+             filepath: str | None) -> tuple[str, list[Any]]:
+    # Filepath accepts glob patterns, e.g. '/app/db/v2/*'
+    clauses, params = ["dots = ?"], [dots.value]
+    for column, operator, value in (("name", "=", name), ("schema", "=", schema), ("filepath", "GLOB", filepath)):
+        if value is not None:
+            clauses.append(f"{column} {operator} ?")
+            params.append(value)
+    return " AND ".join(clauses), params
 
-def load_dataset(dataset_name: str) -> dict[str, Any]:
-    ds_filepath = STORAGE_MAIN_DIR / "dataset" / f"{dataset_name}.json"
-    ds_filepath.parent.mkdir(parents=True, exist_ok=True)  # Make sure the "dataset" folder exists
 
-    if not ds_filepath.exists():
-        return {}
+def query_definitions(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, name: str | None = None,
+                      schema: str | None = None, filepath: str | None = None, limit: int | None = None,
+                      offset: int = 0) -> sqlite3.Cursor:
+    where, params = _filters(dots, name, schema, filepath)
+    return conn.execute(f"SELECT * FROM definitions WHERE {where} ORDER BY rowid LIMIT ? OFFSET ?",
+                        (*params, -1 if limit is None else limit, offset))
+
+
+def upsert_definitions(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, entries: dict[str, dict[str, Any]]):
+    # Existing keys keep their position in the table
+    conn.executemany(
+        "INSERT INTO definitions (dots, key, name, schema, filepath, line, \"column\", timestamp, end_line, end_column) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (dots, key) DO UPDATE SET name = excluded.name, schema = excluded.schema, "
+        "filepath = excluded.filepath, line = excluded.line, \"column\" = excluded.\"column\", "
+        "timestamp = excluded.timestamp, end_line = excluded.end_line, end_column = excluded.end_column",
+        ((dots.value, key, entry['name'], entry['schema'], entry['filepath'], entry['line'], entry.get('column'),
+          entry['timestamp'], entry.get('end_line'), entry.get('end_column')) for key, entry in entries.items()))
+    _define_stats(conn, dots.value, entries, True)
+
+
+def delete_definitions_of_files(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, filepaths: Iterable[str]):
+    filepaths = list(filepaths)
+    _define_stats(conn, dots.value, [key for filepath in filepaths for key, in conn.execute(
+        "SELECT key FROM definitions WHERE dots = ? AND filepath = ?", (dots.value, filepath))], False)
+    conn.executemany("DELETE FROM definitions WHERE dots = ? AND filepath = ?",
+                     ((dots.value, filepath) for filepath in filepaths))
+
+
+# Paths
+def path_id(conn: sqlite3.Connection, filepath: str) -> int:
+    conn.execute("INSERT OR IGNORE INTO paths (filepath) VALUES (?)", (filepath,))
+    return conn.execute("SELECT id FROM paths WHERE filepath = ?", (filepath,)).fetchone()['id']
+
+
+@contextmanager
+def _temp_filepaths(conn: sqlite3.Connection, filepaths: Iterable[str]) -> Iterator[str]:
+    # The files are written once to a temporary table, the block gets the subquery of their path ids
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS filepaths (filepath TEXT PRIMARY KEY)")
+    try:
+        conn.executemany("INSERT OR IGNORE INTO temp.filepaths (filepath) VALUES (?)",
+                         ((filepath,) for filepath in filepaths))
+        yield "SELECT p.id FROM temp.filepaths AS f CROSS JOIN paths AS p ON p.filepath = f.filepath"
+    finally:
+        conn.execute("DELETE FROM temp.filepaths")
+
+
+def prune_paths(conn: sqlite3.Connection) -> int:
+    # Drops the paths no usage refers to anymore
+    return conn.execute("DELETE FROM paths WHERE id NOT IN (SELECT path_id FROM usages)").rowcount
+
+
+# Usages
+_USAGE_COLUMNS = '(dots, key, name, schema, path_id, line, "column", timestamp, generation)'
+
+
+def _split_key(key: str) -> tuple[str | None, str]:
+    parts = key.split(".", 1)
+    return (parts[0], parts[1]) if len(parts) == 2 else (None, key)
+
+
+def _insert_usage_entries(conn: sqlite3.Connection, dots: str, key: str, entries: Iterable[dict[str, Any]]):
+    schema, name = _split_key(key)
+    path_ids = {}
+    conn.executemany(
+        f'INSERT INTO usages {_USAGE_COLUMNS} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        ((dots, key, name, schema, path_ids.get(entry['filepath']) or
+          path_ids.setdefault(entry['filepath'], path_id(conn, entry['filepath'])), entry['line'],
+          entry.get('column'), entry['timestamp'], entry['generation']) for entry in entries))
+
+
+def insert_usages(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, usage_table: UsageTable):
+    # The ids of the table paths are mapped once to the ids of the dataset paths, then the columns are written as is
+    path_ids = [path_id(conn, filepath) for filepath in usage_table.filepaths()]
+    timestamps = usage_table.timestamps
+    keys, paths = {}, Counter()
+    for key, columns in usage_table.items():
+        schema, name = _split_key(key)
+        conn.executemany(
+            f'INSERT INTO usages {_USAGE_COLUMNS} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            ((dots.value, key, name, schema, path_ids[path], line, column, timestamps[path], usage_table.generation)
+             for path, line, column in columns.rows()))
+        keys[key] = len(columns)
+        paths.update(columns.paths)
+
+    # The stats are counted from the columns, once per key, path and generation
+    _count_stats(conn, dots.value, "object_stats", keys)
+    _count_stats(conn, dots.value, "file_stats", {path_ids[path]: count for path, count in paths.items()})
+    if keys:
+        _count_stats(conn, dots.value, "generation_stats", {usage_table.generation: sum(keys.values())})
+
+
+def _delete_usages(conn: sqlite3.Connection, where: str, params: Iterable[Any] = ()) -> int:
+    # Every delete of usages goes through here: the usages deleted are subtracted from the stats first
+    params = list(params)
+    for table, column in _STATS_COLUMNS.items():
+        conn.execute(f"UPDATE {table} SET usages = {table}.usages - deleted.usages FROM ("
+                     f"SELECT dots, {column}, COUNT(*) AS usages FROM usages WHERE {where} GROUP BY dots, {column}"
+                     f") AS deleted WHERE {table}.dots = deleted.dots AND {table}.{column} = deleted.{column}", params)
+    return conn.execute(f"DELETE FROM usages WHERE {where}", params).rowcount
+
+
+def replace_usages_of_files(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, filepaths: Iterable[str],
+                            usage_table: UsageTable, keys: Iterable[str] | None = None):
+    # The usages of the given files (only of the given keys, if any) are replaced by the new ones
+    if keys is None:
+        delete_usages_of_files(conn, dots, filepaths)
     else:
-        with open(ds_filepath, "r") as fp:
-            return json.load(fp)
+        with _temp_filepaths(conn, filepaths) as path_ids:
+            for key in keys:
+                _delete_usages(conn, f"+dots = ? AND key = ? AND path_id IN ({path_ids})", (dots.value, key))
+    insert_usages(conn, dots, usage_table)
+
+
+def prune_usages(conn: sqlite3.Connection, dots: DDLObjectTypeSupported | None, oldest_generation: int,
+                 keys: Iterable[str] | None = None) -> int:
+    # Drops the usages of the generations before `oldest_generation`
+    where, params = "generation < ?", [oldest_generation]
+    if dots is not None:
+        where, params = f"{where} AND dots = ?", [*params, dots.value]
+    if keys is None:
+        return _delete_usages(conn, where, params)
+
+    return sum(_delete_usages(conn, f"{where} AND key = ?", (*params, key)) for key in keys)
+
+
+def prune_usages_to_latest(conn: sqlite3.Connection) -> int:
+    # Only the usages of the last lookup of every file (and name) are kept
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS outdated (id INTEGER PRIMARY KEY)")
+    try:
+        conn.execute(
+            "INSERT INTO temp.outdated (id) "
+            "SELECT id FROM (SELECT id, generation, MAX(generation) OVER (PARTITION BY dots, path_id, key) AS latest "
+            "FROM usages) WHERE generation < latest")
+        return _delete_usages(conn, "id IN (SELECT id FROM temp.outdated)")
+    finally:
+        conn.execute("DELETE FROM temp.outdated")
+
+
+def delete_usages_of_files(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, filepaths: Iterable[str]):
+    with _temp_filepaths(conn, filepaths) as path_ids:
+        # `+dots`: the usages are found by the index of their path, not by the one of their type
+        _delete_usages(conn, f"+dots = ? AND path_id IN ({path_ids})", (dots.value,))
 
 
-def save_dataset(dataset: dict[str, Any], dataset_name: str):
-    ds_filepath = STORAGE_MAIN_DIR / "dataset" / f"{dataset_name}.json"
-    ds_filepath.parent.mkdir(parents=True, exist_ok=True)  # Make sure the "dataset" folder exists
+def query_usages(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, name: str | None = None,
+                 schema: str | None = None, filepath: str | None = None, limit: int | None = None,
+                 offset: int = 0) -> sqlite3.Cursor:
+    # Sorted by key, then by insertion: the order of the (dots, key) index, so rows are streamed without sorting
+    where, params = _filters(dots, name, schema, filepath)
+    return conn.execute(f"SELECT usages.*, paths.filepath FROM usages JOIN paths ON paths.id = usages.path_id "
+                        f"WHERE {where} ORDER BY key, usages.id LIMIT ? OFFSET ?",
+                        (*params, -1 if limit is None else limit, offset))
+
+
+def count_usages(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, name: str | None = None,
+                 schema: str | None = None, filepath: str | None = None) -> dict[str, int]:
+    where, params = _filters(dots, name, schema, filepath)
+    return {row['key']: row['count'] for row in
+            conn.execute(f"SELECT key, COUNT(*) AS count FROM usages JOIN paths ON paths.id = usages.path_id "
+                         f"WHERE {where} GROUP BY key", params)}
+
+
+def prune_missing_files(conn: sqlite3.Connection) -> int:
+    # Drops everything found in the files which don't exist anymore
+    missing = [row['filepath'] for row in conn.execute(
+        "SELECT filepath FROM definitions UNION SELECT filepath FROM paths UNION SELECT filepath FROM manifest")
+               if not archive.exists(row['filepath'])]
+    with _temp_filepaths(conn, missing) as path_ids:
+        pruned = _delete_usages(conn, f"path_id IN ({path_ids})")
+        conn.execute("UPDATE object_stats SET defined = 0 WHERE (dots, key) IN ("
+                     "SELECT dots, key FROM definitions WHERE filepath IN (SELECT filepath FROM temp.filepaths))")
+    pruned += sum(conn.executemany(f"DELETE FROM {collection_name} WHERE filepath = ?",
+                                   ((filepath,) for filepath in missing)).rowcount
+                  for collection_name in ("definitions", "manifest"))
+    prune_paths(conn)
+    return pruned
+
+
+# Manifest
+def load_manifest(conn: sqlite3.Connection, collection_name: str,
+                  dots: DDLObjectTypeSupported) -> tuple[str | None, dict[str, dict]]:
+    fingerprint = get_meta(conn, f"manifest.{dots.value}.{collection_name}.fingerprint")
+    files = {row['filepath']: {"size": row['size'], "mtime": row['mtime'], "hash": row['hash'],
+                               "records": json.loads(row['records']), "encoding": row['encoding']}
+             for row in conn.execute("SELECT * FROM manifest WHERE dots = ? AND collection = ?",
+                                     (dots.value, collection_name))}
+    return fingerprint, files
+
+
+def save_manifest(conn: sqlite3.Connection, collection_name: str, dots: DDLObjectTypeSupported,
+                  fingerprint: str | None, files: dict[str, dict], removed: Iterable[str], reset: bool = False):
+    if reset:
+        conn.execute("DELETE FROM manifest WHERE dots = ? AND collection = ?", (dots.value, collection_name))
+    else:
+        conn.executemany("DELETE FROM manifest WHERE dots = ? AND collection = ? AND filepath = ?",
+                         ((dots.value, collection_name, filepath) for filepath in removed))
 
-    with open(ds_filepath, "w") as fp:
-        json.dump(dataset, fp)
+    set_meta(conn, f"manifest.{dots.value}.{collection_name}.fingerprint", fingerprint)
+    conn.executemany(
+        "INSERT OR REPLACE INTO manifest (dots, collection, filepath, size, mtime, hash, records, encoding) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        ((dots.value, collection_name, filepath, entry['size'], entry['mtime'], entry['hash'],
+          json.dumps(entry['records']), entry.get('encoding')) for filepath, entry in files.items()))
 
 
-def store(dataset_name: str, collection_name: str, ddl_object_type: str, objects: dict[str, DDLDefinitionRecord]):
-    ds = load_dataset(dataset_name)
+# Runs
+def run_generation(conn: sqlite3.Connection, run_id: str, dots: DDLObjectTypeSupported, fingerprint: str) -> int:
+    # The generation of a run is taken by its first batch, the next ones reuse it
+    row = conn.execute("SELECT generation FROM runs WHERE id = ?", (run_id,)).fetchone()
+    if row is not None:
+        return row['generation']
+
+    generation = get_meta(conn, 'usages.generation', 0) + 1
+    set_meta(conn, 'usages.generation', generation)
+    conn.execute("INSERT INTO runs (id, dots, fingerprint, generation) VALUES (?, ?, ?, ?)",
+                 (run_id, dots.value, fingerprint, generation))
+    return generation
+
+
+def add_run_files(conn: sqlite3.Connection, run_id: str, filepaths: Iterable[str]):
+    conn.executemany("INSERT OR IGNORE INTO run_files (run_id, filepath) VALUES (?, ?)",
+                     ((run_id, filepath) for filepath in filepaths))
+
+
+def load_run(conn: sqlite3.Connection, dots: DDLObjectTypeSupported,
+             fingerprint: str) -> tuple[str, int, set[str]] | None:
+    # The last interrupted run of the same lookup, with the files it already stored
+    row = conn.execute("SELECT id, generation FROM runs WHERE dots = ? AND fingerprint = ? "
+                       "ORDER BY generation DESC LIMIT 1", (dots.value, fingerprint)).fetchone()
+    if row is None:
+        return None
+    filepaths = {filepath for filepath, in conn.execute("SELECT filepath FROM run_files WHERE run_id = ?",
+                                                        (row['id'],))}
+    return row['id'], row['generation'], filepaths
+
+
+def end_run(conn: sqlite3.Connection, run_id: str) -> int:
+    # The run is complete, so are the interrupted runs of the same lookup before it
+    dots, fingerprint, generation = conn.execute("SELECT dots, fingerprint, generation FROM runs WHERE id = ?",
+                                                 (run_id,)).fetchone()
+    _delete_runs(conn, "dots = ? AND fingerprint = ? AND generation <= ?", (dots, fingerprint, generation))
+    return generation
+
+
+def _delete_runs(conn: sqlite3.Connection, where: str, params: Iterable[Any]):
+    params = list(params)
+    conn.execute(f"DELETE FROM run_files WHERE run_id IN (SELECT id FROM runs WHERE {where})", params)
+    conn.execute(f"DELETE FROM runs WHERE {where}", params)
+
+
+# Stats
+def compute_stats(conn: sqlite3.Connection):
+    # From scratch, e.g. for a dataset created before the stats were kept
+    for table in _STATS_COLUMNS:
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute("DELETE FROM stats_totals")
+    conn.execute("INSERT INTO object_stats (dots, key, defined) SELECT dots, key, 1 FROM definitions")
+    conn.execute("INSERT INTO object_stats (dots, key, usages) SELECT dots, key, COUNT(*) FROM usages "
+                 "GROUP BY dots, key ON CONFLICT (dots, key) DO UPDATE SET usages = excluded.usages")
+    for table, column in _STATS_COLUMNS.items():
+        if table != "object_stats":
+            conn.execute(f"INSERT INTO {table} (dots, {column}, usages) SELECT dots, {column}, COUNT(*) FROM usages "
+                         f"GROUP BY dots, {column}")
+
+
+def _count_stats(conn: sqlite3.Connection, dots: str, table: str, counts: dict[Any, int]):
+    column = _STATS_COLUMNS[table]
+    conn.executemany(f"INSERT INTO {table} (dots, {column}, usages) VALUES (?, ?, ?) ON CONFLICT (dots, {column}) "
+                     f"DO UPDATE SET usages = usages + excluded.usages",
+                     ((dots, value, count) for value, count in counts.items()))
+
+
+def _define_stats(conn: sqlite3.Connection, dots: str, keys: Iterable[str], defined: bool):
+    conn.executemany("INSERT INTO object_stats (dots, key, defined) VALUES (?, ?, ?) "
+                     "ON CONFLICT (dots, key) DO UPDATE SET defined = excluded.defined",
+                     ((dots, key, int(defined)) for key in keys))
+
+
+def load_stats(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, top: int) -> dict[str, Any]:
+    """
+    Reads the aggregates of the usages of `dots`: only indexed ranges of the stats tables are read, never the usages.
+
+    :param top: number of objects and files listed, the most used (or the unused ones, by name) first
+    """
+    totals = conn.execute("SELECT definitions, unused, files FROM stats_totals WHERE dots = ?", (dots.value,)).fetchone()
+    generations = conn.execute("SELECT generation, usages FROM generation_stats WHERE dots = ? AND usages > 0 "
+                               "ORDER BY generation", (dots.value,)).fetchall()
+    return {
+        "definitions": totals['definitions'] if totals is not None else 0,
+        "unused": totals['unused'] if totals is not None else 0,
+        "usages": sum(row['usages'] for row in generations),
+        "files": totals['files'] if totals is not None else 0,
+        "generations": [(row['generation'], row['usages']) for row in generations],
+        "unused_keys": [row['key'] for row in conn.execute(
+            "SELECT key FROM object_stats WHERE dots = ? AND defined = 1 AND usages = 0 ORDER BY key LIMIT ?",
+            (dots.value, top))],
+        "hot": [(row['key'], row['usages']) for row in conn.execute(
+            "SELECT key, usages FROM object_stats WHERE dots = ? AND usages > 0 ORDER BY usages DESC LIMIT ?",
+            (dots.value, top))],
+        "hot_files": [(row['filepath'], row['usages']) for row in conn.execute(
+            "SELECT p.filepath, s.usages FROM file_stats AS s JOIN paths AS p ON p.id = s.path_id "
+            "WHERE s.dots = ? AND s.usages > 0 ORDER BY s.usages DESC LIMIT ?", (dots.value, top))],
+    }
+
+
+def prune_stats(conn: sqlite3.Connection) -> int:
+    # Drops the aggregates of the objects and files which have neither a definition nor a usage anymore
+    return (conn.execute("DELETE FROM object_stats WHERE defined = 0 AND usages = 0").rowcount
+            + conn.execute("DELETE FROM file_stats WHERE usages = 0").rowcount
+            + conn.execute("DELETE FROM generation_stats WHERE usages = 0").rowcount)
+
+
+# Dependencies
+def load_dependencies(conn: sqlite3.Connection, dots: DDLObjectTypeSupported) -> dict[str, list[str]]:
+    return {row['key']: json.loads(row['depends_on']) for row in
+            conn.execute("SELECT key, depends_on FROM dependencies WHERE dots = ?", (dots.value,))}
+
+
+def query_dependencies(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, name: str | None = None,
+                       limit: int | None = None, offset: int = 0) -> sqlite3.Cursor:
+    # By schema-qualified or bare name
+    where, params = "dots = ?", [dots.value]
+    if name is not None:
+        where, params = f"{where} AND (key = ? OR key LIKE ?)", [*params, name, f"%.{name}"]
+    return conn.execute(f"SELECT * FROM dependencies WHERE {where} ORDER BY key LIMIT ? OFFSET ?",
+                        (*params, -1 if limit is None else limit, offset))
+
+
+def attributed_dependencies(conn: sqlite3.Connection, dots: DDLObjectTypeSupported) -> sqlite3.Cursor:
+    # Every usage (of its latest generation) belongs to the closest definition before it in its file, of any kind, by
+    # (line, column), as long as it is inside the statement of the definition: a usage inside a procedure which
+    # follows a view, or in a query after the `;` of the view, is not a dependency of the view. A position without a
+    # column (older datasets) is compared by line
+    return conn.execute(
+        "SELECT DISTINCT d.key AS key, u.key AS depends_on FROM ("
+        "SELECT key, filepath, line, \"column\", generation, "
+        "MAX(generation) OVER (PARTITION BY path_id, key) AS latest "
+        "FROM usages JOIN paths ON paths.id = usages.path_id WHERE dots = ?) AS u "
+        "JOIN definitions AS d ON d.rowid = ("
+        "SELECT rowid FROM definitions WHERE filepath = u.filepath AND (line < u.line OR (line = u.line AND ("
+        "\"column\" IS NULL OR u.\"column\" IS NULL OR \"column\" <= u.\"column\"))) "
+        "ORDER BY line DESC, \"column\" DESC LIMIT 1) "
+        "WHERE u.generation = u.latest AND d.dots = ? AND d.key != u.key AND (d.end_line IS NULL "
+        "OR u.line < d.end_line OR (u.line = d.end_line AND (u.\"column\" IS NULL OR u.\"column\" <= d.end_column))) "
+        "ORDER BY d.key, u.key",
+        (dots.value, dots.value))
+
+
+def replace_dependencies(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, graph: dict[str, list[str]]):
+    # An empty list drops the key
+    conn.executemany("DELETE FROM dependencies WHERE dots = ? AND key = ?",
+                     ((dots.value, key) for key, depends_on in graph.items() if not depends_on))
+    conn.executemany("INSERT OR REPLACE INTO dependencies (dots, key, depends_on) VALUES (?, ?, ?)",
+                     ((dots.value, key, json.dumps(depends_on)) for key, depends_on in graph.items() if depends_on))
+
+
+def load_closure(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, direction: str,
+                 key: str) -> dict[str, int] | None:
+    closure = {row['node']: row['depth'] for row in conn.execute(
+        "SELECT node, depth FROM closures WHERE dots = ? AND direction = ? AND key = ?", (dots.value, direction, key))}
+    # The key itself is always stored (depth 0), so an empty closure is told apart from a missing one
+    return closure or None
+
+
+def save_closure(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, direction: str, key: str,
+                 closure: dict[str, int]):
+    conn.executemany("INSERT OR REPLACE INTO closures (dots, direction, key, node, depth) VALUES (?, ?, ?, ?, ?)",
+                     ((dots.value, direction, key, node, depth) for node, depth in {key: 0, **closure}.items()))
+
+
+def invalidate_closures(conn: sqlite3.Connection, dots: DDLObjectTypeSupported, nodes: Iterable[str]) -> int:
+    # Drops every closure reaching any of the nodes (or starting from them)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS invalidated (node TEXT PRIMARY KEY)")
+    try:
+        conn.executemany("INSERT OR IGNORE INTO temp.invalidated (node) VALUES (?)", ((node,) for node in nodes))
+        return conn.execute(
+            "DELETE FROM closures WHERE dots = ? AND (direction, key) IN ("
+            "SELECT direction, key FROM closures WHERE dots = ? AND node IN (SELECT node FROM temp.invalidated))",
+            (dots.value, dots.value)).rowcount
+    finally:
+        conn.execute("DELETE FROM temp.invalidated")
+
+
+# Collections
+def has_collection(conn: sqlite3.Connection, collection_name: str, table_name: str | None = None) -> bool:
+    if collection_name not in COLLECTIONS:
+        return False
+
+    if table_name is None:
+        row = conn.execute(f"SELECT 1 FROM {collection_name} LIMIT 1").fetchone()
+    else:
+        row = conn.execute(f"SELECT 1 FROM {collection_name} WHERE dots = ? LIMIT 1", (table_name,)).fetchone()
+    return row is not None
 
-    collection = ds.get(collection_name, {})
 
-    table = collection.get(ddl_object_type, {})
+def clear(conn: sqlite3.Connection, collection_name: str, table_name: str | None = None):
+    if collection_name not in COLLECTIONS:
+        raise ValueError(f"Unknown collection: {collection_name}")
 
-    for key, entry in objects.items():
-        typer.echo(f"{key}: {entry}")
-        entry = entry.__dict__
-        entry['timestamp'] = datetime.now().timestamp()
+    # The dependencies are found from the definitions and the usages, they are dropped with them
+    collection_names = [collection_name]
+    if collection_name in ("definitions", "usages", "dependencies"):
+        collection_names += ["dependencies", "closures"]
 
-        table[key] = entry
+    for name in dict.fromkeys(collection_names):
+        if table_name is None:
+            conn.execute(f"DELETE FROM {name}")
+        else:
+            conn.execute(f"DELETE FROM {name} WHERE dots = ?", (table_name,))
 
-    collection[ddl_object_type] = table
-    ds[collection_name] = collection
+    if collection_name == 'usages':
+        prune_paths(conn)
+        # Their files would be skipped by a resumed lookup
+        _delete_runs(conn, "1" if table_name is None else "dots = ?", () if table_name is None else (table_name,))
+    if collection_name in ("definitions", "usages"):
+        # The stats of the whole collection (or table) go with it
+        where, params = ("1", ()) if table_name is None else ("dots = ?", (table_name,))
+        if collection_name == 'definitions':
+            conn.execute(f"UPDATE object_stats SET defined = 0 WHERE {where}", params)
+        else:
+            conn.execute(f"UPDATE object_stats SET usages = 0 WHERE {where}", params)
+            conn.execute(f"DELETE FROM file_stats WHERE {where}", params)
+            conn.execute(f"DELETE FROM generation_stats WHERE {where}", params)
+        prune_stats(conn)
 
-    save_dataset(ds, dataset_name)
+    if table_name is None:
+        conn.execute("DELETE FROM meta WHERE key LIKE ?", (f"{collection_name}.%",))
+    elif collection_name == 'manifest':
+        conn.execute("DELETE FROM meta WHERE key LIKE ?", (f"manifest.{table_name}.%",))
@@ -1,34 +1,60 @@
+import codecs
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
 from enum import Enum
-from typer import echo
+from typing import Any, Iterable, Iterator
 
-from engine.configuration import get_config
+from engine.configuration import settings
+from engine.errors import InvalidNameError
 
 
 class DDLObjectTypeSupported(str, Enum):
     views = "views"
+    tables = "tables"
+    synonyms = "synonyms"
+    procedures = "procedures"
+    functions = "functions"
+    packages = "packages"
 
 class DatasetOutput(str, Enum):
     STDOUT = "stdout"
     FILE = "file"
 
 class DDLDefinitionRecord(object):
+    # Millions of records can be kept in memory, the filepath of every record of a file is the same string
+    __slots__ = ("name", "schema", "filepath", "line", "end", "column")
+
     @classmethod
-    def from_definition(cls, definition: str, filepath: str, line: int) -> 'DDLDefinitionRecord':
+    def from_definition(cls, definition: str, filepath: str, line: int, end: tuple[int, int] | None = None,
+                        column: int | None = None) -> 'DDLDefinitionRecord':
         parts = definition.split(".")
         if definition.startswith(".") or definition.endswith(".") or len(parts) > 2:
-            echo(f"[ERROR] ❌ This definition is wrong, unable to get DDL object type name from: {definition}")
-            exit(1)
+            raise InvalidNameError(f"This definition is wrong, unable to get DDL object type name from: {definition}")
 
         if len(parts) == 1:
-            return cls(definition, get_config("db.schema"), filepath, line)
+            return cls(definition, settings().db_schema, filepath, line, end, column)
         else:
-            return cls(parts[1], parts[0], filepath, line)
+            return cls(parts[1], parts[0], filepath, line, end, column)
 
-    def __init__(self, name: str, schema: str, filepath: str, line: int):
+    def __init__(self, name: str, schema: str, filepath: str, line: int, end: tuple[int, int] | None = None,
+                 column: int | None = None):
         self.name = name
         self.schema = schema
-        self.filepath = filepath
+        self.filepath = sys.intern(filepath)
         self.line = line
+        self.end = end  # Line and column where its statement ends, unknown for the records of older datasets
+        self.column = column  # Of its name, unknown for the records of older datasets too
+
+    @classmethod
+    def from_entry(cls, entry: dict) -> 'DDLDefinitionRecord':
+        end = (entry['end_line'], entry['end_column']) if entry.get('end_line') is not None else None
+        return cls(entry['name'], entry['schema'], entry['filepath'], entry['line'], end, entry.get('column'))
+
+    def as_entry(self) -> dict:
+        end_line, end_column = (None, None) if self.end is None else self.end
+        return {"name": self.name, "schema": self.schema, "filepath": self.filepath, "line": self.line,
+                "column": self.column, "end_line": end_line, "end_column": end_column}
 
     @property
     def fullname(self) -> str:
@@ -39,3 +65,171 @@ class DDLDefinitionRecord(object):
                 f"schema={self.schema}, "
                 f"filepath={self.filepath}, "
                 f"line={self.line})")
+
+
+def text_start(buffer: bytes) -> int:
+    # A UTF-8 BOM is kept in the buffer, but it's not a character of the first line
+    return len(codecs.BOM_UTF8) if buffer[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+
+
+class LineCounter(object):
+    """
+    Maps offsets of a buffer to their line and column, counting the newlines only once while moving forward.
+
+    Offsets are expected in increasing order (as matches are found), so the memory used does not depend on the size of
+    the buffer. Going backwards is supported, but counts again from the start.
+    """
+    WINDOW = 1 << 20  # Newlines are counted by windows, to never copy a large slice of the buffer
+
+    def __init__(self, buffer: bytes):
+        self.buffer = buffer
+        self.start = text_start(buffer)
+        self.offset = 0
+        self.line = 1
+        self.line_start = self.start
+
+    def position(self, offset: int) -> tuple[int, int]:
+        if offset < self.offset:
+            self.offset, self.line, self.line_start = 0, 1, self.start
+
+        for start in range(self.offset, offset, self.WINDOW):
+            self.line += self.buffer[start:min(start + self.WINDOW, offset)].count(b"\n")
+
+        newline = self.buffer.rfind(b"\n", self.offset, offset)
+        if newline != -1:
+            self.line_start = newline + 1
+        self.offset = offset
+
+        return self.line, offset - self.line_start + 1
+
+    def line_of(self, offset: int) -> int:
+        return self.position(offset)[0]
+
+
+class PathTable(object):
+    """
+    Interned file paths: every path is kept once, and referenced by its id (its position in the table).
+    """
+    __slots__ = ("paths", "ids")
+
+    def __init__(self):
+        self.paths: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def intern(self, path: str) -> int:
+        path_id = self.ids.get(path)
+        if path_id is None:
+            path_id = self.ids[path] = len(self.paths)
+            self.paths.append(sys.intern(path))
+        return path_id
+
+    def __getitem__(self, path_id: int) -> str:
+        return self.paths[path_id]
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+
+class UsageColumns(Sequence):
+    """
+    Usages of a single name, stored by columns. Items are read as the usage entries (`filepath`, `line`, `column`,
+    `timestamp` and `generation`), built on access.
+    """
+    __slots__ = ("table", "paths", "lines", "columns")
+
+    def __init__(self, table: 'UsageTable'):
+        self.table = table
+        self.paths = array("I")
+        self.lines = array("I")
+        self.columns = array("I")
+
+    def append(self, path_id: int, line: int, column: int):
+        self.paths.append(path_id)
+        self.lines.append(line)
+        self.columns.append(column)
+
+    def rows(self) -> Iterator[tuple[int, int, int]]:
+        return zip(self.paths, self.lines, self.columns)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __getitem__(self, index: int | slice) -> dict[str, Any] | list[dict[str, Any]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        path_id = self.paths[index]
+        return {"filepath": self.table.paths[path_id], "line": self.lines[index], "column": self.columns[index],
+                "timestamp": self.table.timestamps[path_id], "generation": self.table.generation}
+
+
+class UsageTable(Mapping):
+    """
+    Usages of a dataset table, by name, stored by columns: the path ids, lines and columns of the usages of every name
+    are `array`s, and every path is interned once in `paths`. The timestamp is kept by path (when the file was
+    scanned), and the generation by table.
+
+    It reads as the `{name: [entry, ...]}` mapping of the usages, and has the same compact form in the dataset (see
+    the `paths` table) and in the manifests (see `encode`).
+    """
+    __slots__ = ("paths", "timestamps", "generation", "names")
+
+    def __init__(self, generation: int | None = None):
+        self.paths = PathTable()
+        self.timestamps: dict[int, float] = {}
+        self.generation = generation
+        self.names: dict[str, UsageColumns] = {}
+
+    def add_file(self, filepath: str, timestamp: float) -> int:
+        path_id = self.paths.intern(filepath)
+        self.timestamps[path_id] = timestamp
+        return path_id
+
+    def add(self, name: str, path_id: int, line: int, column: int):
+        columns = self.names.get(name)
+        if columns is None:
+            columns = self.names[name] = UsageColumns(self)
+        columns.append(path_id, line, column)
+
+    def update(self, other: 'UsageTable'):
+        # The path ids of `other` are mapped to the ones of this table
+        path_ids = [self.add_file(filepath, other.timestamps[path_id]) for path_id, filepath in
+                    enumerate(other.paths.paths)]
+        for name, columns in other.names.items():
+            for path_id, line, column in columns.rows():
+                self.add(name, path_ids[path_id], line, column)
+
+    def ordered(self, names: Iterable[str]) -> 'UsageTable':
+        # Keeps only the given names, in their order
+        self.names = {name: self.names[name] for name in names if name in self.names}
+        return self
+
+    def filepaths(self) -> list[str]:
+        return list(self.paths.paths)
+
+    def __getitem__(self, name: str) -> UsageColumns:
+        return self.names[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def encode(self) -> dict[str, Any]:
+        # JSON form, by columns too
+        return {"paths": self.paths.paths, "timestamps": [self.timestamps[i] for i in range(len(self.paths))],
+                "usages": {name: [columns.paths.tolist(), columns.lines.tolist(), columns.columns.tolist()]
+                           for name, columns in self.names.items()}}
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> 'UsageTable':
+        table = cls()
+        for filepath, timestamp in zip(data["paths"], data["timestamps"]):
+            table.add_file(filepath, timestamp)
+        for name, (paths, lines, columns) in data["usages"].items():
+            usages = table.names[name] = UsageColumns(table)
+            usages.paths.extend(paths)
+            usages.lines.extend(lines)
+            usages.columns.extend(columns)
+        return table
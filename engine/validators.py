@@ -2,7 +2,7 @@ from pathlib import Path
 
 import typer
 
-DDL_OBJECT_TYPES_SUPPORTED = ["views", ]
+DDL_OBJECT_TYPES_SUPPORTED = ["views", "tables", "synonyms", "procedures", "functions", "packages", ]
 
 
 def validate_ddl_object_type(ddl_object_type: str) -> str:
@@ -0,0 +1,415 @@
+import json
+import os
+import selectors
+import socket
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+from engine import output
+from engine import storage
+from engine.configuration import STORAGE_MAIN_DIR
+from engine.discovery import IGNORE_FILES
+from engine.discovery import FileDiscovery
+from engine.finder import find_fingerprint
+from engine.finder import scan_dot_definitions_from_files
+from engine.finder import store_dot_definitions
+from engine.graph import store_dependencies
+from engine.lookup import lookup_fingerprint
+from engine.lookup import scan_dot_usages_from_files
+from engine.lookup import store_dot_usages
+from engine.manifest import FileManifest
+from engine.utils import DDLDefinitionRecord, DDLObjectTypeSupported
+
+try:
+    # Optional, without it the files are polled
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+
+def socket_path(ds_name: str) -> Path:
+    return STORAGE_MAIN_DIR / "watch" / f"{ds_name}.sock"
+
+
+class WatchIndex(object):
+    """
+    Definitions and usages of the files of a folder, kept in memory and updated as the files change.
+
+    Only the changed files are scanned again (all of them, if the definition table changed), and the changes are
+    written to the dataset by `flush`, in a single transaction. The manifests of the dataset are used and kept up to
+    date, so the first scan reuses the results of the last `find -i` / `lookup -i`, and the other way round.
+    """
+
+    def __init__(self, ds_name: str, dots: DDLObjectTypeSupported, discovery: Callable[[], FileDiscovery],
+                 jobs: int = 1):
+        self.ds_name = ds_name
+        self.dots = dots
+        self.discovery = discovery
+        self.jobs = jobs
+
+        self.stats: dict[str, tuple[int, int]] = {}  # filepath -> (size, mtime)
+        self.scanned: dict[str, float] = {}  # filepath -> timestamp of the last scan
+        self.generations: dict[str, int] = {}  # filepath -> generation of its usages stored in the dataset
+        self.definitions: dict[str, dict[str, DDLDefinitionRecord]] = {}
+        self.usages: dict[str, dict[str, list[dict]]] = {}
+        self.table: list[str] = []
+        self.folders: list[str] = []
+
+        self.definition_manifest: FileManifest | None = None
+        self.usage_manifest: FileManifest | None = None
+        self.generation = 0
+
+        # Files not written to the dataset yet
+        self.changed: set[str] = set()
+        self.removed: set[str] = set()
+        self.last_change: float | None = None
+        self.first_change: float | None = None
+
+    def load(self):
+        with storage.DatasetSession(self.ds_name) as session:
+            self.definition_manifest = FileManifest.load(session.conn, 'definitions', self.dots, find_fingerprint())
+            self.generation = storage.get_meta(session.conn, 'usages.generation', 0)
+        self.poll()
+
+    def _table(self) -> list[str]:
+        # The first definition found (in the walk order) wins
+        table = {}
+        for records in self.definitions.values():
+            for key in records.keys():
+                table.setdefault(key, None)
+        return list(table)
+
+    @staticmethod
+    def _stat(src_file: Path) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(src_file)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _forget(self, filepath: str):
+        # Everything kept of a file which is gone, its definitions and usages are deleted from the dataset on flush
+        self.stats.pop(filepath, None)
+        self.definitions.pop(filepath, None)
+        self.usages.pop(filepath, None)
+        self.scanned.pop(filepath, None)
+        self.generations.pop(filepath, None)
+        for manifest in (self.definition_manifest, self.usage_manifest):
+            if manifest is not None and manifest.files.pop(filepath, None) is not None:
+                manifest.removed.add(filepath)
+        self.changed.discard(filepath)
+        self.removed.add(filepath)
+
+    def _scanned(self, scan: Callable[[list[Path]], Iterable[tuple[Path, Any]]],
+                 src_files: list[Path]) -> Iterator[tuple[Path, Any]]:
+        # A file removed (or unreadable) after its stat is forgotten, as if it was removed, and the scan goes on with
+        # the next ones: a later poll finds it again if it's still there
+        while src_files:
+            done = 0
+            try:
+                for src_file, records in scan(src_files):
+                    done += 1
+                    yield src_file, records
+                return
+            except OSError as e:
+                failed = next((src_file for src_file in src_files[done:] if e.filename is not None
+                               and str(src_file.absolute()) == os.path.abspath(e.filename)), src_files[done])
+                output.warning(f"[WARNING] ⚠️ {failed} was left out, it could not be read: {e}")
+                self._forget(str(failed.absolute()))
+                src_files = [src_file for src_file in src_files[done:] if src_file is not failed]
+
+    def poll(self, paths: Iterable[str] | None = None) -> int:
+        """
+        Scans again the files which changed since the last poll: every file of the folder, walked again, or only the
+        given `paths` (e.g. the ones named by inotify events), each one being a file added, changed or removed.
+
+        :return: the number of files changed or removed
+        """
+        discovery = self.discovery()
+        if paths is None:
+            stats = {}
+            for src_file in discovery:
+                if (stat := self._stat(src_file)) is not None:
+                    stats[str(src_file.absolute())] = stat
+            self.folders = discovery.folders
+        else:
+            stats = dict(self.stats)
+            for path in paths:
+                src_file = Path(path)
+                filepath = str(src_file.absolute())
+                stat = self._stat(src_file)
+                if stat is not None and (filepath in self.stats or discovery.accepts(src_file)):
+                    stats[filepath] = stat
+                else:
+                    stats.pop(filepath, None)
+
+        changed = [Path(filepath) for filepath, stat in stats.items() if self.stats.get(filepath) != stat]
+        removed = [filepath for filepath in self.stats if filepath not in stats]
+        self.stats = stats
+        if not changed and not removed:
+            return 0
+
+        for filepath in removed:
+            self._forget(filepath)
+
+        now = datetime.now().timestamp()
+        for src_file, records in self._scanned(lambda src_files: scan_dot_definitions_from_files(
+                self.dots, src_files, self.jobs, self.definition_manifest), changed):
+            self.definitions[str(src_file.absolute())] = records
+        changed = [src_file for src_file in changed if str(src_file.absolute()) in self.stats]
+
+        # A new definition table can change the usages of every file
+        table = self._table()
+        if self.usage_manifest is None or table != self.table:
+            self.table = table
+            changed = [Path(filepath) for filepath in self.stats]
+            if self.usage_manifest is None:
+                with storage.dataset(self.ds_name) as conn:
+                    self.usage_manifest = FileManifest.load(conn, 'usages', self.dots, lookup_fingerprint(table))
+            else:
+                self.usage_manifest = FileManifest({}, lookup_fingerprint(table), reset=True)
+
+        for src_file, records in self._scanned(lambda src_files: scan_dot_usages_from_files(
+                self.dots, self.table, src_files, self.jobs, self.usage_manifest), changed):
+            filepath = str(src_file.absolute())
+            self.usages[filepath] = records
+            self.scanned[filepath] = now
+            self.changed.add(filepath)
+
+        self.last_change = time.monotonic()
+        if self.first_change is None:
+            self.first_change = self.last_change
+        output.info(f"[INFO] 🔄 {len(changed)} files scanned, {len(removed)} files removed")
+        return len(changed) + len(removed)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.changed or self.removed)
+
+    def flush(self):
+        if not self.dirty:
+            return
+
+        dot_table = {}
+        for records in self.definitions.values():
+            for key, record in records.items():
+                dot_table.setdefault(key, record)
+
+        with storage.DatasetSession(self.ds_name) as session:
+            # The definitions of the changed files are written again, the ones they dropped are deleted
+            session.write(storage.delete_definitions_of_files, self.dots, self.changed | self.removed)
+            session.write(storage.delete_usages_of_files, self.dots, self.removed)
+            store_dot_definitions(session, self.dots, dot_table, self.definition_manifest)
+            store_dot_usages(session, self.dots, {Path(filepath): self.usages[filepath] for filepath in self.changed},
+                             self.usage_manifest)
+            store_dependencies(session, self.dots)
+
+            session.flush()
+            self.generation = storage.get_meta(session.conn, 'usages.generation', self.generation + 1)
+        # Only the changed files were stored again, the other ones keep the generation of their usages
+        self.generations.update((filepath, self.generation) for filepath in self.changed)
+
+        for manifest in (self.definition_manifest, self.usage_manifest):
+            manifest.updated.clear()
+            manifest.removed.clear()
+            manifest.reset = False
+        self.changed.clear()
+        self.removed.clear()
+        self.first_change = self.last_change = None
+
+    @staticmethod
+    def _matches(key: str, name: str | None) -> bool:
+        # By schema-qualified or bare name
+        return name is None or key == name.lower() or key.split(".", 1)[-1] == name.lower()
+
+    def query_definitions(self, name: str | None = None) -> list[dict[str, Any]]:
+        rows = []
+        for filepath, records in self.definitions.items():
+            for key, record in records.items():
+                if self._matches(key, name):
+                    rows.append({"key": key, **record.as_entry(), "timestamp": self.scanned.get(filepath)})
+        return rows
+
+    def query_usages(self, name: str | None = None) -> list[dict[str, Any]]:
+        rows = []
+        for filepath, records in self.usages.items():
+            for key, entries in records.items():
+                if not self._matches(key, name):
+                    continue
+                schema, bare = key.split(".", 1) if "." in key else (None, key)
+                # The usages not stored yet will be of the next generation
+                generation = self.generation + 1 if filepath in self.changed else self.generations.get(filepath)
+                rows += [{"key": key, "name": bare, "schema": schema, **entry, "generation": generation}
+                         for entry in entries]
+        # Sorted by key, like the dataset
+        rows.sort(key=lambda row: row["key"])
+        return rows
+
+    def status(self) -> dict[str, Any]:
+        return {"dataset": self.ds_name, "dots": self.dots.value, "files": len(self.stats),
+                "definitions": len(self.table), "usages": sum(len(entries) for records in self.usages.values()
+                                                              for entries in records.values()),
+                "pending": len(self.changed) + len(self.removed), "generation": self.generation}
+
+
+class WatchServer(object):
+    """
+    Keeps a `WatchIndex` up to date and answers queries on a Unix socket, one JSON line per request and response.
+
+    Files are polled every `interval` seconds, or watched through inotify when `inotify_simple` is installed (only the
+    files named by the events are checked then, unless the tree itself changed). Changes are flushed to the dataset
+    once no file changed for `debounce` seconds (or after `10 * debounce` seconds of continuous changes).
+    """
+
+    def __init__(self, index: WatchIndex, path: Path, interval: float = 1.0, debounce: float = 2.0):
+        self.index = index
+        self.path = path
+        self.interval = interval
+        self.debounce = debounce
+        self.running = False
+        self.inotify = None
+        self.watched: dict[str, int] = {}
+
+    def _watch_folders(self):
+        for folder in self.index.folders:
+            if folder not in self.watched:
+                try:
+                    self.watched[folder] = self.inotify.add_watch(
+                        folder, inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.CLOSE_WRITE |
+                        inotify_flags.MODIFY | inotify_flags.MOVED_FROM | inotify_flags.MOVED_TO)
+                except OSError:
+                    pass
+
+    def _event_paths(self, events: list) -> set[str] | None:
+        # The files named by the events, or `None` when the tree itself changed (a folder, an ignore file, or events
+        # were lost), which is walked again
+        folders = {wd: folder for folder, wd in self.watched.items()}
+        paths, walk = set(), False
+        for event in events:
+            folder = folders.get(event.wd)
+            if event.mask & inotify_flags.IGNORED:
+                # The folder is gone, so is its watch
+                self.watched.pop(folder, None)
+                walk = True
+            elif (folder is None or not event.name or event.name in IGNORE_FILES
+                  or event.mask & (inotify_flags.ISDIR | inotify_flags.Q_OVERFLOW)):
+                walk = True
+            else:
+                paths.add(os.path.join(folder, event.name))
+        return None if walk else paths
+
+    def _handle(self, conn: socket.socket):
+        conn.settimeout(5)
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = conn.recv(1 << 16)
+            if not chunk:
+                break
+            data += chunk
+
+        try:
+            request = json.loads(data or b"{}")
+            match request.get("command"):
+                case "usages":
+                    response = {"ok": True, "rows": self.index.query_usages(request.get("name"))}
+                case "definitions":
+                    response = {"ok": True, "rows": self.index.query_definitions(request.get("name"))}
+                case "status":
+                    response = {"ok": True, "status": self.index.status()}
+                case "flush":
+                    self.index.flush()
+                    response = {"ok": True, "status": self.index.status()}
+                case "stop":
+                    self.running = False
+                    response = {"ok": True}
+                case command:
+                    response = {"ok": False, "error": f"Unknown command: {command}"}
+        except ValueError as e:
+            response = {"ok": False, "error": str(e)}
+
+        conn.sendall(json.dumps(response).encode() + b"\n")
+
+    def _timeout(self, now: float, next_poll: float) -> float | None:
+        # Until the next poll (without inotify) or the next flush, whichever comes first: without anything pending,
+        # inotify waits for the next event
+        timeouts = [] if self.inotify is not None else [next_poll - now]
+        if self.index.dirty:
+            timeouts += [self.index.last_change + self.debounce - now,
+                         self.index.first_change + 10 * self.debounce - now]
+        return max(0.0, min(timeouts)) if timeouts else None
+
+    def serve_forever(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+
+        selector = selectors.DefaultSelector()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(self.path))
+        server.listen()
+        selector.register(server, selectors.EVENT_READ, "accept")
+
+        if INotify is not None:
+            self.inotify = INotify()
+            selector.register(self.inotify.fileno(), selectors.EVENT_READ, "notify")
+
+        self.running = True
+        next_poll = time.monotonic() + self.interval
+        try:
+            if self.inotify is not None:
+                self._watch_folders()
+            while self.running:
+                for key, _ in selector.select(self._timeout(time.monotonic(), next_poll)):
+                    if key.data == "accept":
+                        conn, _ = server.accept()
+                        with conn:
+                            self._handle(conn)
+                    else:
+                        paths = self._event_paths(self.inotify.read(timeout=0))
+                        if paths is None:
+                            self.index.poll()
+                            self._watch_folders()
+                        elif paths:
+                            self.index.poll(paths)
+
+                now = time.monotonic()
+                if self.inotify is None and now >= next_poll:
+                    self.index.poll()
+                    next_poll = now + self.interval
+
+                if self.index.dirty and (now - self.index.last_change >= self.debounce or
+                                         now - self.index.first_change >= 10 * self.debounce):
+                    self.index.flush()
+                output.flush()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.index.flush()
+            selector.close()
+            server.close()
+            if self.inotify is not None:
+                self.inotify.close()
+            self.path.unlink(missing_ok=True)
+            output.info("[INFO] 👋 Watch stopped, every change was stored")
+            output.flush()
+
+
+def is_serving(path: Path) -> bool:
+    try:
+        request(path, {"command": "status"}, timeout=1)
+        return True
+    except OSError:
+        return False
+
+
+def request(path: Path, message: dict[str, Any], timeout: float = 10) -> dict[str, Any]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(str(path))
+        client.sendall(json.dumps(message).encode() + b"\n")
+
+        data = b""
+        while chunk := client.recv(1 << 16):
+            data += chunk
+    return json.loads(data)
@@ -1,60 +1,130 @@
-from datetime import datetime
+import sys
 from pathlib import Path
 from typing import List
 
 from typer import Argument
+from typer import BadParameter
+from typer import Context
 from typer import Option
 from typer import Typer
 from typer import echo
 
 from engine import configuration
+from engine import journal
+from engine import output
+from engine import profiling
 from engine import storage
+from engine import watch
+from engine.api import DotHandler
 from engine.configuration import ConfCommand
-from engine.finder import find_dot_definition_from_file
-from engine.finder import store_dot_definitions
-from engine.lookup import lookup_dot_usages_from_file
-from engine.lookup import store_dot_usages
+from engine.configuration import ConfPolicy
+from engine.discovery import FileDiscovery
+from engine.errors import DotHandlerError
+from engine.export import ExportFormat
+from engine.export import export_definitions
+from engine.export import export_dependencies
+from engine.export import export_impact
+from engine.export import export_stats
+from engine.export import export_usages
+from engine.graph import DependencyGraph
+from engine.graph import Direction
+from engine.graph import update_dependencies
 from engine.utils import DDLObjectTypeSupported
 
 app = Typer(add_help_option=True)
 
 
+@app.callback()
+def main(ctx: Context,
+         quiet: bool = Option(False, "-q", "--quiet", help="Only print errors"),
+         verbose: bool = Option(False, "-v", "--verbose", help="Print every file and every match found"),
+         progress: Path | None = Option(None, "--progress",
+                                        help="Write a JSON-lines progress stream to this file, '-' for stderr"),
+         profile: bool = Option(False, "--profile", help="Print the time and counters of every phase to stderr"),
+         profile_output: Path | None = Option(None, "--profile-output",
+                                              help="Save the profile summary as JSON to this file, implies --profile"),
+         cprofile_output: Path | None = Option(None, "--cprofile",
+                                               help="Save a cProfile dump to this file, implies --profile")):
+    if quiet and verbose:
+        raise BadParameter("--quiet and --verbose can't be used together")
+
+    verbosity = output.Verbosity.QUIET if quiet else output.Verbosity.VERBOSE if verbose else output.Verbosity.NORMAL
+    output.setup(verbosity, progress)
+
+    if profile or profile_output is not None or cprofile_output is not None:
+        profiling.enable(cprofile_output)
+
+        def report():
+            # The summary is printed after everything the command wrote
+            output.flush()
+            profiling.report(sys.stderr, ctx.invoked_subcommand, profile_output)
+        ctx.call_on_close(report)
+
+
 @app.command()
 def find(dots: DDLObjectTypeSupported = Argument(..., case_sensitive=False, help="DDL Object type supported"),
          src_input_path: Path = Argument(..., exists=True, dir_okay=True, readable=True,
-                                         help="Input source path for files"),
+                                         help="Input source path for files, or a zip / tar archive"),
          src_file_patterns: List[str] = Option(["*.sql"], "-p", "--pattern", help="File pattern to search the objects",
                                                show_default=True),
-         ds_name: str = Option("main", "-d", "--dataset", help="Dataset name to save the results", show_default=True)):
-    # Flat the filepaths by the patterns
-    src_filepaths = []
-    for pattern in src_file_patterns:
-        src_filepaths += src_input_path.rglob(pattern)
-
-    dot_table = find_dot_definition_from_file(dots, src_filepaths)
-    if len(dot_table) > 0:
-        store_dot_definitions(ds_name, dots, dot_table)
+         ds_name: str = Option("main", "-d", "--dataset", help="Dataset name to save the results", show_default=True),
+         jobs: int = Option(1, "-j", "--jobs", min=0, help="Number of processes scanning files, 0 uses every CPU core",
+                            show_default=True),
+         incremental: bool = Option(False, "-i", "--incremental",
+                                    help="Only scan the files changed since the last incremental run"),
+         excludes: List[str] = Option([], "-x", "--exclude", help="Glob of the files or folders to skip"),
+         no_ignore: bool = Option(False, "--no-ignore", help="Don't read the .gitignore and .dothandlerignore files"),
+         journaled: bool = Option(False, "--journal",
+                                  help="Append the results to the dataset journal, for concurrent writers")):
+    # The output is set up by the callback
+    handler = DotHandler(ds_name, jobs, journaled, verbosity=None)
+    handler.find(dots, src_input_path, src_file_patterns, excludes, use_ignore_files=not no_ignore,
+                 incremental=incremental)
 
 
 @app.command()
 def lookup(dots: DDLObjectTypeSupported = Argument(..., case_sensitive=False, help="DDL Object type supported"),
-           src_input_path: Path = Argument(..., exists=True, readable=True, help="Input source path for files"),
+           src_input_path: Path = Argument(..., exists=True, readable=True,
+                                           help="Input source path for files, or a zip / tar archive"),
            src_file_patterns: List[str] = Option(["*.sql"], "-p", "--pattern",
                                                  help="File pattern to search the objects", show_default=True),
            ds_name: str = Option("main", "-d", "--dataset", help="Dataset name to save the results",
                                  show_default=True),
-           do_name: str = Option("*", "-n", "--name", help="DDL Object name to lookup")):
-    if src_input_path.is_file():
-        echo(f"[INFO] ⚠️ A file was given as src_path: {src_input_path.absolute()}")
-        src_file_patterns = [src_input_path.name]
-        src_input_path = src_input_path.parent
+           do_name: str = Option("*", "-n", "--name", help="DDL Object name to lookup"),
+           jobs: int = Option(1, "-j", "--jobs", min=0,
+                              help="Number of processes scanning files, 0 uses every CPU core", show_default=True),
+           incremental: bool = Option(False, "-i", "--incremental",
+                                      help="Only scan the files changed since the last incremental run"),
+           excludes: List[str] = Option([], "-x", "--exclude", help="Glob of the files or folders to skip"),
+           no_ignore: bool = Option(False, "--no-ignore",
+                                    help="Don't read the .gitignore and .dothandlerignore files"),
+           journaled: bool = Option(False, "--journal",
+                                    help="Append the results to the dataset journal, for concurrent writers"),
+           resume: bool = Option(False, "--resume",
+                                 help="Skip the files already stored by the last interrupted run of this lookup")):
+    # The output is set up by the callback, the usages are stored by batches and dropped once stored
+    handler = DotHandler(ds_name, jobs, journaled, verbosity=None)
+    for _ in handler.lookup_batches(dots, src_input_path, src_file_patterns, do_name, excludes,
+                                    use_ignore_files=not no_ignore, incremental=incremental, resume=resume):
+        pass
 
-    to_store_calls = {}
-    for pattern in src_file_patterns:
-        for src_file in src_input_path.rglob(pattern):
-            to_store_calls[src_file] = lookup_dot_usages_from_file(dots, do_name, ds_name, src_file)
 
-    store_dot_usages(ds_name, dots, to_store_calls)
+@app.command()
+def scan(dots: DDLObjectTypeSupported = Argument(..., case_sensitive=False, help="DDL Object type supported"),
+         src_input_path: Path = Argument(..., exists=True, dir_okay=True, readable=True,
+                                         help="Input source path for files, or a zip / tar archive"),
+         src_file_patterns: List[str] = Option(["*.sql"], "-p", "--pattern", help="File pattern to search the objects",
+                                               show_default=True),
+         ds_name: str = Option("main", "-d", "--dataset", help="Dataset name to save the results", show_default=True),
+         jobs: int = Option(1, "-j", "--jobs", min=0, help="Number of processes scanning files, 0 uses every CPU core",
+                            show_default=True),
+         excludes: List[str] = Option([], "-x", "--exclude", help="Glob of the files or folders to skip"),
+         no_ignore: bool = Option(False, "--no-ignore", help="Don't read the .gitignore and .dothandlerignore files"),
+         journaled: bool = Option(False, "--journal",
+                                  help="Append the results to the dataset journal, for concurrent writers")):
+    # Same as `find` then `lookup`, reading every file once
+    handler = DotHandler(ds_name, jobs, journaled, verbosity=None)
+    handler.scan(dots, src_input_path, src_file_patterns, excludes, use_ignore_files=not no_ignore)
 
 
 @app.command()
@@ -63,18 +133,18 @@ def config(command: ConfCommand = Argument(..., case_sensitive=False), conf_key:
     match command:
         case ConfCommand.SET:
             if not conf_key:
-                echo("[ERROR] ❌ Missing configuration key!")
+                output.error("[ERROR] ❌ Missing configuration key!")
                 exit(1)
 
             if not value:
-                echo("[ERROR] ❌ Missing value for configuration!")
+                output.error("[ERROR] ❌ Missing value for configuration!")
                 exit(1)
 
             configuration.set_config(conf_key, value)
 
         case ConfCommand.GET:
             if not conf_key:
-                echo("[ERROR] ❌ Missing configuration key!")
+                output.error("[ERROR] ❌ Missing configuration key!")
                 exit(1)
             value = configuration.get_config(conf_key)
             echo(f"⚙️ {conf_key}: {value if value is not None else 'NULL'}")
@@ -85,7 +155,7 @@ def config(command: ConfCommand = Argument(..., case_sensitive=False), conf_key:
 
         case ConfCommand.CLEAR:
             if not conf_key:
-                echo("[ERROR] ❌ Missing configuration key!")
+                output.error("[ERROR] ❌ Missing configuration key!")
                 exit(1)
             configuration.set_config(conf_key, None)
 
@@ -94,131 +164,320 @@ def config(command: ConfCommand = Argument(..., case_sensitive=False), conf_key:
 conf_sub_app = Typer()
 
 
-# app ds show 'definitions.views' -o foo/bar/biz.log -d foo
+# app ds show 'definitions.views' -o foo/bar/biz.log -d foo -f jsonl -n v_emp --limit 100
 @conf_sub_app.command(name="show")
 def ds_show(query: str = Argument(...), ds_name: str = Option("main", "-d", "--dataset"),
-            output: str = Option("<STDOUT>", "-o", "--output")):
+            output_path: str = Option("<STDOUT>", "-o", "--output"),
+            fmt: ExportFormat = Option(ExportFormat.TEXT, "-f", "--format", case_sensitive=False),
+            encoding: str | None = Option(None, "-e", "--encoding",
+                                          help="Output file encoding, defaults to utf-16 for text and utf-8 otherwise"),
+            name: str | None = Option(None, "-n", "--name", help="Only the objects with this name"),
+            schema: str | None = Option(None, "-s", "--schema", help="Only the objects of this schema"),
+            filepath: str | None = Option(None, "--filepath", help="Only the entries of these files (glob pattern)"),
+            limit: int | None = Option(None, "--limit", min=0, help="Maximum number of entries"),
+            offset: int = Option(0, "--offset", min=0, help="Number of entries to skip")):
     if not storage.exists(ds_name):
-        echo(f"[ERROR] ❌ Dataset {ds_name} does not exist!")
+        output.error(f"[ERROR] ❌ Dataset {ds_name} does not exist!")
         exit(1)
 
     q_parts = query.lower().split(".")
     if len(q_parts) != 2:
-        echo(f"[ERROR] ❌ Given query invalid, should be '<collection>.<table>': {query}")
+        output.error(f"[ERROR] ❌ Given query invalid, should be '<collection>.<table>': {query}")
         exit(1)
     else:
         q_collection, q_table = q_parts[0], q_parts[1]
 
+    if q_collection == "manifest":
+        # Only kept for the incremental runs, it holds no report
+        output.error("[ERROR] ❌ The manifest collection can't be shown, only: definitions, usages, dependencies")
+        exit(1)
+
     fp_out = None
-    if output != "<STDOUT>":
-        fp_out = Path(output)
+    if output_path != "<STDOUT>":
+        fp_out = Path(output_path)
         fp_out.parent.mkdir(parents=True, exist_ok=True)
 
         if fp_out.exists() and not fp_out.is_file():
-            echo(f"[ERROR] ❌ Given output path is not a file: {fp_out.absolute()}")
+            output.error(f"[ERROR] ❌ Given output path is not a file: {fp_out.absolute()}")
             exit(1)
 
-        if not fp_out.exists():
-            fp_out.touch()
-        else:
-            fp_out.unlink()
-            fp_out.touch()
+    # A single snapshot: the counts and the records are consistent, whatever is written meanwhile
+    with storage.snapshot(ds_name) as conn:
+        if not storage.has_collection(conn, q_collection):
+            output.error(f"[ERROR] ❌ No collection found by name: {q_collection}")
+            exit(1)
 
-    def pecho(message: str):
-        echo(message)
+        if not storage.has_collection(conn, q_collection, q_table):
+            output.error(f"[ERROR]  ❌ No table found by name: {q_table}")
+            exit(1)
+
+        # Everything is written through a single buffered handle, while the records are streamed from the dataset
+        output.flush()
         if fp_out:
-            with fp_out.open("a+", encoding='utf-16') as fp:
-                echo(message, file=fp)
+            fp = fp_out.open("w", encoding=encoding or ("utf-16" if fmt == ExportFormat.TEXT else "utf-8"),
+                             newline="", buffering=1 << 16)
+        else:
+            fp = sys.stdout
+
+        try:
+            if fmt == ExportFormat.TEXT:
+                # Print header
+                fp.write(f"💾 Dataset:    {ds_name}\n"
+                         f"💾 Collection: {q_collection}\n"
+                         f"💾 Table:      {q_table}\n"
+                         f"{'=' * 80}\n")
+
+            dots = DDLObjectTypeSupported(q_table)
+            match q_collection:
+                case 'definitions':
+                    export_definitions(fp, fmt, storage.query_definitions(conn, dots, name, schema, filepath,
+                                                                          limit, offset))
+                case 'usages':
+                    if fmt == ExportFormat.TEXT:
+                        fp.write(f"📄 Generation: {storage.get_meta(conn, 'usages.generation', 0)}\n"
+                                 f"{'-' * 80}\n")
+                    counts = storage.count_usages(conn, dots, name, schema, filepath) \
+                        if fmt == ExportFormat.TEXT else {}
+                    export_usages(fp, fmt, storage.query_usages(conn, dots, name, schema, filepath, limit, offset),
+                                  counts)
+                case 'dependencies':
+                    export_dependencies(fp, fmt, storage.query_dependencies(conn, dots, name, limit, offset))
+        finally:
+            if fp_out:
+                fp.close()
+            else:
+                fp.flush()
 
-    ds = storage.load_dataset(ds_name)
 
-    collection: dict | None = ds.get(q_collection, None)
-    if not collection:
-        echo(f"f[ERROR] ❌ No collection found by name: {q_collection}")
+@conf_sub_app.command(name="clear")
+def ds_clear(ds_name: str  = Option("main", "-d", "--dataset"),
+             target: str = Option("all", "-t", "--target")):
+    if not storage.exists(ds_name):
+        output.error(f"[ERROR] ❌ Dataset {ds_name} does not exist!")
         exit(1)
 
-    table: dict | None = collection.get(q_table, None)
-    if not table:
-        echo(f"[ERROR]  ❌ No table found by name: {q_table}")
+    if target == "all":
+        storage.rm(ds_name)
+        output.info(f"[INFO] 🗑️ Dataset {ds_name} was deleted!")
+        exit(0)
+
+    t_parts = target.lower().split(".")
+
+    t_collection = t_parts[0]
+
+    with storage.dataset(ds_name) as conn:
+        if not storage.has_collection(conn, t_collection):
+            output.warning(f"[WARNING] ⚠️ Collection {t_collection} does not exists in dataset {ds_name}!")
+            exit(0)
+
+        if len(t_parts) == 1:
+            storage.clear(conn, t_collection)
+            output.info(f"[INFO] 🗑️ Collection {t_collection} was deleted from dataset {ds_name}!")
+        else:
+            if len(t_parts) != 2:
+                output.error(f"[ERROR] ❌ Target is not valid for deletion, expected '<collection>[.<table>]', got: {target}")
+                exit(1)
+
+            t_table = t_parts[1]
+            if not storage.has_collection(conn, t_collection, t_table):
+                output.warning(f"[WARNING]  Table {t_table} does not exist in collection {t_collection} in dataset {ds_name}")
+                exit(0)
+
+            storage.clear(conn, t_collection, t_table)
+            output.info(f"[INFO] 🗑️ Table {t_table} was deleted from collection {t_collection} in dataset {ds_name}")
+
+
+@conf_sub_app.command(name="compact")
+def ds_compact(ds_name: str = Option("main", "-d", "--dataset"),
+               missing: bool = Option(False, "--missing", help="Also drop the entries of the files which don't exist")):
+    if not storage.exists(ds_name):
+        output.error(f"[ERROR] ❌ Dataset {ds_name} does not exist!")
         exit(1)
 
-    # Print header
-    pecho(f"💾 Dataset:    {ds_name}")
-    pecho(f"💾 Collection: {q_collection}")
-    pecho(f"💾 Table:      {q_table}")
-    pecho(f"{'=' * 80}")
-
-    match q_collection:
-        case 'definitions':
-            for key, definition in table.items():
-                pecho(f"🗝️ {key}")
-                pecho(f"📄 Name:      {definition['name']}")
-                pecho(f"📄 Schema:    {definition['schema']}")
-                pecho(f"📄 Filepath:  {definition['filepath']}")
-                pecho(f"📄 Line:      {definition['line']}")
-                pecho(f"📄 Timestamp: {datetime.fromtimestamp(definition['timestamp'])}")
-                pecho(f"{'-' * 80}")
-        case 'usages':
-            pecho(f"📄 Generation: {collection.get('generation', 0)}")
-            pecho(f"{'-' * 80}")
-            for key, usages in table.items():
-                if key == 'generation': continue
-                pecho(f"🗝️ {key}: {len(usages)}")
-                for i, usage in enumerate(usages):
-                    pecho(f"✅ Usage {i + 1}")
-                    pecho(f"    📄 Filepath:  {usage['filepath']}")
-                    pecho(f"    📄 Line:      {usage['line']}")
-                    pecho(f"    📄 Timestamp: {datetime.fromtimestamp(usage['timestamp'])}")
-
-                    if i < len(usages) - 1:
-                        pecho(f"{'.' * 80}")
-
-                pecho(f"{'-' * 80}")
+    size = storage.size(ds_name)
+    settings = configuration.settings()
+    with storage.dataset(ds_name) as conn:
+        # The usages kept are the ones the retention policy would have kept
+        if settings.policy_retention == ConfPolicy.Retention.GENERATIONS.value:
+            generation = storage.get_meta(conn, 'usages.generation', 0)
+            pruned = storage.prune_usages(conn, None, generation - settings.retention_generations + 1)
+        else:
+            pruned = storage.prune_usages_to_latest(conn)
+        output.info(f"[INFO] 🗑️ {pruned} usages of old generations were deleted")
 
+        if missing:
+            output.info(f"[INFO] 🗑️ {storage.prune_missing_files(conn)} entries of missing files were deleted")
+            for dots in DDLObjectTypeSupported:
+                update_dependencies(conn, dots)
+        storage.prune_paths(conn)
+        storage.prune_stats(conn)
 
+    storage.vacuum(ds_name)
+    output.info(f"[INFO] 💾 Dataset {ds_name} was compacted: {size} -> {storage.size(ds_name)} bytes")
 
 
-@conf_sub_app.command(name="clear")
-def ds_clear(ds_name: str  = Option("main", "-d", "--dataset"),
-             target: str = Option("all", "-t", "--target")):
+@conf_sub_app.command(name="checkpoint")
+def ds_checkpoint(ds_name: str = Option("main", "-d", "--dataset")):
     if not storage.exists(ds_name):
-        echo(f"[ERROR] ❌ Dataset {ds_name} does not exist!")
+        output.error(f"[ERROR] ❌ Dataset {ds_name} does not exist!")
         exit(1)
 
-    if target == "all":
-        storage.rm(ds_name)
-        echo(f"[INFO] 🗑️ Dataset {ds_name} was deleted!")
-        exit(0)
+    # Waits for a merge already running in another process
+    merged = journal.checkpoint(ds_name)
+    output.info(f"[INFO] 💾 {merged} journal entries were merged into dataset {ds_name}")
+
+
+# app ds impact hr.v_emp -d foo --direction both --depth 2
+@conf_sub_app.command(name="impact")
+def ds_impact(name: str = Argument(..., help="Object name, schema-qualified or not"),
+              ds_name: str = Option("main", "-d", "--dataset"),
+              dots: DDLObjectTypeSupported = Option(DDLObjectTypeSupported.views, "-t", "--type",
+                                                    case_sensitive=False, help="DDL Object type supported"),
+              direction: Direction = Option(Direction.DOWNSTREAM, "--direction", case_sensitive=False,
+                                            help="downstream: what depends on the object, upstream: what it depends "
+                                                 "on"),
+              depth: int | None = Option(None, "--depth", min=1, help="Maximum distance from the object"),
+              fmt: ExportFormat = Option(ExportFormat.TEXT, "-f", "--format", case_sensitive=False)):
+    if not storage.exists(ds_name):
+        output.error(f"[ERROR] ❌ Dataset {ds_name} does not exist!")
+        exit(1)
 
-    ds = storage.load_dataset(ds_name)
+    directions = [Direction.UPSTREAM, Direction.DOWNSTREAM] if direction == Direction.BOTH else [direction]
+    with storage.dataset(ds_name) as conn:
+        graph = DependencyGraph(conn, dots)
+        keys = graph.resolve(name)
+        if len(keys) == 0:
+            output.error(f"[ERROR] ❌ No {dots.value} found by name: {name}")
+            exit(1)
 
-    t_parts = target.lower().split(".")
+        closures = []
+        with profiling.phase("closure"):
+            for key in keys:
+                for way in directions:
+                    closure = graph.closure(key, way)
+                    if depth is not None:
+                        closure = {node: distance for node, distance in closure.items() if distance <= depth}
+                    closures.append((key, way.value, closure))
+
+    output.flush()
+    export_impact(sys.stdout, fmt, closures)
+    sys.stdout.flush()
+
+
+# app ds stats -d foo -t views --top 20
+@conf_sub_app.command(name="stats")
+def ds_stats(ds_name: str = Option("main", "-d", "--dataset"),
+             dots: DDLObjectTypeSupported = Option(DDLObjectTypeSupported.views, "-t", "--type",
+                                                   case_sensitive=False, help="DDL Object type supported"),
+             top: int = Option(10, "--top", min=0, help="Number of objects and files listed in every section"),
+             fmt: ExportFormat = Option(ExportFormat.TEXT, "-f", "--format", case_sensitive=False)):
+    if not storage.exists(ds_name):
+        output.error(f"[ERROR] ❌ Dataset {ds_name} does not exist!")
+        exit(1)
 
-    t_collection = t_parts[0]
+    # Only the aggregates kept on write are read, whatever the size of the dataset
+    with storage.snapshot(ds_name) as conn:
+        stats = storage.load_stats(conn, dots, top)
+
+    output.flush()
+    if fmt == ExportFormat.TEXT:
+        sys.stdout.write(f"💾 Dataset: {ds_name}\n"
+                         f"💾 Table:   {dots.value}\n"
+                         f"{'=' * 80}\n")
+    export_stats(sys.stdout, fmt, stats)
+    sys.stdout.flush()
+
+
+# Watch
+watch_sub_app = Typer()
+
+
+@watch_sub_app.command(name="start")
+def watch_start(dots: DDLObjectTypeSupported = Argument(..., case_sensitive=False, help="DDL Object type supported"),
+                src_input_path: Path = Argument(..., exists=True, file_okay=False, readable=True,
+                                                help="Input source path for files"),
+                src_file_patterns: List[str] = Option(["*.sql"], "-p", "--pattern",
+                                                      help="File pattern to search the objects", show_default=True),
+                ds_name: str = Option("main", "-d", "--dataset", help="Dataset name to save the results",
+                                      show_default=True),
+                jobs: int = Option(1, "-j", "--jobs", min=0, help="Number of processes of the first scan",
+                                   show_default=True),
+                excludes: List[str] = Option([], "-x", "--exclude", help="Glob of the files or folders to skip"),
+                no_ignore: bool = Option(False, "--no-ignore",
+                                         help="Don't read the .gitignore and .dothandlerignore files"),
+                interval: float = Option(1.0, "--interval", min=0.1, help="Seconds between two polls of the files",
+                                         show_default=True),
+                debounce: float = Option(2.0, "--debounce", min=0.0,
+                                         help="Seconds without changes before they are stored", show_default=True)):
+    if not hasattr(watch.socket, "AF_UNIX"):
+        output.error("[ERROR] ❌ Watch mode needs Unix sockets, which are not supported by this system")
+        exit(1)
 
-    collection: dict | None = ds.get(t_collection, None)
-    if not collection:
-        echo(f"[WARNING] ⚠️ Collection {t_collection} does not exists in dataset {ds_name}!")
-        exit(0)
+    socket_path = watch.socket_path(ds_name)
+    if watch.is_serving(socket_path):
+        output.error(f"[ERROR] ❌ Dataset {ds_name} is already watched, stop it first: `app watch stop -d {ds_name}`")
+        exit(1)
+
+    index = watch.WatchIndex(ds_name, dots, lambda: FileDiscovery(src_input_path, src_file_patterns, excludes,
+                                                                  use_ignore_files=not no_ignore), jobs)
+    index.load()
+    index.flush()
+
+    mode = "inotify" if watch.INotify is not None else f"polling every {interval}s"
+    output.info(f"[INFO] 👀 Watching {dots.value} of {src_input_path.absolute()} ({mode}), "
+                f"queries on: {socket_path}")
+    output.flush()
+    watch.WatchServer(index, socket_path, interval, debounce).serve_forever()
 
-    if len(t_parts) == 1:
-        del ds[t_collection]
-        echo(f"[INFO] 🗑️ Collection {t_collection} was deleted from dataset {ds_name}!")
+
+def _watch_request(ds_name: str, message: dict) -> dict:
+    try:
+        response = watch.request(watch.socket_path(ds_name), message)
+    except OSError:
+        output.error(f"[ERROR] ❌ Dataset {ds_name} is not watched, start it with: `app watch start <dots> <path>`")
+        exit(1)
+
+    if not response.get("ok"):
+        output.error(f"[ERROR] ❌ {response.get('error')}")
+        exit(1)
+    return response
+
+
+@watch_sub_app.command(name="query")
+def watch_query(name: str | None = Argument(None, help="Only the objects with this name"),
+                ds_name: str = Option("main", "-d", "--dataset"),
+                definitions: bool = Option(False, "--definitions", help="Query the definitions instead of the usages"),
+                fmt: ExportFormat = Option(ExportFormat.TEXT, "-f", "--format", case_sensitive=False)):
+    rows = _watch_request(ds_name, {"command": "definitions" if definitions else "usages", "name": name})["rows"]
+
+    output.flush()
+    if definitions:
+        export_definitions(sys.stdout, fmt, rows)
     else:
-        if len(t_parts) != 2:
-            echo(f"[ERROR] ❌ Target is not valid for deletion, expected '<collection>[.<table>]', got: {target}")
-            exit(1)
+        counts = {}
+        for row in rows:
+            counts[row['key']] = counts.get(row['key'], 0) + 1
+        export_usages(sys.stdout, fmt, rows, counts)
+    sys.stdout.flush()
 
-        t_table = t_parts[1]
-        if t_table not in collection:
-            echo(f"[WARNING]  Table {t_table} does not exist in collection {t_collection} in dataset {ds_name}")
-            exit(0)
 
-        del collection[t_table]
-        ds[t_collection] = collection
-        echo(f"[INFO] 🗑️ Table {t_table} was deleted from collection {t_collection} in dataset {ds_name}")
+@watch_sub_app.command(name="status")
+def watch_status(ds_name: str = Option("main", "-d", "--dataset")):
+    for key, value in _watch_request(ds_name, {"command": "status"})["status"].items():
+        echo(f"📄 {key}: {value}")
+
+
+@watch_sub_app.command(name="flush")
+def watch_flush(ds_name: str = Option("main", "-d", "--dataset")):
+    _watch_request(ds_name, {"command": "flush"})
+    output.info(f"[INFO] 💾 Every change of the watch of {ds_name} was stored")
+
+
+@watch_sub_app.command(name="stop")
+def watch_stop(ds_name: str = Option("main", "-d", "--dataset")):
+    _watch_request(ds_name, {"command": "stop"})
+    output.info(f"[INFO] 👋 Watch of {ds_name} was stopped")
 
-    storage.save_dataset(ds, ds_name)
 
 if __name__ == '__main__':
     # How to use
@@ -250,6 +509,9 @@ if __name__ == '__main__':
     #       - Lookup 'views' in path '../migrations/baseline' and store the results in dataset 'baseline'
     #         app lookup views ../migrations/baseline -d baseline
     # --------------------------------------------------------------
+    # Find the definitions and look up their usages, reading every file once:
+    #   app scan <dots> <source files input folder path> -d <dataset: main> -p <source input file pattern>
+    # --------------------------------------------------------------
     # Show dataset information, where query must be a <collection>.<table> string:
     #   app ds show <query> -d <dataset> -o <output>
     #   Examples:
@@ -269,5 +531,25 @@ if __name__ == '__main__':
     #         app ds clear -d baseline -t definitions
     #       - Clear table 'views' from collection 'usages' from dataset 'r2d2'
     #         app ds clear -d r2d2 -t 'usages.views'
+    # --------------------------------------------------------------
+    # Compact a dataset, dropping the usages out of the retention policy
+    #   app ds compact -d <dataset> [--missing]
+    # --------------------------------------------------------------
+    # Merge the results appended to the journal of a dataset by `find --journal` and `lookup --journal`
+    #   app ds checkpoint -d <dataset>
+    # --------------------------------------------------------------
+    # Show what depends on an object (downstream), or what it depends on (upstream)
+    #   app ds impact <name> -d <dataset> -t <dots: views> --direction [downstream | upstream | both]
+    # --------------------------------------------------------------
+    # Watch a folder, keeping the dataset up to date and answering queries from memory
+    #   app watch start <dots> <path> -d <dataset>
+    #   app watch query [name] -d <dataset> [--definitions]
+    #   app watch stop -d <dataset>
     app.add_typer(conf_sub_app, name="ds")
-    app()
+    app.add_typer(watch_sub_app, name="watch")
+    try:
+        app()
+    except DotHandlerError as e:
+        output.error(f"[ERROR] ❌ {e}")
+        output.flush()
+        exit(1)
@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from engine import configuration  # noqa: E402
+from engine import storage  # noqa: E402
+from engine.api import DotHandler  # noqa: E402
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch) -> DotHandler:
+    # Datasets and configuration of the test only, never the ones of the user
+    home = tmp_path / "home"
+    monkeypatch.setattr(configuration, "STORAGE_MAIN_DIR", home)
+    monkeypatch.setattr(storage, "STORAGE_MAIN_DIR", home)
+    monkeypatch.setattr(configuration, "_settings", None)
+    return DotHandler("test")
+
+
+@pytest.fixture
+def src(tmp_path) -> Path:
+    folder = tmp_path / "src"
+    folder.mkdir()
+    return folder
@@ -0,0 +1,17 @@
+from engine.configuration import set_config
+
+
+def test_lookup_streams_the_batches(handler, src):
+    (src / "views.sql").write_text("create view v_a as select 1 from dual;\n")
+    (src / "a.sql").write_text("select * from v_a;\n")
+    (src / "b.sql").write_text("select * from v_a join v_a;\n")
+    list(handler.find("views", src))
+    set_config("lookup.batch.usages", "1")
+
+    usages = handler.lookup("views", src, patterns=["[ab].sql"])
+    first = next(usages)
+    # Only the batch of the first file is stored yet
+    assert [row["filepath"] for row in handler.query("usages", "views")] == [first["filepath"]]
+
+    assert len([first, *usages]) == 3
+    assert len(list(handler.query("usages", "views"))) == 3
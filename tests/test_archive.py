@@ -0,0 +1,54 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from engine import archive
+
+FILES = {"db/views.sql": "create view v_a as select 1 from dual;\n",
+         "db/report.sql": "select * from v_a;\n",
+         "db/notes.txt": "select * from v_a;\n",
+         "skip/other.sql": "select * from v_a;\n"}
+
+
+def make_zip(path):
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, text in FILES.items():
+            zf.writestr(name, text)
+    return path
+
+
+def make_tar(path):
+    with tarfile.open(path, "w:gz") as tf:
+        for name, text in FILES.items():
+            data = text.encode()
+            info = tarfile.TarInfo(f"./{name}")
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return path
+
+
+@pytest.mark.parametrize("make, name", [(make_zip, "db.zip"), (make_tar, "db.tar.gz")])
+def test_members_are_named_after_their_archive(handler, tmp_path, make, name):
+    path = make(tmp_path / name)
+
+    assert [record.filepath for record in handler.find("views", path, excludes=["skip/"])] == [
+        f"{path}!db/views.sql"]
+    assert [(usage["key"], usage["filepath"]) for usage in handler.lookup("views", path, excludes=["skip/"])] == [
+        ("user.v_a", f"{path}!db/report.sql")]
+    assert archive.split_member(f"{path}!db/report.sql") == (str(path), "db/report.sql")
+
+
+def test_split_member_finds_the_archive():
+    assert archive.split_member("/src/a!b.zip!db/a!.sql") == ("/src/a!b.zip", "db/a!.sql")
+    assert archive.split_member("/src/a!b/c.sql") is None
+
+
+def test_tar_members_are_released_once_scanned(tmp_path):
+    discovery = archive.discovery(make_tar(tmp_path / "db.tgz"), ["*.sql"])
+    members = list(discovery)
+    assert all(member.data is not None for member in members)
+
+    assert [str(src_file) for src_file, _ in archive.release((member, None) for member in members)] == discovery.found
+    assert all(member.data is None for member in members)
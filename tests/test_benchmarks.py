@@ -0,0 +1,17 @@
+from benchmarks import runner
+from benchmarks.corpus import CorpusSpec
+from engine import configuration
+from engine import storage
+
+
+def test_run_never_touches_the_datasets_of_the_user(handler, tmp_path):
+    home = storage.STORAGE_MAIN_DIR
+    dataset = storage.ds_filepath(runner.DATASET)
+    dataset.parent.mkdir(parents=True)
+    dataset.write_bytes(b"kept")
+
+    result = runner.run_scale("tiny", CorpusSpec(files=2, views_per_file=2, refs_per_view=2), tmp_path, repeat=1)
+
+    assert result["corpus"]["definitions"] == 4
+    assert dataset.read_bytes() == b"kept"
+    assert storage.STORAGE_MAIN_DIR == configuration.STORAGE_MAIN_DIR == home
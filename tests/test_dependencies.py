@@ -0,0 +1,65 @@
+from engine.utils import DDLObjectTypeSupported
+
+
+def dependencies(handler) -> dict[str, list[str]]:
+    return {row["key"]: row["depends_on"] for row in handler.query("dependencies", DDLObjectTypeSupported.views)}
+
+
+def test_statement_after_view_is_not_a_dependency(handler, src):
+    (src / "views.sql").write_text(
+        "create view hr.v_dept as select * from departments;\n"
+        "select * from v_emp join v_top;\n"
+        "create view hr.v_emp as select * from hr.v_dept;\n"
+        "create view v_top as select 1 from dual;\n")
+
+    list(handler.find("views", src))
+    list(handler.lookup("views", src))
+
+    assert dependencies(handler) == {"hr.v_emp": ["hr.v_dept"]}
+
+
+def test_statement_after_view_on_the_same_line(handler, src):
+    (src / "views.sql").write_text(
+        "create view v_a as select 1 from dual; select * from v_b;\n"
+        "create view v_b as select * from v_a\n"
+        "/\n"
+        "select * from v_a;\n")
+
+    list(handler.find("views", src))
+    list(handler.lookup("views", src))
+
+    assert dependencies(handler) == {"user.v_b": ["user.v_a"]}
+
+
+def test_definitions_on_the_same_line(handler, src):
+    (src / "views.sql").write_text(
+        "create view v_a as select 1 from dual;\n"
+        "create view v_b as select * from v_a; create view v_c as select * from v_d; create view v_d as select 1 from dual;\n"
+        "select * from v_b; create view v_e as select * from v_c;\n")
+
+    list(handler.find("views", src))
+    list(handler.lookup("views", src))
+
+    assert dependencies(handler) == {"user.v_b": ["user.v_a"], "user.v_c": ["user.v_d"], "user.v_e": ["user.v_c"]}
+
+
+def test_plsql_block_ends_with_slash(handler, src):
+    (src / "procedures.sql").write_text(
+        "create procedure q is begin null; end;\n"
+        "/\n"
+        "create procedure r is begin null; end;\n"
+        "/\n"
+        "create procedure p is\n"
+        "begin\n"
+        "  q;\n"
+        "  q;\n"
+        "end;\n"
+        "/\n"
+        "begin r; end;\n"
+        "/\n")
+
+    list(handler.find("procedures", src))
+    list(handler.lookup("procedures", src))
+
+    assert {row["key"]: row["depends_on"] for row in handler.query("dependencies", "procedures")} == {
+        "user.p": ["user.q"]}
@@ -0,0 +1,39 @@
+from engine.discovery import FileDiscovery
+
+
+def relative(discovery: FileDiscovery) -> list[str]:
+    return [src_file.relative_to(discovery.root).as_posix() for src_file in discovery]
+
+
+def test_ignore_file_negation_does_not_override_excludes(src):
+    for folder in ("keep", "other", ".git"):
+        (src / folder).mkdir()
+        (src / folder / "f.sql").write_text("select 1 from dual;")
+    (src / ".gitignore").write_text("*\n!*/\n!*.sql\n!keep\n!.git\n")
+
+    assert relative(FileDiscovery(src, ["*.sql"], ["keep/"])) == ["other/f.sql"]
+
+
+def test_ignore_file_negation(src):
+    (src / "logs").mkdir()
+    (src / "logs" / "a.sql").write_text("select 1 from dual;")
+    (src / "logs" / "b.sql").write_text("select 1 from dual;")
+    (src / ".gitignore").write_text("logs/*.sql\n!logs/b.sql\n")
+
+    assert relative(FileDiscovery(src, ["*.sql"])) == ["logs/b.sql"]
+    assert relative(FileDiscovery(src, ["*.sql"], use_ignore_files=False)) == ["logs/a.sql", "logs/b.sql"]
+
+
+def test_accepts_what_the_walk_yields(src):
+    for folder in ("keep", "logs", ".git"):
+        (src / folder).mkdir()
+        for name in ("a.sql", "b.sql", "c.txt"):
+            (src / folder / name).write_text("select 1 from dual;")
+    (src / ".gitignore").write_text("logs/*.sql\n!logs/b.sql\n")
+    (src / "keep" / ".dothandlerignore").write_text("a.sql\n")
+
+    for discovery in (FileDiscovery(src, ["*.sql"]), FileDiscovery(src, ["*.sql"], ["keep/"]),
+                      FileDiscovery(src, ["*.sql"], use_ignore_files=False)):
+        candidates = sorted(path for path in src.rglob("*") if path.is_file())
+        assert [path for path in candidates if discovery.accepts(path)] == sorted(discovery)
+    assert not FileDiscovery(src / "keep", ["*.sql"]).accepts(src / "logs" / "b.sql")
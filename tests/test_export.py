@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+
+from typer.testing import CliRunner
+
+from engine.export import DEFINITION_FIELDS
+from engine.export import ExportFormat
+from engine.export import USAGE_FIELDS
+from main import conf_sub_app
+
+
+def _prepare(handler, src):
+    (src / "views.sql").write_text("create view hr.v_a as select 1 from dual;\n")
+    (src / "report.sql").write_text("select * from hr.v_a;\nselect * from hr.v_a;\n")
+    handler.find("views", src)
+    list(handler.lookup("views", src))
+
+
+def _show(query: str, *options: str):
+    return CliRunner().invoke(conf_sub_app, ["show", query, "-d", "test", *options])
+
+
+def test_show_definitions_formats(handler, src):
+    _prepare(handler, src)
+
+    result = _show("definitions.views", "-f", "jsonl")
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.stdout.splitlines() if line.startswith("{")]
+    assert [sorted(record) for record in records] == [sorted(DEFINITION_FIELDS)]
+    assert (records[0]["key"], records[0]["schema"], records[0]["line"]) == ("hr.v_a", "hr", 1)
+
+    result = _show("definitions.views", "-f", "csv")
+    rows = list(csv.reader(io.StringIO(result.stdout[result.stdout.index(DEFINITION_FIELDS[0]):])))
+    assert rows[0] == DEFINITION_FIELDS
+    assert [row[0] for row in rows[1:]] == ["hr.v_a"]
+
+
+def test_show_usages_formats(handler, src):
+    _prepare(handler, src)
+
+    result = _show("usages.views", "-f", ExportFormat.JSONL.value)
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.stdout.splitlines() if line.startswith("{")]
+    assert all(sorted(record) == sorted(USAGE_FIELDS) for record in records)
+    assert [(record["key"], record["line"]) for record in records] == [("hr.v_a", 1), ("hr.v_a", 2)]
+
+    result = _show("usages.views")
+    assert result.exit_code == 0
+    assert "🗝️ hr.v_a: 2" in result.stdout
+    assert result.stdout.count("✅ Usage") == 2
+
+
+def test_show_rejects_the_manifest(handler, src):
+    _prepare(handler, src)
+
+    result = _show("manifest.views")
+    assert result.exit_code == 1
+    assert "can't be shown" in result.output
@@ -0,0 +1,18 @@
+from engine.configuration import set_config
+
+
+def test_incremental_find_follows_the_default_schema(handler, src):
+    (src / "views.sql").write_text("create view v_a as select 1 from dual;\ncreate view hr.v_b as select 1 from dual;\n")
+
+    assert sorted(record.fullname for record in handler.find("views", src, incremental=True)) == [
+        "hr.v_b", "user.v_a"]
+
+    set_config("db.schema", "sales")
+    assert sorted(record.fullname for record in handler.find("views", src, incremental=True)) == [
+        "hr.v_b", "sales.v_a"]
+
+
+def test_find_skips_names_with_too_many_parts(handler, src):
+    (src / "views.sql").write_text("create view db.hr.v_x as select 1 from dual;\ncreate view hr.v_b as select 1 from dual;\n")
+
+    assert [record.fullname for record in handler.find("views", src)] == ["hr.v_b"]
@@ -0,0 +1,45 @@
+import json
+import pickle
+
+import pytest
+
+from engine import journal
+from engine.api import DotHandler
+from engine.configuration import set_config
+
+
+def _usages(handler):
+    return sorted((row["key"], row["filepath"], row["line"]) for row in handler.query("usages", "views"))
+
+
+def test_journaled_writes_match_the_direct_ones(handler, src):
+    (src / "views.sql").write_text("create view v_a as select 1 from dual;\ncreate view hr.v_b as select 1 from dual;\n")
+    (src / "a.sql").write_text("select * from v_a join hr.v_b;\n")
+    (src / "b.sql").write_text("select * from v_a;\n")
+    set_config("lookup.batch.usages", "1")
+
+    list(handler.find("views", src, incremental=True))
+    list(handler.lookup("views", src, incremental=True))
+
+    journaled = DotHandler("journaled", journal=True)
+    list(journaled.find("views", src, incremental=True))
+    list(journaled.lookup("views", src, incremental=True))
+
+    assert len(_usages(handler)) == 3
+    assert _usages(journaled) == _usages(handler)
+    assert not journal.entries("journaled")
+
+
+def test_entries_are_plain_data(handler, src):
+    (src / "views.sql").write_text("create view v_a as select 1 from dual;\n")
+    list(handler.find("views", src))
+    path = journal.append(handler.dataset, [(journal.OPERATIONS["upsert_definitions"][0],
+                                             ("views", {"user.v_b": {"name": "v_b"}}))])
+    assert json.loads(path.read_text())["pending"] == [["upsert_definitions", ["views", {"user.v_b": {"name": "v_b"}}]]]
+
+    with pytest.raises(ValueError):
+        journal.append(handler.dataset, [(print, ())])
+
+    path.write_bytes(pickle.dumps({"version": 1, "pending": []}))
+    with pytest.raises(ValueError, match="Unsupported journal entry version"):
+        journal.decode(path)
@@ -0,0 +1,109 @@
+import pytest
+
+from engine import lexer
+from engine.errors import InvalidNameError
+from engine.lexer import Definition, Reference
+from engine.lookup import DDLObjectTypeMatcher
+from engine.utils import DDLObjectTypeSupported
+
+SKIPPED = b"""-- create view v_comment as select 1 from dual;
+/* create view v_block as
+   select 1 from dual; */
+select 'create view v_literal as', q'[create view v_q; ]', "create view v_quoted" from dual;
+select created_at, recreate view v_recreate from dual;
+"""
+
+PLSQL = b"""create or replace force view hr.V_Emp as select id from employees where note = ';' -- ;
+;
+select * from v_emp;
+create procedure p_a is
+begin
+  update v_emp set x = 1;
+end;
+/
+create package body p_a is end;
+"""
+
+
+def _names(data: bytes) -> list[bytes]:
+    return [definition.name for definition in lexer.definitions(data)]
+
+
+def test_definitions_skip_comments_literals_and_words():
+    assert _names(SKIPPED) == []
+    assert _names(SKIPPED + b"create view v_a as select 1 from dual;") == [b"v_a"]
+
+
+@pytest.mark.parametrize("data", [b"create view v_a as select 'it''s' from dual",
+                                  b"create view v_a as select q'{it's}' from dual",
+                                  b"create view v_a as select 1 from dual -- ; unterminated"])
+def test_definitions_without_terminator_end_with_the_data(data):
+    assert list(lexer.definitions(data)) == [Definition(DDLObjectTypeSupported.views, b"v_a", 12, len(data) - 1)]
+
+
+def test_definitions_keep_every_part_of_a_name():
+    data = b"create view db.hr.v_x as select 1 from dual;"
+    assert [definition.name for definition in lexer.definitions(data)] == [b"db.hr.v_x"]
+    assert b"v_x" not in lexer.index(data)[1]
+
+
+def test_definitions_end_with_their_statement():
+    view, procedure = lexer.definitions(PLSQL)
+    assert view == Definition(DDLObjectTypeSupported.views, b"hr.v_emp", PLSQL.index(b"hr.V_Emp"),
+                              PLSQL.index(b"\n;") + 1)
+    # `;` ends the statements inside a PL/SQL block, the block ends with the `/`
+    assert procedure == Definition(DDLObjectTypeSupported.procedures, b"p_a", PLSQL.index(b"p_a"),
+                                   PLSQL.index(b"/\ncreate"))
+
+
+def test_definition_without_terminator_ends_before_the_next_one():
+    data = b"create view v_a as select 1 from dual\ncreate view v_b as select 1 from v_a;"
+    assert [(definition.name, definition.end) for definition in lexer.definitions(data)] == [
+        (b"v_a", data.index(b"\ncreate")), (b"v_b", len(data) - 1)]
+
+
+def test_index_and_scan_agree_with_definitions():
+    for data in (SKIPPED, PLSQL, SKIPPED + PLSQL):
+        found, references = lexer.index(data)
+        assert found == list(lexer.definitions(data))
+
+        scanned = list(lexer.scan(data))
+        assert [token for token in scanned if isinstance(token, Definition)] == found
+        assert sorted((token.name, token.offset) for token in scanned if isinstance(token, Reference)) == sorted(
+            (name, offset) for name, offsets in references.items() for offset in offsets)
+
+
+def test_index_skips_keywords_and_definition_names():
+    _, references = lexer.index(SKIPPED + PLSQL)
+    assert set(references) == {b"dual", b"created_at", b"recreate", b"v_recreate", b"id", b"employees", b"note",
+                                b"v_emp", b"x"}
+    assert list(references[b"v_emp"]) == [len(SKIPPED) + PLSQL.index(b"v_emp;"),
+                                          len(SKIPPED) + PLSQL.index(b"v_emp set")]
+
+
+def test_index_reduces_columns_to_their_object():
+    _, references = lexer.index(b"select hr.v_emp.id, v_emp.id, :v_bind, 1.5e3 from hr.v_emp")
+    assert {name: len(offsets) for name, offsets in references.items()} == {b"hr.v_emp": 2, b"v_emp.id": 1}
+
+
+def test_matcher_finds_qualified_and_bare_names():
+    matcher = DDLObjectTypeMatcher(["hr.v_emp", "v_dept"])
+    data = b"select * from hr.v_emp, v_emp, HR.V_EMP.id, v_emp.id, v_dept d where d.id = 1"
+    assert list(matcher.finditer(data)) == [("hr.v_emp", data.index(b"hr.v_emp")),
+                                            ("hr.v_emp", data.index(b" v_emp,") + 1),
+                                            ("hr.v_emp", data.index(b"HR.V_EMP")),
+                                            ("hr.v_emp", data.index(b" v_emp.id") + 1),
+                                            ("v_dept", data.index(b"v_dept"))]
+
+
+def test_matcher_skips_prefixes_comments_literals_and_keywords():
+    matcher = DDLObjectTypeMatcher(["v_emp", "user.view"])
+    data = b"select v_employees, 'v_emp', \"v_emp\" from x_v_emp -- v_emp\ncreate view v_emp as select 1 from dual;"
+    assert list(matcher.finditer(data)) == []
+    assert matcher.find(b"view") is None
+    assert matcher.find(b"v_emp.id") == ["v_emp"]
+
+
+def test_matcher_rejects_invalid_names():
+    with pytest.raises(InvalidNameError):
+        DDLObjectTypeMatcher(["a.b.c"])
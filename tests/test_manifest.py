@@ -0,0 +1,30 @@
+import os
+
+from engine import finder
+from engine import lookup
+
+
+def test_incremental_runs_only_scan_the_changed_files(handler, src, monkeypatch):
+    (src / "views.sql").write_text("create view v_a as select 1 from dual;\ncreate view v_b as select 1 from dual;\n")
+    (src / "a.sql").write_text("select * from v_a;\n")
+    (src / "b.sql").write_text("select * from v_a;\n")
+    list(handler.find("views", src, incremental=True))
+    list(handler.lookup("views", src, incremental=True))
+
+    scanned = []
+    for module, name in ((finder, "scan_dot_definitions_from_file"), (lookup, "lookup_dot_usages_from_file")):
+        monkeypatch.setattr(module, name, lambda *args, phase=module.__name__, scan=getattr(module, name):
+                            scanned.append((phase, args[-1].name)) or scan(*args))
+    (src / "b.sql").write_text("select * from v_b join v_b;\n")
+    os.utime(src / "b.sql", ns=(0, 0))
+    (src / "views.sql").touch()
+    os.remove(src / "a.sql")
+
+    list(handler.find("views", src, incremental=True))
+    list(handler.lookup("views", src, incremental=True))
+
+    # views.sql is only hashed (its content did not change), a.sql is forgotten
+    assert scanned == [("engine.finder", "b.sql"), ("engine.lookup", "b.sql")]
+    assert sorted(record["key"] for record in handler.query("definitions", "views")) == ["user.v_a", "user.v_b"]
+    assert sorted((usage["key"], os.path.basename(usage["filepath"])) for usage in handler.query("usages", "views")) == [
+        ("user.v_b", "b.sql"), ("user.v_b", "b.sql")]
@@ -0,0 +1,37 @@
+import os
+
+from engine.api import DotHandler
+from engine.parallel import map_files
+
+
+def square(offset: int, value: int) -> tuple[int, int]:
+    # Run by the workers, which are told apart by their pid
+    return offset + value * value, os.getpid()
+
+
+def test_results_keep_the_order_of_the_calls():
+    calls = [None if value % 7 == 0 else (value,) for value in range(200)]
+    serial = list(map_files(square, calls, jobs=1, shared=(1,)))
+    parallel = list(map_files(square, iter(calls), jobs=3, shared=(1,)))
+
+    assert [None if result is None else result[0] for result in parallel] == [
+        None if result is None else result[0] for result in serial] == [
+        None if value % 7 == 0 else 1 + value * value for value in range(200)]
+    assert {result[1] for result in parallel if result is not None} != {os.getpid()}
+
+
+def test_parallel_runs_store_the_same_results(handler, src):
+    for i in range(40):
+        (src / f"f{i:02}.sql").write_text(f"create view v_{i} as select * from v_{(i + 1) % 40} join v_{i // 2};\n"
+                                          f"select * from v_{(i * 7) % 40};\n")
+
+    def run(dataset: str, jobs: int) -> tuple:
+        runner = DotHandler(dataset, jobs=jobs)
+        definitions = [(record.fullname, record.filepath, record.line) for record in runner.find("views", src)]
+        usages = [(usage["key"], usage["filepath"], usage["line"], usage["column"])
+                  for usage in runner.lookup("views", src)]
+        return definitions, usages, list(runner.query("dependencies", "views"))
+
+    serial = run(handler.dataset, 1)
+    assert len(serial[1]) == 120
+    assert run("parallel", 3) == serial
@@ -0,0 +1,59 @@
+import io
+import json
+
+import pytest
+
+from engine import profiling
+
+
+@pytest.fixture(autouse=True)
+def profiler(monkeypatch):
+    # Never leaks a profiler to the other tests
+    monkeypatch.setattr(profiling, "_profiler", None)
+
+
+def test_nothing_is_recorded_when_disabled():
+    profiling.count("files")
+    with profiling.phase("scan"):
+        pass
+    assert profiling.take() is None
+
+    fp = io.StringIO()
+    profiling.report(fp, "find")
+    assert fp.getvalue() == ""
+
+
+def test_phases_and_counters_are_reported(tmp_path):
+    profiling.enable()
+    with profiling.phase("scan"):
+        with profiling.phase("lex"):
+            pass
+    with profiling.phase("lex"):
+        pass
+    assert list(profiling.timed(iter([1, 2, 3]), "walk")) == [1, 2, 3]
+    profiling.count("files", 3)
+    profiling.count("files")
+
+    fp = io.StringIO()
+    profiling.report(fp, "find", tmp_path / "profile.json")
+    summary = json.loads((tmp_path / "profile.json").read_text())
+    assert summary["command"] == "find"
+    assert {name: phase["calls"] for name, phase in summary["phases"].items()} == {"scan": 1, "lex": 2, "walk": 1}
+    assert summary["counters"] == {"files": 4}
+    assert "Profile of 'find'" in fp.getvalue()
+    assert all(name in fp.getvalue() for name in ("scan", "lex", "walk", "files"))
+
+
+def test_worker_data_is_merged():
+    profiling.enable()
+    with profiling.phase("scan"):
+        pass
+    profiling.count("files")
+    worker = profiling.take()
+    assert profiling.take() == {"phases": {}, "counters": {}}
+
+    profiling.merge(worker)
+    profiling.merge(worker)
+    summary = profiling._profiler.summary("lookup")
+    assert summary["phases"]["scan"]["calls"] == 2
+    assert summary["counters"] == {"files": 2}
@@ -0,0 +1,30 @@
+from engine.configuration import set_config
+
+
+def usages(handler) -> list[tuple]:
+    return sorted((row["key"], row["filepath"], row["generation"]) for row in handler.query("usages", "views"))
+
+
+def test_interrupted_lookup_is_resumed(handler, src):
+    (src / "views.sql").write_text("create view v_a as select 1 from dual;\n")
+    for name in ("a", "b", "c", "d"):
+        (src / f"{name}.sql").write_text(f"select * from v_a; -- {name}\n")
+    list(handler.find("views", src))
+    set_config("lookup.batch.usages", "1")
+
+    # Stopped once the first batch is stored
+    batches = handler.lookup_batches("views", src)
+    first = list(next(batches))
+    batches.close()
+    assert [usage["filepath"] for usage in first] == [str(src / "a.sql")]
+    generation = first[0]["generation"]
+    assert usages(handler) == [("user.v_a", str(src / "a.sql"), generation)]
+
+    # The files already stored are skipped, the other ones get the generation of the interrupted run
+    resumed = list(handler.lookup("views", src, resume=True))
+    assert [usage["filepath"] for usage in resumed] == [str(src / f"{name}.sql") for name in ("b", "c", "d")]
+    assert usages(handler) == [("user.v_a", str(src / f"{name}.sql"), generation) for name in ("a", "b", "c", "d")]
+
+    # The run is complete, nothing is left to resume
+    list(handler.lookup("views", src, resume=True))
+    assert {row[2] for row in usages(handler)} == {generation + 1}
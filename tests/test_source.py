@@ -0,0 +1,41 @@
+import codecs
+
+from engine import source
+from engine.lexer import definitions
+from engine.source import open_source
+from engine.utils import LineCounter
+
+SOURCE = "create view v_a as select * from t; -- été\ncreate view v_b as select * from v_a;\n"
+
+
+def names_and_positions(src_file) -> list[tuple[bytes, tuple[int, int]]]:
+    with open_source(src_file) as data:
+        lines = LineCounter(data)
+        return [(definition.name, lines.position(definition.offset)) for definition in definitions(data)]
+
+
+def test_utf8_bom_is_not_a_column(tmp_path):
+    plain, bom = tmp_path / "plain.sql", tmp_path / "bom.sql"
+    plain.write_bytes(SOURCE.encode("utf-8"))
+    bom.write_bytes(codecs.BOM_UTF8 + SOURCE.encode("utf-8"))
+
+    assert names_and_positions(bom) == names_and_positions(plain) == [
+        (b"v_a", (1, 13)), (b"v_b", (2, 13))]
+
+
+def test_utf16_and_utf32_are_transcoded(tmp_path):
+    plain = tmp_path / "plain.sql"
+    plain.write_bytes(SOURCE.encode("utf-8"))
+    for encoding in ("utf-16", "utf-16-le", "utf-32"):
+        src_file = tmp_path / f"{encoding}.sql"
+        src_file.write_bytes(SOURCE.encode(encoding))
+        assert names_and_positions(src_file) == names_and_positions(plain)
+
+
+def test_only_the_start_is_validated(monkeypatch):
+    monkeypatch.setattr(source, "VALIDATION_SIZE", 8)
+    assert source.detect_encoding(b"select 1 from dual; -- \xe9") == "utf-8"
+    assert source.detect_encoding(b"sel\xe9ct 1 from dual;") == "iso8859-1"
+    # A character cut by the end of the start is still UTF-8, not at the end of the file
+    assert source.detect_encoding("select é from dual;".encode("utf-8")) == "utf-8"
+    assert source.detect_encoding(b"select \xc3") == "iso8859-1"
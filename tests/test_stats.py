@@ -0,0 +1,12 @@
+def test_stats_totals_follow_definitions_and_usages(handler, src):
+    (src / "views.sql").write_text("create view v_a as select 1 from dual;\ncreate view v_b as select 1 from dual;\n")
+    (src / "report.sql").write_text("select * from v_a;\n")
+    list(handler.find("views", src))
+
+    stats = handler.stats("views")
+    assert (stats["definitions"], stats["unused"], stats["files"]) == (2, 2, 0)
+
+    list(handler.lookup("views", src))
+    stats = handler.stats("views")
+    assert (stats["definitions"], stats["unused"], stats["files"]) == (2, 1, 1)
+    assert stats["unused_keys"] == ["user.v_b"]
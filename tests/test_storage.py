@@ -0,0 +1,53 @@
+from engine import storage
+
+
+def test_dataset_is_in_wal_mode(handler):
+    conn = storage.connect("test")
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        conn.close()
+
+
+def test_session_writes_are_committed_on_flush_only(handler):
+    with storage.DatasetSession("test") as session:
+        session.write(storage.set_meta, "first", 1)
+        session.write(storage.set_meta, "second", 2)
+        with storage.snapshot("test") as conn:
+            assert storage.get_meta(conn, "first") is None
+        session.flush()
+
+    with storage.snapshot("test") as conn:
+        assert (storage.get_meta(conn, "first"), storage.get_meta(conn, "second")) == (1, 2)
+
+
+def test_failed_flush_writes_nothing(handler):
+    def fail(conn):
+        raise RuntimeError("interrupted")
+
+    session = storage.DatasetSession("test")
+    session.write(storage.set_meta, "first", 1)
+    session.write(fail)
+    try:
+        session.flush()
+    except RuntimeError:
+        pass
+    finally:
+        session.close()
+
+    with storage.snapshot("test") as conn:
+        assert storage.get_meta(conn, "first") is None
+
+
+def test_snapshot_ignores_concurrent_commits(handler):
+    with storage.dataset("test") as conn:
+        storage.set_meta(conn, "value", "before")
+
+    with storage.snapshot("test") as conn:
+        assert storage.get_meta(conn, "value") == "before"
+        with storage.dataset("test") as writer:
+            storage.set_meta(writer, "value", "after")
+        assert storage.get_meta(conn, "value") == "before"
+
+    with storage.snapshot("test") as conn:
+        assert storage.get_meta(conn, "value") == "after"
@@ -0,0 +1,90 @@
+import os
+from collections import namedtuple
+from types import SimpleNamespace
+
+from engine import watch
+from engine.discovery import FileDiscovery
+from engine.utils import DDLObjectTypeSupported
+
+Event = namedtuple("Event", ["wd", "mask", "name"])
+
+
+def test_usages_keep_the_generation_of_their_file(handler, src, tmp_path):
+    (src / "a.sql").write_text("create view v_a as select 1 from dual;\n")
+    (src / "b.sql").write_text("select * from v_a;\n")
+    (src / "c.sql").write_text("select * from v_a;\n")
+    index = watch.WatchIndex(handler.dataset, DDLObjectTypeSupported.views, lambda: FileDiscovery(src, ["*.sql"]))
+    index.load()
+    index.flush()
+    first = index.generation
+
+    (src / "c.sql").write_text("select * from v_a join v_a;\n")
+    os.utime(src / "c.sql", ns=(0, 0))
+    index.poll()
+    assert {(row["filepath"].rsplit("/", 1)[-1], row["generation"]) for row in index.query_usages()} == {
+        ("b.sql", first), ("c.sql", first + 1)}
+
+    index.flush()
+    assert index.generation == first + 1
+    assert {(row["filepath"].rsplit("/", 1)[-1], row["generation"]) for row in index.query_usages()} == {
+        ("b.sql", first), ("c.sql", first + 1)}
+
+
+def test_inotify_waits_without_pending_changes(handler, src, tmp_path):
+    index = watch.WatchIndex(handler.dataset, DDLObjectTypeSupported.views, lambda: FileDiscovery(src, ["*.sql"]))
+    server = watch.WatchServer(index, tmp_path / "watch.sock", interval=1.0, debounce=0.0)
+    assert server._timeout(10.0, 11.0) == 1.0
+
+    server.inotify = object()
+    assert server._timeout(10.0, 11.0) is None
+
+    index.changed.add("a.sql")
+    index.first_change = index.last_change = 9.0
+    assert server._timeout(10.0, 11.0) == 0.0
+
+
+def test_file_removed_before_its_scan_is_forgotten(handler, src, monkeypatch):
+    for name in ("a.sql", "b.sql", "c.sql"):
+        (src / name).write_text(f"create view v_{name[0]} as select 1 from dual;\n")
+    scan = watch.scan_dot_definitions_from_files
+
+    def scan_after_removal(dots, src_files, jobs, manifest):
+        (src / "b.sql").unlink(missing_ok=True)
+        return scan(dots, src_files, jobs, manifest)
+
+    monkeypatch.setattr(watch, "scan_dot_definitions_from_files", scan_after_removal)
+    index = watch.WatchIndex(handler.dataset, DDLObjectTypeSupported.views, lambda: FileDiscovery(src, ["*.sql"]))
+    index.load()
+
+    assert sorted(row["key"] for row in index.query_definitions()) == ["user.v_a", "user.v_c"]
+    assert sorted(filepath.rsplit("/", 1)[-1] for filepath in index.stats) == ["a.sql", "c.sql"]
+    index.flush()
+
+
+def test_events_only_scan_the_files_they_name(handler, src, tmp_path, monkeypatch):
+    flags = SimpleNamespace(IGNORED=0x8000, ISDIR=0x40000000, Q_OVERFLOW=0x4000, CREATE=0x100, CLOSE_WRITE=0x8)
+    monkeypatch.setattr(watch, "inotify_flags", flags, raising=False)
+    (src / "a.sql").write_text("create view v_a as select 1 from dual;\n")
+    (src / "ignored").mkdir()
+    (src / ".gitignore").write_text("ignored/\n")
+    index = watch.WatchIndex(handler.dataset, DDLObjectTypeSupported.views, lambda: FileDiscovery(src, ["*.sql"]))
+    index.load()
+    server = watch.WatchServer(index, tmp_path / "watch.sock")
+    server.watched = {str(src): 1, str(src / "ignored"): 2}
+
+    # Not iterable: the tree is never walked again
+    monkeypatch.setattr(index, "discovery", lambda: SimpleNamespace(accepts=FileDiscovery(src, ["*.sql"]).accepts))
+    (src / "b.sql").write_text("select * from v_a;\n")
+    (src / "ignored" / "c.sql").write_text("select * from v_a;\n")
+    paths = server._event_paths([Event(1, flags.CREATE, "b.sql"), Event(2, flags.CLOSE_WRITE, "c.sql")])
+    assert index.poll(paths) == 1
+    assert [row["filepath"].rsplit("/", 1)[-1] for row in index.query_usages()] == ["b.sql"]
+
+    (src / "b.sql").unlink()
+    assert index.poll([str(src / "b.sql")]) == 1
+    assert index.query_usages() == []
+
+    assert server._event_paths([Event(1, flags.CREATE | flags.ISDIR, "new")]) is None
+    assert server._event_paths([Event(1, flags.CLOSE_WRITE, ".gitignore")]) is None
+    assert server._event_paths([Event(2, flags.IGNORED, "")]) is None
+    assert str(src / "ignored") not in server.watched